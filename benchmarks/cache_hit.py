@@ -0,0 +1,67 @@
+"""
+Benchmark of serving a cache hit for /events/search: cached python value re-validated against response_model and
+re-encoded by FastAPI on every hit (old path) vs pre-encoded body returned as raw Response (cached_response).
+Redis round trip is the same for both paths and is not included. Run with `poetry run python benchmarks/cache_hit.py`.
+"""
+
+import asyncio
+import json
+from time import perf_counter
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from ticketer.response_schemas import EventWithPlansData, EventData
+from ticketer.routers.events import _search_adapter
+from ticketer.utils.responses import encode_response, cached_response
+
+ITERATIONS = 5_000
+
+
+def make_events(count: int) -> list[dict]:
+    return [{
+        "id": idx,
+        "name": f"Event {idx}",
+        "description": "Some long enough event description " * 8,
+        "category": "music",
+        "city": "Kyiv",
+        "start_time": 1_700_000_000 + idx,
+        "end_time": None,
+        "image_id": None,
+        "location": {"name": "Palace", "longitude": 30.5, "latitude": 50.45},
+        "plans": [
+            {"id": idx * 3 + plan, "name": f"Plan {plan}", "price": 100.5, "max_tickets": 100} for plan in range(3)
+        ],
+    } for idx in range(count)]
+
+
+async def bench(name: str, func) -> None:
+    start = perf_counter()
+    for _ in range(ITERATIONS):
+        await func()
+    elapsed = perf_counter() - start
+    print(f"{name:<40} {elapsed / ITERATIONS * 1_000_000:>10,.1f} us/hit")
+
+
+async def main() -> None:
+    field = create_response_field("Response_search_events", list[EventWithPlansData] | list[EventData])
+    for count in (10, 50):
+        events = make_events(count)
+        legacy_entry = json.dumps({"value": events, "tags": {}})
+        entry = json.dumps({"value": encode_response(_search_adapter, events), "tags": {}})
+
+        async def legacy_hit():
+            value = json.loads(legacy_entry)["value"]
+            content = await serialize_response(field=field, response_content=value)
+            return JSONResponse(content)
+
+        async def encoded_hit():
+            return cached_response(json.loads(entry)["value"])
+
+        await bench(f"re-validated value ({count} events)", legacy_hit)
+        await bench(f"pre-encoded body ({count} events)", encoded_hit)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""
+Benchmark of event facet counts: GROUP BY queries over the event table vs counters maintained by EventFacets
+(redis at REDIS_URL, its data is overwritten). Run with `poetry run python benchmarks/event_facets.py [events count]`
+(1,000,000 events by default).
+"""
+
+import asyncio
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta, UTC
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from tortoise import Tortoise
+
+from ticketer.utils.facets import EventFacets
+
+CATEGORIES = ["music", "sport", "theatre", "art", "education", "food"]
+CITIES = ["Kyiv", "Lviv", "Odesa", "Kharkiv", "Dnipro", "Warsaw", "Berlin", "Paris", "London", "Prague"]
+ITERATIONS = 1000
+
+
+def fill_db(path: str, count: int) -> None:
+    db = sqlite3.connect(path)
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1, tzinfo=UTC)
+    batch = []
+    for i in range(1, count + 1):
+        start_time = start + timedelta(minutes=rng.randint(0, 3 * 365 * 24 * 60))
+        batch.append((i, f"Event {i}", "-", rng.choice(CATEGORIES), rng.choice(CITIES), start_time.isoformat(" ")))
+        if len(batch) == 10000:
+            db.executemany("INSERT INTO event VALUES (?, ?, ?, ?, ?, ?, NULL, NULL, 1, 1)", batch)
+            batch = []
+    if batch:
+        db.executemany("INSERT INTO event VALUES (?, ?, ?, ?, ?, ?, NULL, NULL, 1, 1)", batch)
+    db.commit()
+    db.close()
+
+
+async def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with TemporaryDirectory() as tmp:
+        await Tortoise.init(db_url=f"sqlite://{tmp}/events.db", modules={"models": ["ticketer.models"]})
+        await Tortoise.generate_schemas()
+        fill_db(f"{tmp}/events.db", count)
+        connection = Tortoise.get_connection("default")
+
+        start = perf_counter()
+        for sql in (
+            "SELECT category, COUNT(*) FROM event GROUP BY category",
+            "SELECT city, COUNT(*) FROM event GROUP BY city",
+            "SELECT substr(start_time, 1, 7), COUNT(*) FROM event GROUP BY substr(start_time, 1, 7)",
+        ):
+            await connection.execute_query(sql)
+        print(f"{'GROUP BY (3 queries)':<24} {(perf_counter() - start) * 1000:>10.3f} ms/request")
+
+        start = perf_counter()
+        await EventFacets.rebuild()
+        print(f"Counters rebuilt from {count:,} events in {perf_counter() - start:.1f}s")
+
+        for city in (None, "Kyiv"):
+            start = perf_counter()
+            for _ in range(ITERATIONS):
+                await EventFacets.get(city)
+            name = f"EventFacets.get({city!r})"
+            print(f"{name:<24} {(perf_counter() - start) / ITERATIONS * 1000:>10.3f} ms/request")
+
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Benchmark of event name search on SQLite: "LIKE '%x%'" scan (old name__contains filter) vs FTS5 index used by
+EventSearch. Run with `poetry run python benchmarks/event_search.py [events count]` (1,000,000 events by default).
+"""
+
+import random
+import sqlite3
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from ticketer.utils.search import SqliteSearchBackend, EventSearch
+
+WORDS = [
+    "rock", "jazz", "concert", "festival", "opera", "theatre", "comedy", "stand", "up", "night", "summer", "winter",
+    "symphony", "orchestra", "exhibition", "art", "food", "wine", "beer", "tech", "conference", "marathon", "football",
+    "basketball", "ballet", "film", "premiere", "workshop", "lecture", "party", "electronic", "classical", "folk",
+]
+CATEGORIES = ["music", "sport", "theatre", "art", "education", "food"]
+CITIES = ["Kyiv", "Lviv", "Odesa", "Kharkiv", "Dnipro", "Warsaw", "Berlin", "Paris", "London", "Prague"]
+SYLLABLES = ["ka", "lo", "mi", "ra", "ten", "vor", "shi", "bel", "dan", "gro", "pul", "zet", "nor", "fi", "ust"]
+
+
+def make_vocabulary(rng: random.Random, size: int) -> list[str]:
+    return ["".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(size)]
+
+
+def create_db(path: str, count: int) -> sqlite3.Connection:
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE event (id INTEGER PRIMARY KEY, name TEXT, description TEXT, category TEXT, city TEXT)"
+    )
+    db.executescript(SqliteSearchBackend.SETUP_SQL)
+
+    rng = random.Random(42)
+    vocabulary = make_vocabulary(rng, 50000)
+    batch = []
+    for i in range(1, count + 1):
+        name = " ".join([rng.choice(WORDS), *rng.choices(vocabulary, k=2)]).title()
+        description = " ".join(rng.choices(vocabulary, k=10) + rng.choices(WORDS, k=5))
+        batch.append((i, name, description, rng.choice(CATEGORIES), rng.choice(CITIES)))
+        if len(batch) == 10000:
+            db.executemany("INSERT INTO event VALUES (?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        db.executemany("INSERT INTO event VALUES (?, ?, ?, ?, ?)", batch)
+    db.commit()
+
+    return db
+
+
+def bench(name: str, db: sqlite3.Connection, sql: str, params_for, queries: list[str]) -> None:
+    iterations = 5
+    start = perf_counter()
+    for _ in range(iterations):
+        for query in queries:
+            db.execute(sql, params_for(query)).fetchall()
+    elapsed = (perf_counter() - start) / (iterations * len(queries))
+    print(f"{name:<24} {elapsed * 1000:>10.2f} ms/query")
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with TemporaryDirectory() as tmp:
+        start = perf_counter()
+        db = create_db(f"{tmp}/events.db", count)
+        print(f"Created {count:,} events with fts index in {perf_counter() - start:.1f}s")
+
+        # Typical queries: one or two specific words from event names, last one possibly incomplete
+        rng = random.Random(1)
+        names = [row[0] for row in db.execute("SELECT name FROM event ORDER BY random() LIMIT 20")]
+        queries = [" ".join(name.split()[1:rng.randint(2, 3)])[:-1] for name in names]
+
+        bench("name LIKE '%x%'", db, "SELECT id FROM event WHERE name LIKE ? LIMIT 1000",
+              lambda query: [f"%{query}%"], queries)
+        bench("fts5 (ranked, prefix)", db, SqliteSearchBackend.SEARCH_SQL,
+              lambda query: [SqliteSearchBackend.match_expression(EventSearch.tokenize(query)), 1000], queries)
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+On-sale burst against redis inventory backend: CONCURRENCY clients reserve and commit tickets of one plan until
+it is sold out, checking that exactly max_tickets are sold. Uses redis at REDIS_URL (plan id 2**62 keys are overwritten).
+Run with `poetry run python benchmarks/inventory_burst.py [max tickets]` (10,000 by default).
+"""
+
+import asyncio
+import sys
+from time import perf_counter
+from types import SimpleNamespace
+
+from ticketer.utils.cache import RedisCache
+from ticketer.utils.inventory import RedisInventoryBackend
+
+CONCURRENCY = 200
+PLAN_ID = 2 ** 62
+
+
+async def buyer(inventory: RedisInventoryBackend, plan, sold: list[int]) -> None:
+    while (reservation := await inventory.reserve(plan, 1)) is not None:
+        await inventory.commit(reservation)
+        sold.append(reservation.amount)
+
+
+async def main() -> None:
+    max_tickets = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    plan = SimpleNamespace(id=PLAN_ID, max_tickets=max_tickets)
+    inventory = RedisInventoryBackend()
+    client = await RedisCache._get_client()
+    await client.delete(*RedisInventoryBackend.keys(PLAN_ID, "remaining", "pending", "committed", "released"))
+    await client.set(RedisInventoryBackend.keys(PLAN_ID, "remaining")[0], max_tickets)
+
+    sold = []
+    start = perf_counter()
+    await asyncio.gather(*(buyer(inventory, plan, sold) for _ in range(CONCURRENCY)))
+    elapsed = perf_counter() - start
+
+    print(f"{CONCURRENCY} concurrent buyers sold {sum(sold):,} of {max_tickets:,} tickets in {elapsed:.2f}s")
+    print(f"{len(sold) / elapsed:,.0f} reservations/s (reserve + commit)")
+    assert sum(sold) == max_tickets, "oversold"
+    await client.delete(*RedisInventoryBackend.keys(PLAN_ID, "remaining", "pending", "committed", "released"))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+"""
+Microbenchmark of TOTP verification: the old getCodes() membership check (key decoded and hmac computed per code)
+vs MFA.verify over a +-MFA_WINDOW window with the key decoded once. Run with `poetry run python benchmarks/mfa_verify.py`.
+"""
+
+from base64 import b32decode
+from hmac import new
+from struct import pack, unpack
+from time import time, perf_counter
+
+from ticketer import config
+from ticketer.utils.mfa import MFA
+
+KEY = "A" * 16
+ITERATIONS = 100_000
+
+
+def legacy_code(key: str, timestamp: float) -> str:
+    secret = b32decode(key.upper() + '=' * ((8 - len(key)) % 8))
+    mac = new(secret, pack('>Q', int(timestamp / 30)), "sha1").digest()
+    offset = mac[-1] & 0x0f
+    binary = unpack('>L', mac[offset:offset + 4])[0] & 0x7fffffff
+    return str(binary)[-6:].zfill(6)
+
+
+def legacy_verify(key: str, code: str) -> bool:
+    return code in {legacy_code(key, time() - 5), legacy_code(key, time() + 1)}
+
+
+def bench(name: str, func) -> None:
+    start = perf_counter()
+    for _ in range(ITERATIONS):
+        func()
+    elapsed = perf_counter() - start
+    print(f"{name:<32} {ITERATIONS / elapsed:>12,.0f} verifications/s")
+
+
+def main() -> None:
+    code = MFA(KEY).getCode()
+
+    bench("legacy getCodes (2 steps)", lambda: legacy_verify(KEY, code))
+    for window in (1, 2):
+        config.MFA_WINDOW = window
+        bench(f"MFA.verify (window={window})", lambda: MFA(KEY).verify(code))
+        mfa = MFA(KEY)
+        bench(f"MFA.verify reused (window={window})", lambda: mfa.verify(code))
+
+
+if __name__ == "__main__":
+    main()
@@ -37,6 +37,24 @@ def google_oauth_token_exchange(code: str, access_token: str):
     return _google_oauth_token_exchange
 
 
+def google_oauth_token_refresh(tokens: dict[str, str]):
+    """
+    Stand-in for google token endpoint refresh grant: tokens maps refresh tokens to new access tokens.
+    Unknown refresh tokens are rejected with "invalid_grant", refresh tokens mapped to None get 500 response.
+    """
+
+    def _google_oauth_token_refresh(request: Request) -> Response:
+        params = json.loads(request.content.decode("utf8"))
+        if params["grant_type"] != "refresh_token" or params["refresh_token"] not in tokens:
+            return Response(status_code=400, json={"error": "invalid_grant"})
+        if (access_token := tokens[params["refresh_token"]]) is None:
+            return Response(status_code=500, json={"error": "internal_failure"})
+
+        return Response(status_code=200, json={"access_token": access_token, "expires_in": 3600})
+
+    return _google_oauth_token_refresh
+
+
 def google_oauth_user_info(access_token: str):
     def _google_oauth_token_exchange(request: Request) -> Response:
         token = request.headers["Authorization"].split(" ")[1].strip()
@@ -19,6 +19,7 @@ from ticketer.main import app
 @pytest_asyncio.fixture
 async def app_with_lifespan() -> FastAPI:
     async with LifespanManager(app) as manager:
+        await (await RedisCache._get_client()).flushdb()
         yield manager.app
 
     if RedisCache._connection is not None:
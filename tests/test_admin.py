@@ -7,7 +7,8 @@ from httpx import AsyncClient
 from pyvips import Image
 
 from tests import create_test_user, create_session_token
-from ticketer.models import UserRole, Location, Event
+from ticketer.models import UserRole, Location, Event, AuthSession
+from ticketer.utils.session_cache import SessionCache
 
 
 image16: bytes = Image.black(16, 16).write_to_buffer(".jpg[Q=85]")
@@ -78,6 +79,24 @@ async def test_ban_unban_user(client: AsyncClient):
     assert response.status_code == 200
 
 
+@pytest.mark.asyncio
+async def test_ban_revokes_sessions(client: AsyncClient):
+    test_user = await create_test_user()
+    test_token = await create_session_token(test_user)
+
+    user = await create_test_user(role=UserRole.ADMIN)
+    token = await create_session_token(user)
+
+    response = await client.get("/users/me", headers={"Authorization": test_token})
+    assert response.status_code == 200
+
+    response = await client.post(f"/admin/users/{test_user.id}/ban", headers={"Authorization": token})
+    assert response.status_code == 204
+
+    response = await client.get("/users/me", headers={"Authorization": test_token})
+    assert response.status_code == 401
+
+
 @pytest.mark.asyncio
 async def test_ban_unban_admin(client: AsyncClient):
     user = await create_test_user(role=UserRole.ADMIN)
@@ -325,3 +344,53 @@ async def test_edit_nonexistent_user(client: AsyncClient):
 
     response = await client.patch(f"/admin/users/{user.id+1000}", headers={"Authorization": token}, json={})
     assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_edit_role_invalidates_session(client: AsyncClient):
+    test_user = await create_test_user()
+    test_token = await create_session_token(test_user)
+    user = await create_test_user(role=UserRole.ADMIN)
+    token = await create_session_token(user)
+
+    response = await client.get("/admin/events", headers={"Authorization": test_token})
+    assert response.status_code == 403
+
+    response = await client.patch(f"/admin/users/{test_user.id}", headers={"Authorization": token}, json={
+        "role": UserRole.MANAGER,
+    })
+    assert response.status_code == 200
+
+    response = await client.get("/admin/events", headers={"Authorization": test_token})
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_get_metrics(client: AsyncClient):
+    user = await create_test_user(role=UserRole.ADMIN)
+    token = await create_session_token(user)
+
+    response = await client.get("/admin/metrics", headers={"Authorization": token})
+    assert response.status_code == 200
+    response = await client.get("/admin/metrics", headers={"Authorization": token})
+    assert response.status_code == 200
+    assert response.json()["counters"]["session_cache.local_hits"] > 0
+
+
+@pytest.mark.asyncio
+async def test_stale_session_cache_put(client: AsyncClient):
+    test_user = await create_test_user()
+    session = await AuthSession.create(user=test_user)
+    user = await create_test_user(role=UserRole.ADMIN)
+    token = await create_session_token(user)
+
+    # Request that loaded user before role was changed must not cache old role
+    generation = await SessionCache.generation(test_user.id)
+    response = await client.patch(f"/admin/users/{test_user.id}", headers={"Authorization": token}, json={
+        "role": UserRole.MANAGER,
+    })
+    assert response.status_code == 200
+    await SessionCache.put(session.id, session.token, test_user, generation)
+
+    response = await client.get("/admin/events", headers={"Authorization": session.to_jwt()})
+    assert response.status_code == 200
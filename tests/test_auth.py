@@ -1,11 +1,30 @@
+import asyncio
+from datetime import datetime, timedelta, UTC
 from time import time
 
 import pytest
-from httpx import AsyncClient
+import pytest_asyncio
+from httpx import AsyncClient, MockTransport, Request, Response, ConnectError
 
-from tests import create_test_user
+from tests import create_test_user, create_session_token
 from ticketer import config
+from ticketer.models import AuthSession
+from ticketer.utils.circuit_breaker import CircuitBreaker
+from ticketer.utils.cache import RedisCache
+from ticketer.utils.http import HttpClients
 from ticketer.utils.mfa import MFA
+from ticketer.utils.recaptcha import ReCaptcha
+from ticketer.utils.revocation import SessionRevocation
+from ticketer.utils.session_cache import SessionCache
+from ticketer.utils.session_gc import collect_expired_sessions
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def reset_recaptcha_transport():
+    ReCaptcha._breaker.reset()
+    yield
+    await HttpClients.use_transport(None)
+    ReCaptcha._breaker.reset()
 
 
 @pytest.mark.asyncio
@@ -91,6 +110,100 @@ async def test_login_captcha_fail(client: AsyncClient):
     config.RECAPTCHA_SECRET = old_recaptcha_secret
 
 
+@pytest.mark.asyncio
+async def test_login_captcha_mock_transport(client: AsyncClient):
+    user = await create_test_user()
+    requests = []
+
+    def handler(request: Request) -> Response:
+        requests.append(request)
+        return Response(200, json={"success": False})
+
+    await HttpClients.use_transport(MockTransport(handler))
+    response = await client.post("/auth/login", json={
+        "email": user.email,
+        "password": "123456789",
+        "captcha_key": f"mock-transport-{time()}",
+    })
+
+    assert response.status_code == 400
+    assert "captcha" in response.json()["error_message"]
+    assert len(requests) == 1
+    assert requests[0].url == "https://www.google.com/recaptcha/api/siteverify"
+
+
+@pytest.mark.asyncio
+async def test_login_captcha_reused(client: AsyncClient):
+    user = await create_test_user()
+    used_keys = set()
+
+    def handler(request: Request) -> Response:
+        key = dict(pair.split("=") for pair in request.content.decode("utf8").split("&"))["response"]
+        if key in used_keys:
+            return Response(200, json={"success": False, "error-codes": ["timeout-or-duplicate"]})
+        used_keys.add(key)
+        return Response(200, json={"success": True})
+
+    await HttpClients.use_transport(MockTransport(handler))
+    statuses = []
+    for _ in range(2):
+        response = await client.post("/auth/login", json={
+            "email": user.email,
+            "password": "123456789",
+            "captcha_key": f"reused-{user.id}",
+        })
+        statuses.append(response.status_code)
+
+    assert statuses == [200, 400]
+
+
+@pytest.mark.asyncio
+async def test_login_captcha_circuit_breaker(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    user = await create_test_user()
+    requests = []
+
+    def handler(request: Request) -> Response:
+        requests.append(request)
+        raise ConnectError("Unreachable", request=request)
+
+    await HttpClients.use_transport(MockTransport(handler))
+    for i in range(config.RECAPTCHA_BREAKER_THRESHOLD + 2):
+        response = await client.post("/auth/login", json={
+            "email": user.email,
+            "password": "123456789",
+            "captcha_key": f"breaker-{time()}-{i}",
+        })
+        assert response.status_code == 400
+    assert len(requests) == config.RECAPTCHA_BREAKER_THRESHOLD
+
+    monkeypatch.setattr(config, "RECAPTCHA_FAIL_OPEN", True)
+    response = await client.post("/auth/login", json={
+        "email": user.email,
+        "password": "123456789",
+        "captcha_key": f"breaker-{time()}",
+    })
+
+    assert response.status_code == 200
+    assert len(requests) == config.RECAPTCHA_BREAKER_THRESHOLD
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_half_open_timeout():
+    breaker = CircuitBreaker("test", 1, 0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    await asyncio.sleep(0.06)
+    assert breaker.allow()
+    # Trial call neither succeeded nor failed (e.g. it was cancelled)
+    assert not breaker.allow()
+    await asyncio.sleep(0.06)
+    assert breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
 @pytest.mark.asyncio
 async def test_login_creds_fail(client: AsyncClient):
     user = await create_test_user()
@@ -126,10 +239,109 @@ async def test_login_mfa(client: AsyncClient):
     assert "two-factor" in response.json()["error_message"]
 
     mfa = MFA(user.mfa_key)
+    code = mfa.getCode()
     response = await client.post("/auth/login", json={
         "email": user.email,
         "password": "123456789",
         "captcha_key": "should-pass",
-        "mfa_code": mfa.getCode(),
+        "mfa_code": code,
     })
     assert response.status_code == 200, response.json()
+
+    response = await client.post("/auth/login", json={
+        "email": user.email,
+        "password": "123456789",
+        "captcha_key": "should-pass",
+        "mfa_code": code,
+    })
+    assert response.status_code == 400
+    assert "two-factor" in response.json()["error_message"]
+
+
+@pytest.mark.asyncio
+async def test_login_password_hasher_busy(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    user = await create_test_user()
+
+    monkeypatch.setattr(config, "PASSWORD_HASH_MAX_PENDING", 0)
+    response = await client.post("/auth/login", json={
+        "email": user.email,
+        "password": "123456789",
+        "captcha_key": "should-pass",
+    })
+    assert response.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_logout(client: AsyncClient):
+    user = await create_test_user()
+    token = await create_session_token(user)
+    other_token = await create_session_token(user)
+
+    response = await client.get("/users/me", headers={"Authorization": token})
+    assert response.status_code == 200
+
+    response = await client.post("/auth/logout", headers={"Authorization": token})
+    assert response.status_code == 204
+
+    response = await client.get("/users/me", headers={"Authorization": token})
+    assert response.status_code == 401
+    response = await client.post("/auth/logout", headers={"Authorization": token})
+    assert response.status_code == 401
+
+    response = await client.get("/users/me", headers={"Authorization": other_token})
+    assert response.status_code == 200
+
+    # Token is revoked even if its session was already deleted
+    await AuthSession.filter(user=user).delete()
+    response = await client.post("/auth/logout", headers={"Authorization": other_token})
+    assert response.status_code == 204
+    response = await client.get("/users/me", headers={"Authorization": other_token})
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_revocation_survives_redis_flush(client: AsyncClient):
+    user = await create_test_user()
+    token = await create_session_token(user)
+
+    response = await client.post("/auth/logout", headers={"Authorization": token})
+    assert response.status_code == 204
+
+    await (await RedisCache._get_client()).flushdb()
+    response = await client.get("/users/me", headers={"Authorization": token})
+    assert response.status_code == 401
+
+    await SessionRevocation.resync()
+    response = await client.get("/users/me", headers={"Authorization": token})
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_banned_user_session_rejected(client: AsyncClient):
+    user = await create_test_user()
+    token = await create_session_token(user)
+
+    response = await client.get("/users/me", headers={"Authorization": token})
+    assert response.status_code == 200
+
+    # Sessions are rejected even if they were not revoked when user was banned
+    await user.update(banned=True)
+    await SessionCache.invalidate_user(user.id)
+    response = await client.get("/users/me", headers={"Authorization": token})
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_expired_sessions_gc(client: AsyncClient):
+    user = await create_test_user()
+    expired = await AuthSession.create(user=user, expires=datetime.now(UTC) - timedelta(minutes=1))
+    token = await create_session_token(user)
+
+    response = await client.get("/users/me", headers={"Authorization": expired.to_jwt()})
+    assert response.status_code == 401
+
+    assert await collect_expired_sessions() == 1
+    assert not await AuthSession.filter(id=expired.id).exists()
+
+    response = await client.get("/users/me", headers={"Authorization": token})
+    assert response.status_code == 200
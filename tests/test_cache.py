@@ -0,0 +1,135 @@
+import asyncio
+import json
+import subprocess
+import sys
+from os import environ
+from pathlib import Path
+from time import time
+
+import pytest
+from httpx import AsyncClient
+
+from ticketer import config
+from ticketer.utils.cache import RedisCache, LocalCache
+from ticketer.utils.metrics import Metrics
+
+KEY_ARGS = ("search", 0, 10, "Concert", None, True, 1.5, ("a", 1), {"b": 2})
+SCRIPT = f"from ticketer.utils.cache import RedisCache; print(RedisCache._hash(*{KEY_ARGS!r}))"
+
+
+def test_cache_keys_are_stable_across_processes():
+    keys = set()
+    for seed in ("1", "2", "random"):
+        result = subprocess.run(
+            [sys.executable, "-c", SCRIPT], capture_output=True, check=True, text=True,
+            cwd=Path(__file__).parent.parent, env=environ | {"PYTHONHASHSEED": seed},
+        )
+        keys.add(result.stdout.strip())
+
+    assert keys == {RedisCache._hash(*KEY_ARGS)}
+
+
+def test_cache_keys_distinguish_args():
+    assert RedisCache._hash("tickets", 1) != RedisCache._hash("tickets", "1")
+    assert RedisCache._hash("tickets", 1) != RedisCache._hash("tickets_one", 1)
+    assert RedisCache._hash("tickets_one", 1, 2) != RedisCache._hash("tickets_one", 2, 1)
+    assert RedisCache._hash("tickets", 1).startswith(f"v{config.CACHE_VERSION}:tickets:")
+
+
+@pytest.mark.asyncio
+async def test_local_cache_coherence(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(RedisCache, "_local", LocalCache(16))
+    listener = asyncio.create_task(RedisCache.listen())
+    try:
+        while not RedisCache._listening:
+            await asyncio.sleep(0.01)
+
+        redis = await RedisCache._get_client()
+        key = RedisCache._hash("test", 1)
+        generations = await RedisCache.tag_generations(["test-tag"])
+        await RedisCache.put("test", {"value": 1}, 1, expires_in=60, tags=generations)
+
+        # Served from local cache even if redis value is changed behind its back
+        await redis.set(key, json.dumps({"value": {"value": 2}, "tags": generations}))
+        assert await RedisCache.get("test", 1) == {"value": 1}
+        assert Metrics.counter("cache.test.local_hits").value > 0
+
+        # Invalidation broadcast by another worker
+        await redis.publish(RedisCache.CHANNEL, json.dumps({"keys": [key]}))
+        for _ in range(100):
+            if RedisCache._local.get(key) is None:
+                break
+            await asyncio.sleep(0.01)
+        assert await RedisCache.get("test", 1) == {"value": 2}
+        assert await RedisCache.get("test", 1) == {"value": 2}
+
+        await RedisCache.invalidate_tags("test-tag")
+        assert await RedisCache.get("test", 1) is None
+        assert 0 < Metrics.gauge("cache.test.hit_ratio").value < 1
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_get_or_compute_coalesces_misses(client: AsyncClient):
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"calls": calls}, None
+
+    results = await asyncio.gather(*[
+        RedisCache.get_or_compute("test-coalesce", 1, compute=compute, expires_in=60) for _ in range(10)
+    ])
+    assert results == [{"calls": 1}] * 10
+    assert calls == 1
+    assert await RedisCache.get_or_compute("test-coalesce", 1, compute=compute, expires_in=60) == {"calls": 1}
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_get_or_compute_leader_cancelled(client: AsyncClient):
+    release = asyncio.Event()
+
+    async def compute():
+        await release.wait()
+        return {"value": 1}, None
+
+    leader = asyncio.create_task(RedisCache.get_or_compute("test-cancel", 1, compute=compute, expires_in=60))
+    await asyncio.sleep(0.01)
+    waiters = [
+        asyncio.create_task(RedisCache.get_or_compute("test-cancel", 1, compute=compute, expires_in=60))
+        for _ in range(3)
+    ]
+    await asyncio.sleep(0.01)
+
+    # Caller that started computation is gone, others still get the value
+    leader.cancel()
+    await asyncio.gather(leader, return_exceptions=True)
+    release.set()
+    assert await asyncio.gather(*waiters) == [{"value": 1}] * 3
+    assert leader.cancelled()
+    assert await RedisCache.get("test-cancel", 1) == {"value": 1}
+
+
+@pytest.mark.asyncio
+async def test_get_or_compute_stale_while_revalidate(client: AsyncClient):
+    redis = await RedisCache._get_client()
+    key = RedisCache._hash("test-stale", 1)
+    await redis.set(key, json.dumps({"value": {"value": "stale"}, "tags": {}, "fresh_until": time() - 1}), ex=60)
+
+    async def compute():
+        return {"value": "new"}, None
+
+    # Other worker is recomputing the value
+    await redis.set(f"{key}:lock", 1, ex=5)
+    assert await RedisCache.get_or_compute("test-stale", 1, compute=compute, expires_in=60) == {"value": "stale"}
+    assert await RedisCache.get("test-stale", 1) is None
+
+    await redis.delete(f"{key}:lock")
+    assert await RedisCache.get_or_compute("test-stale", 1, compute=compute, expires_in=60) == {"value": "new"}
+    assert await RedisCache.get("test-stale", 1) == {"value": "new"}
+    assert not await redis.exists(f"{key}:lock")
@@ -1,10 +1,14 @@
+from datetime import datetime, UTC
 from time import time
 
 import pytest
 from httpx import AsyncClient
+from tortoise import Tortoise
 
 from tests import create_test_user, create_session_token
 from ticketer.models import Location, Event, EventPlan, UserRole
+from ticketer.utils.cache import RedisCache
+from ticketer.utils.facets import EventFacets
 
 
 async def create_events(count: int = 10):
@@ -32,6 +36,43 @@ async def test_event_pages(client: AsyncClient):
     assert len(response.json()) == 0
 
 
+@pytest.mark.asyncio
+async def test_event_cursor_pages(client: AsyncClient):
+    await create_events(12)
+
+    for sort_by, direction in ((None, "asc"), ("name", "desc"), ("category", "asc"), ("start_time", "desc")):
+        params = {"results_per_page": 5, "sort_direction": direction}
+        if sort_by is not None:
+            params["sort_by"] = sort_by
+
+        response = await client.post("/events/search", json={}, params=params | {"results_per_page": 50})
+        expected = [event["id"] for event in response.json()]
+        assert len(expected) == 12
+
+        ids = []
+        cursor = None
+        for _ in range(3):
+            cursor_params = {"cursor": cursor} if cursor is not None else {}
+            response = await client.post("/events/search", json={}, params=params | cursor_params)
+            assert response.status_code == 200
+            ids.extend(event["id"] for event in response.json())
+            cursor = response.headers.get("x-next-cursor")
+            if cursor is None:
+                break
+
+        assert ids == expected
+        assert cursor is None
+
+    response = await client.post("/events/search", json={}, params={"results_per_page": 5})
+    cursor = response.headers["x-next-cursor"]
+    response = await client.post("/events/search", json={}, params={"results_per_page": 5, "sort_by": "name",
+                                                                     "cursor": cursor})
+    assert response.status_code == 400
+
+    response = await client.post("/events/search", json={}, params={"cursor": "not a cursor"})
+    assert response.status_code == 400
+
+
 @pytest.mark.asyncio
 async def test_event_search_time(client: AsyncClient):
     await create_events()
@@ -95,3 +136,265 @@ async def test_get_manager_events(client: AsyncClient):
     response = await client.get(f"/admin/events", headers={"authorization": token})
     assert response.status_code == 200
     assert len(response.json()) == 1
+
+
+@pytest.mark.asyncio
+async def test_event_search_full_text(client: AsyncClient):
+    user = await create_test_user(role=UserRole.MANAGER)
+    token = await create_session_token(user)
+    location = await Location.create(name="test", longitude=0, latitude=0)
+    concert = await Event.create(
+        name="Rock concert", description="Loud guitars", category="music", city="Kyiv", location=location,
+        manager=user,
+    )
+    await Event.create(
+        name="Jazz evening", description="Saxophone and a rock concert afterparty", category="music", city="Lviv",
+        location=location, manager=user,
+    )
+
+    response = await client.post("/events/search", json={"name": "conc"})
+    assert response.status_code == 200
+    assert [event["name"] for event in response.json()] == ["Rock concert", "Jazz evening"]
+
+    response = await client.post("/events/search", json={"name": "guitar kyiv"})
+    assert response.status_code == 200
+    assert [event["name"] for event in response.json()] == ["Rock concert"]
+
+    response = await client.post("/events/search", json={"name": "rock", "city": "Lviv"})
+    assert response.status_code == 200
+    assert [event["name"] for event in response.json()] == ["Jazz evening"]
+
+    response = await client.patch(f"/admin/events/{concert.id}", headers={"authorization": token},
+                                  json={"name": "Symphony orchestra"})
+    assert response.status_code == 200
+
+    response = await client.post("/events/search", json={"name": "symph"})
+    assert response.status_code == 200
+    assert [event["name"] for event in response.json()] == ["Symphony orchestra"]
+
+
+@pytest.mark.asyncio
+async def test_event_search_plans_query_count(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    await create_events(20)
+    for event in await Event.all():
+        await EventPlan.create(name="vip", price=500, max_tickets=10, event=event)
+
+    connection = Tortoise.get_connection("default")
+    execute_query = connection.execute_query
+    queries = []
+
+    async def _counting_execute_query(query, values=None):
+        queries.append(query)
+        return await execute_query(query, values)
+
+    monkeypatch.setattr(connection, "execute_query", _counting_execute_query)
+
+    counts = []
+    for results_per_page in (5, 20):
+        queries.clear()
+        response = await client.post("/events/search", json={}, params={
+            "with_plans": True, "results_per_page": results_per_page,
+        })
+        assert response.status_code == 200
+        assert len(response.json()) == results_per_page
+        assert all(len(event["plans"]) == 2 for event in response.json())
+        counts.append(len(queries))
+
+    assert counts[0] == counts[1] == 2
+
+
+@pytest.mark.asyncio
+async def test_event_search_cache_invalidation(client: AsyncClient):
+    user = await create_test_user(role=UserRole.MANAGER)
+    token = await create_session_token(user)
+    location = await Location.create(name="test", longitude=0, latitude=0)
+    kyiv = await Event.create(name="Kyiv event", description="old", category="test", city="Kyiv", location=location,
+                              manager=user)
+    lviv = await Event.create(name="Lviv event", description="old", category="test", city="Lviv", location=location,
+                              manager=user)
+
+    async def search(city: str) -> list[dict]:
+        response = await client.post("/events/search", json={"city": city})
+        assert response.status_code == 200
+        return response.json()
+
+    assert [event["description"] for event in await search("Kyiv")] == ["old"]
+    assert [event["description"] for event in await search("Lviv")] == ["old"]
+
+    # Writes bypassing the api are not visible until cached results are invalidated
+    await Event.filter(id__in=[kyiv.id, lviv.id]).update(description="changed directly")
+    assert [event["description"] for event in await search("Kyiv")] == ["old"]
+
+    response = await client.patch(f"/admin/events/{kyiv.id}", headers={"authorization": token},
+                                  json={"description": "new"})
+    assert response.status_code == 200
+    assert [event["description"] for event in await search("Kyiv")] == ["new"]
+    assert [event["description"] for event in await search("Lviv")] == ["old"]
+
+    # Description is searchable, so editing it changes which text searches match event
+    response = await client.post("/events/search", json={"name": "zebrafestival"})
+    assert response.json() == []
+    response = await client.patch(f"/admin/events/{kyiv.id}", headers={"authorization": token},
+                                  json={"description": "zebrafestival"})
+    assert response.status_code == 200
+    response = await client.post("/events/search", json={"name": "zebrafestival"})
+    assert [event["id"] for event in response.json()] == [kyiv.id]
+
+    response = await client.post("/admin/events", headers={"Authorization": token}, json={
+        "name": "Another Lviv event", "description": "added", "category": "test", "start_time": int(time()),
+        "end_time": int(time()) + 60, "location_id": location.id, "city": "Lviv",
+        "plans": [{"name": "test", "price": 100, "max_tickets": 5}],
+    })
+    assert response.status_code == 200
+    assert [event["description"] for event in await search("Lviv")] == ["changed directly", "added"]
+    assert [event["description"] for event in await search("Kyiv")] == ["zebrafestival"]
+
+
+@pytest.mark.asyncio
+async def test_event_conditional_get(client: AsyncClient):
+    user = await create_test_user(role=UserRole.MANAGER)
+    token = await create_session_token(user)
+    location = await Location.create(name="test", longitude=0, latitude=0)
+    event = await Event.create(name="Conditional", description="old", category="test", city="test",
+                               location=location, manager=user)
+
+    response = await client.get(f"/events/{event.id}")
+    assert response.status_code == 200
+    assert response.headers["cache-control"].startswith("public, max-age=")
+    etag = response.headers["etag"]
+
+    response = await client.get(f"/events/{event.id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    # Representation with plans has its own ETag
+    response = await client.get(f"/events/{event.id}", params={"with_plans": True}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+    response = await client.patch(f"/admin/events/{event.id}", headers={"authorization": token},
+                                  json={"description": "new"})
+    assert response.status_code == 200
+
+    response = await client.get(f"/events/{event.id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["description"] == "new"
+    assert response.headers["etag"] != etag
+
+
+@pytest.mark.asyncio
+async def test_event_geo_search(client: AsyncClient):
+    user = await create_test_user(role=UserRole.MANAGER)
+    token = await create_session_token(user)
+    kyiv = await Location.create(name="Kyiv", latitude=50.4501, longitude=30.5234)
+    brovary = await Location.create(name="Brovary", latitude=50.5111, longitude=30.7906)
+    lviv = await Location.create(name="Lviv", latitude=49.8397, longitude=24.0297)
+    for location in (lviv, brovary, kyiv):
+        await Event.create(name=location.name, description="-", category="test", city=location.name,
+                           location=location, manager=user)
+
+    async def nearby(**kwargs) -> list[dict]:
+        response = await client.post("/events/nearby", json={"latitude": 50.45, "longitude": 30.52} | kwargs)
+        assert response.status_code == 200
+        return response.json()
+
+    events = await nearby(radius=30)
+    assert [event["name"] for event in events] == ["Kyiv", "Brovary"]
+    assert events[0]["distance"] < 1 < 15 < events[1]["distance"] < 25
+    assert [event["name"] for event in await nearby(radius=200)] == ["Kyiv", "Brovary"]
+    assert [event["name"] for event in await nearby(radius=30, category="other")] == []
+
+    response = await client.post("/events/viewport", json={
+        "min_latitude": 49, "min_longitude": 23, "max_latitude": 51, "max_longitude": 30.6,
+    })
+    assert response.status_code == 200
+    assert {event["name"] for event in response.json()} == {"Lviv", "Kyiv"}
+
+    # Cached cells are invalidated when event is added to them
+    irpin = await Location.create(name="Irpin", latitude=50.5218, longitude=30.2506)
+    response = await client.post("/admin/events", headers={"Authorization": token}, json={
+        "name": "Irpin", "description": "-", "category": "test", "start_time": int(time()),
+        "end_time": int(time()) + 60, "location_id": irpin.id, "city": "Irpin",
+        "plans": [{"name": "test", "price": 100, "max_tickets": 5}],
+    })
+    assert response.status_code == 200
+    assert [event["name"] for event in await nearby(radius=30)] == ["Kyiv", "Brovary", "Irpin"]
+
+
+@pytest.mark.asyncio
+async def test_event_geo_search_antimeridian(client: AsyncClient):
+    user = await create_test_user(role=UserRole.MANAGER)
+    east = await Location.create(name="east", latitude=-40.5, longitude=179.99)
+    west = await Location.create(name="west", latitude=-40.5, longitude=-179.99)
+    for location in (east, west):
+        await Event.create(name=location.name, description="-", category="test", city="test", location=location,
+                           manager=user)
+
+    response = await client.post("/events/nearby", json={"latitude": -40.5, "longitude": 179.995, "radius": 5})
+    assert response.status_code == 200
+    assert [event["name"] for event in response.json()] == ["east", "west"]
+
+    response = await client.post("/events/viewport", json={
+        "min_latitude": -41, "min_longitude": 179, "max_latitude": -40, "max_longitude": -179,
+    })
+    assert response.status_code == 200
+    assert {event["name"] for event in response.json()} == {"east", "west"}
+
+    response = await client.post("/events/nearby", json={"latitude": 0, "longitude": 0, "radius": 100000})
+    assert response.status_code == 400
+    assert response.json()["error_code"] == 38
+
+    for viewport in ((-90, -180, 90, 180), (0, -180, 1, 180), (-41, 170, -40, -179)):
+        response = await client.post("/events/viewport", json=dict(zip(
+            ("min_latitude", "min_longitude", "max_latitude", "max_longitude"), viewport
+        )))
+        assert response.status_code == 400
+        assert response.json()["error_code"] == 43
+
+
+@pytest.mark.asyncio
+async def test_event_facets(client: AsyncClient):
+    user = await create_test_user(role=UserRole.MANAGER)
+    token = await create_session_token(user)
+    location = await Location.create(name="test", longitude=0, latitude=0)
+    start_time = datetime(2030, 5, 10, tzinfo=UTC)
+    await Event.create(name="Facets", description="-", category="music", city="Facets city", location=location,
+                       manager=user, start_time=start_time)
+
+    async def facets() -> dict:
+        response = await client.get("/events/facets", params={"city": "Facets city"})
+        assert response.status_code == 200
+        return response.json()
+
+    # Counters are built from database on first request
+    await (await RedisCache._get_client()).delete(EventFacets.BUILT_KEY)
+    assert await facets() == {"category": {"music": 1}, "city": {"Facets city": 1}, "month": {"2030-05": 1}}
+
+    response = await client.post("/admin/events", headers={"Authorization": token}, json={
+        "name": "Facets", "description": "-", "category": "sport", "start_time": int(start_time.timestamp()),
+        "end_time": int(start_time.timestamp()) + 60, "location_id": location.id, "city": "Facets city",
+        "plans": [{"name": "test", "price": 100, "max_tickets": 5}],
+    })
+    assert response.status_code == 200
+    event_id = response.json()["id"]
+    assert await facets() == {
+        "category": {"music": 1, "sport": 1}, "city": {"Facets city": 2}, "month": {"2030-05": 2},
+    }
+
+    response = await client.patch(f"/admin/events/{event_id}", headers={"authorization": token}, json={
+        "category": "music", "start_time": int(datetime(2030, 6, 1, tzinfo=UTC).timestamp()),
+    })
+    assert response.status_code == 200
+    assert await facets() == {
+        "category": {"music": 2}, "city": {"Facets city": 2}, "month": {"2030-05": 1, "2030-06": 1},
+    }
+
+    response = await client.get("/events/facets")
+    assert response.status_code == 200
+    assert response.json()["city"]["Facets city"] == 2
+
+    # Writes bypassing the api are picked up by periodic rebuild
+    await Event.filter(id=event_id).update(city="Other facets city")
+    assert (await facets())["category"] == {"music": 2}
+    await EventFacets.rebuild()
+    assert await facets() == {"category": {"music": 1}, "city": {"Facets city": 1}, "month": {"2030-05": 1}}
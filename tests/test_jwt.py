@@ -0,0 +1,31 @@
+from time import time
+
+from ticketer.utils import jwt
+from ticketer.utils.jwt import JWT, JWTVerifier
+
+
+def test_jwt_encode_decode():
+    token = JWT.encode({"user": 1}, b"secret", expires_in=60)
+
+    assert JWT.decode(token, b"secret") == {"user": 1}
+    assert JWT.decode(token, b"other-secret") is None
+    assert JWT.decode(token[:-2], b"secret") is None
+    assert JWT.decode("not.a.token", b"secret") is None
+
+
+def test_jwt_require_exp():
+    token = JWT.encode({"user": 1}, b"secret")
+
+    assert JWT.decode(token, b"secret") == {"user": 1}
+    assert JWT.decode(token, b"secret", require_exp=True) is None
+
+
+def test_jwt_cached_token_expires(monkeypatch):
+    verifier = JWTVerifier(b"secret")
+    token = JWT.encode({"user": 1}, b"secret", expire_timestamp=time() + 60)
+
+    assert verifier.decode(token) == {"user": 1}
+    assert verifier.decode(token) == {"user": 1}
+
+    monkeypatch.setattr(jwt, "time", lambda: time() + 120)
+    assert verifier.decode(token) is None
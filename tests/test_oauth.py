@@ -1,11 +1,14 @@
 from os import urandom
+from time import time
 
 import pytest
 from httpx import AsyncClient
 from pytest_httpx import HTTPXMock
 
+from ticketer.models import ExternalAuth
+from ticketer.utils.oauth_refresh import refresh_expiring_google_tokens
 from . import create_test_user
-from . import google_oauth_token_exchange, google_oauth_user_info, create_session_token
+from . import google_oauth_token_exchange, google_oauth_user_info, create_session_token, google_oauth_token_refresh
 
 
 def register_http_mock(mock: HTTPXMock) -> tuple[str, str]:
@@ -68,3 +71,34 @@ async def test_connect_and_login(client: AsyncClient, httpx_mock: HTTPXMock):
     assert response.status_code == 400
     assert "already" in response.json()["error_message"]
 
+
+@pytest.mark.asyncio
+async def test_refresh_expiring_tokens(client: AsyncClient, httpx_mock: HTTPXMock):
+    new_token = urandom(32).hex()
+    httpx_mock.add_callback(
+        google_oauth_token_refresh({"valid": new_token, "failing": None}),
+        url="https://accounts.google.com/o/oauth2/token"
+    )
+
+    eauths = {}
+    for refresh_token, expires_in in (("valid", 60), ("revoked", 60), ("failing", 60), ("fresh", 3600)):
+        eauths[refresh_token] = await ExternalAuth.create(
+            user=await create_test_user(), service="google", service_id=urandom(16).hex(), access_token="old",
+            refresh_token=refresh_token, expires_at=int(time() + expires_in),
+        )
+
+    assert await refresh_expiring_google_tokens() == 3
+    for eauth in eauths.values():
+        await eauth.refresh_from_db()
+
+    assert eauths["valid"].access_token == new_token
+    assert eauths["valid"].refresh_token == "valid"
+    assert eauths["valid"].expires_at > time() + 3000
+    assert eauths["revoked"].refresh_token is None
+    assert eauths["failing"].access_token == "old"
+    assert eauths["fresh"].access_token == "old"
+    assert len(httpx_mock.get_requests()) == 3
+
+    # Failed token is backed off, revoked one can't be refreshed anymore
+    assert await refresh_expiring_google_tokens() == 0
+    assert len(httpx_mock.get_requests()) == 3
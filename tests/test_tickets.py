@@ -1,4 +1,5 @@
-from datetime import datetime, UTC
+import asyncio
+from datetime import datetime, UTC, timedelta
 
 import pytest
 from httpx import AsyncClient
@@ -6,6 +7,11 @@ from httpx import AsyncClient
 from tests import create_test_user, create_session_token
 from ticketer.config import fcm
 from ticketer.models import Location, Event, EventPlan, PaymentState, Ticket, Payment, UserRole, UserDevice
+from ticketer.utils.cache import RedisCache
+from ticketer.utils.inventory import Inventory, DatabaseInventoryBackend, RedisInventoryBackend
+from ticketer.utils.payment_reaper import reap_expired_payments
+from ticketer.utils.paypal import PayPal
+from ticketer.utils.waiting_room import WaitingRoom
 
 
 @pytest.mark.asyncio
@@ -184,3 +190,357 @@ async def test_cancel_ticket(client: AsyncClient):
     assert response.status_code == 400
 
 
+@pytest.mark.asyncio
+async def test_tickets_conditional_get(client: AsyncClient):
+    user = await create_test_user()
+    manager = await create_test_user(role=UserRole.MANAGER)
+    token = await create_session_token(user)
+    manager_token = await create_session_token(manager)
+    location = await Location.create(name="test", longitude=0, latitude=0)
+    event = await Event.create(
+        name=f"Test event", description=f"test", category="test", location=location, city="test", manager=manager
+    )
+    plan = await EventPlan.create(name="test", price=100, max_tickets=1000, event=event)
+    ticket = await Ticket.create(amount=1, event_plan=plan, user=user)
+    await Payment.create(ticket=ticket, state=PaymentState.AWAITING_PAYMENT)
+
+    for path in ("/tickets", f"/tickets/{ticket.id}"):
+        response = await client.get(path, headers={"Authorization": token})
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == "private, no-cache"
+        etag = response.headers["etag"]
+
+        response = await client.get(path, headers={"Authorization": token, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+        # Edit of ticket event changes ticket representation
+        response = await client.patch(f"/admin/events/{event.id}", headers={"authorization": manager_token},
+                                      json={"description": f"changed {path}"})
+        assert response.status_code == 200
+
+        response = await client.get(path, headers={"Authorization": token, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    etag = (await client.get("/tickets", headers={"Authorization": token})).headers["etag"]
+    response = await client.delete(f"/tickets/{ticket.id}", headers={"Authorization": token})
+    assert response.status_code == 204
+    response = await client.get("/tickets", headers={"Authorization": token, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+@pytest.mark.asyncio
+async def test_concurrent_purchases_do_not_oversell(client: AsyncClient):
+    manager = await create_test_user(role=UserRole.MANAGER)
+    users = [await create_test_user() for _ in range(8)]
+    tokens = [await create_session_token(user) for user in users]
+    location = await Location.create(name="test", longitude=0, latitude=0)
+    event = await Event.create(
+        name=f"Test event", description=f"test", category="test", location=location, city="test", manager=manager
+    )
+    plan = await EventPlan.create(name="test", price=100, max_tickets=5, event=event)
+
+    responses = await asyncio.gather(*(
+        client.post("/tickets/request-payment", headers={"Authorization": token}, json={
+            "event_id": event.id, "plan_id": plan.id, "amount": 2,
+        })
+        for token in tokens
+    ))
+    assert sorted(response.status_code for response in responses) == [200, 200] + [400] * 6
+    assert await Ticket.filter(event_plan=plan).count() == 2
+
+    response = await client.post("/tickets/request-payment", headers={"Authorization": tokens[0]}, json={
+        "event_id": event.id, "plan_id": plan.id, "amount": 1,
+    })
+    assert response.status_code == 200
+
+    # Cancelled tickets are returned to inventory
+    response = await client.delete(f"/tickets/{response.json()['ticket_id']}", headers={"Authorization": tokens[0]})
+    assert response.status_code == 204
+    responses = await asyncio.gather(*(
+        client.post("/tickets/request-payment", headers={"Authorization": token}, json={
+            "event_id": event.id, "plan_id": plan.id, "amount": 1,
+        })
+        for token in tokens
+    ))
+    assert sorted(response.status_code for response in responses) == [200] + [400] * 7
+
+
+@pytest.mark.asyncio
+async def test_inventory_reconcile(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(Inventory, "_backend", RedisInventoryBackend())
+    user = await create_test_user()
+    manager = await create_test_user(role=UserRole.MANAGER)
+    token = await create_session_token(user)
+    location = await Location.create(name="test", longitude=0, latitude=0)
+    event = await Event.create(
+        name=f"Test event", description=f"test", category="test", location=location, city="test", manager=manager
+    )
+    plan = await EventPlan.create(name="test", price=100, max_tickets=3, event=event)
+
+    response = await client.post("/tickets/request-payment", headers={"Authorization": token}, json={
+        "event_id": event.id, "plan_id": plan.id, "amount": 1,
+    })
+    assert response.status_code == 200
+
+    # Tickets created bypassing inventory are accounted after reconciliation
+    await Ticket.create(amount=2, event_plan=plan, user=user)
+    await Inventory.reconcile()
+
+    response = await client.post("/tickets/request-payment", headers={"Authorization": token}, json={
+        "event_id": event.id, "plan_id": plan.id, "amount": 1,
+    })
+    assert response.status_code == 400
+
+    # Expired unpaid tickets are returned to inventory by payment reaper
+    ticket_ids = await Ticket.filter(event_plan=plan).values_list("id", flat=True)
+    await Payment.filter(ticket_id__in=ticket_ids).update(expires_at=datetime.now(UTC) - timedelta(minutes=1))
+    await Ticket.filter(event_plan=plan, amount=2).delete()
+    await Inventory.reconcile()
+    await reap_expired_payments()
+    response = await client.post("/tickets/request-payment", headers={"Authorization": token}, json={
+        "event_id": event.id, "plan_id": plan.id, "amount": 3,
+    })
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_database_inventory(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(Inventory, "_backend", DatabaseInventoryBackend())
+
+    async def paypal_check(*args) -> bool:
+        return True
+
+    monkeypatch.setattr(PayPal, "check", paypal_check)
+
+    manager = await create_test_user(role=UserRole.MANAGER)
+    users = [await create_test_user() for _ in range(6)]
+    tokens = [await create_session_token(user) for user in users]
+    location = await Location.create(name="test", longitude=0, latitude=0)
+    event = await Event.create(
+        name=f"Test event", description=f"test", category="test", location=location, city="test", manager=manager,
+        start_time=datetime.now(UTC) + timedelta(days=7),
+    )
+    plan = await EventPlan.create(name="test", price=100, max_tickets=5, event=event)
+
+    responses = await asyncio.gather(*(
+        client.post("/tickets/request-payment", headers={"Authorization": token}, json={
+            "event_id": event.id, "plan_id": plan.id, "amount": 2,
+        })
+        for token in tokens
+    ))
+    assert sorted(response.status_code for response in responses) == [200, 200] + [400] * 4
+    await plan.refresh_from_db()
+    assert (plan.sold_count, plan.reserved_count) == (0, 4)
+
+    ticket_id, token = next(
+        (response.json()["ticket_id"], token) for response, token in zip(responses, tokens)
+        if response.status_code == 200
+    )
+    await Payment.filter(ticket_id=ticket_id).update(paypal_id="test")
+    for _ in range(2):
+        response = await client.post(f"/tickets/{ticket_id}/check-payment", headers={"Authorization": token})
+        assert response.status_code == 204
+    await plan.refresh_from_db()
+    assert (plan.sold_count, plan.reserved_count) == (2, 2)
+
+    response = await client.delete(f"/tickets/{ticket_id}", headers={"Authorization": token})
+    assert response.status_code == 204
+    await plan.refresh_from_db()
+    assert (plan.sold_count, plan.reserved_count) == (0, 2)
+
+    # Counters drifted by writes bypassing inventory are recounted
+    await EventPlan.filter(id=plan.id).update(sold_count=3)
+    await Inventory.reconcile()
+    await plan.refresh_from_db()
+    assert (plan.sold_count, plan.reserved_count) == (0, 2)
+
+
+@pytest.mark.asyncio
+async def test_payment_reaper(client: AsyncClient):
+    user = await create_test_user()
+    manager = await create_test_user(role=UserRole.MANAGER)
+    token = await create_session_token(user)
+    location = await Location.create(name="test", longitude=0, latitude=0)
+    event = await Event.create(
+        name=f"Test event", description=f"test", category="test", location=location, city="test", manager=manager
+    )
+    plan = await EventPlan.create(name="test", price=100, max_tickets=2, event=event)
+
+    ticket_ids = []
+    for _ in range(2):
+        response = await client.post("/tickets/request-payment", headers={"Authorization": token}, json={
+            "event_id": event.id, "plan_id": plan.id, "amount": 1,
+        })
+        assert response.status_code == 200
+        ticket_ids.append(response.json()["ticket_id"])
+
+    expired, paid = ticket_ids
+    await Payment.filter(ticket_id__in=ticket_ids).update(expires_at=datetime.now(UTC) - timedelta(minutes=1))
+    await Payment.filter(ticket_id=paid).update(state=PaymentState.DONE)
+
+    response = await client.get("/tickets", headers={"Authorization": token})
+    assert len(response.json()) == 2
+
+    # Purchase path only reads, expired tickets are deleted by reaper
+    response = await client.get(f"/tickets/{expired}/check-verification", headers={"Authorization": token})
+    assert response.status_code == 404
+    assert await Ticket.filter(id=expired).exists()
+
+    await reap_expired_payments()
+    assert not await Ticket.filter(id=expired).exists()
+    assert await Ticket.filter(id=paid).exists()
+
+    response = await client.get("/tickets", headers={"Authorization": token})
+    assert [ticket["id"] for ticket in response.json()] == [paid]
+
+    response = await client.post("/tickets/request-payment", headers={"Authorization": token}, json={
+        "event_id": event.id, "plan_id": plan.id, "amount": 1,
+    })
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_waiting_room(client: AsyncClient):
+    manager = await create_test_user(role=UserRole.MANAGER)
+    users = [await create_test_user() for _ in range(3)]
+    tokens = [await create_session_token(user) for user in users]
+    location = await Location.create(name="test", longitude=0, latitude=0)
+    event = await Event.create(
+        name=f"Test event", description=f"test", category="test", location=location, city="test", manager=manager,
+        queue_rate=60,
+    )
+    plan = await EventPlan.create(name="test", price=100, max_tickets=10, event=event)
+
+    response = await client.get(f"/tickets/queue/{event.id}", headers={"Authorization": tokens[0]})
+    assert response.status_code == 404
+
+    queue = []
+    for token in tokens:
+        response = await client.post("/tickets/queue", headers={"Authorization": token}, json={"event_id": event.id})
+        assert response.status_code == 200
+        queue.append(response.json())
+    assert [data["position"] for data in queue] == [0, 1, 2]
+    assert [data["wait"] for data in queue] == [0, 1, 2]
+
+    # Joining again keeps place in queue
+    response = await client.post("/tickets/queue", headers={"Authorization": tokens[1]}, json={"event_id": event.id})
+    assert response.json()["position"] == 1
+
+    for token, queue_token, status in (
+            (tokens[1], None, 403), (tokens[1], queue[1]["token"], 403), (tokens[1], queue[0]["token"], 403),
+            (tokens[0], queue[0]["token"], 200),
+    ):
+        response = await client.post("/tickets/request-payment", headers={"Authorization": token}, json={
+            "event_id": event.id, "plan_id": plan.id, "amount": 1, "queue_token": queue_token,
+        })
+        assert response.status_code == status
+
+    # Two more clients are admitted after two seconds
+    redis = await RedisCache._get_client()
+    last_key = WaitingRoom._keys(event.id)[2]
+    await redis.set(last_key, float(await redis.get(last_key)) - 2)
+    response = await client.get(f"/tickets/queue/{event.id}", headers={"Authorization": tokens[2]})
+    assert response.status_code == 200
+    assert response.json()["position"] == 0
+
+    response = await client.post("/tickets/request-payment", headers={"Authorization": tokens[1]}, json={
+        "event_id": event.id, "plan_id": plan.id, "amount": 1, "queue_token": queue[1]["token"],
+    })
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_cart_purchase(client: AsyncClient, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(Inventory, "_backend", DatabaseInventoryBackend())
+    orders = []
+
+    async def paypal_create(price: float) -> str:
+        orders.append(price)
+        return "test"
+
+    async def paypal_check(*args) -> bool:
+        return True
+
+    monkeypatch.setattr(PayPal, "create", paypal_create)
+    monkeypatch.setattr(PayPal, "check", paypal_check)
+
+    user = await create_test_user()
+    manager = await create_test_user(role=UserRole.MANAGER)
+    token = await create_session_token(user)
+    location = await Location.create(name="test", longitude=0, latitude=0)
+    event = await Event.create(
+        name=f"Test event", description=f"test", category="test", location=location, city="test", manager=manager,
+        start_time=datetime.now(UTC) + timedelta(days=7),
+    )
+    adult = await EventPlan.create(name="adult", price=100, max_tickets=10, event=event)
+    child = await EventPlan.create(name="child", price=40, max_tickets=3, event=event)
+    other = await EventPlan.create(name="other", price=1, max_tickets=10, event=await Event.create(
+        name=f"Test event", description=f"test", category="test", location=location, city="test", manager=manager,
+    ))
+
+    for items, status in (
+            ([{"plan_id": other.id}], 404), ([{"plan_id": adult.id}, {"plan_id": child.id, "amount": 4}], 400),
+    ):
+        response = await client.post("/tickets/request-cart-payment", headers={"Authorization": token}, json={
+            "event_id": event.id, "items": items,
+        })
+        assert response.status_code == status
+    # Nothing is reserved unless all plans have enough tickets
+    await adult.refresh_from_db()
+    assert adult.reserved_count == 0
+
+    response = await client.post("/tickets/request-cart-payment", headers={"Authorization": token}, json={
+        "event_id": event.id,
+        "items": [{"plan_id": adult.id}, {"plan_id": child.id, "amount": 2}, {"plan_id": adult.id}],
+    })
+    assert response.status_code == 200
+    cart = response.json()
+    assert cart["total_price"] == 280
+    assert len(cart["ticket_ids"]) == 2
+    # Payment of the cart can be handled through any of its tickets
+    ticket_id = cart["ticket_ids"][-1]
+    assert ticket_id != cart["ticket_id"]
+
+    response = await client.get("/tickets", headers={"Authorization": token})
+    assert sorted(ticket["amount"] for ticket in response.json()) == [2, 2]
+
+    response = await client.get(f"/tickets/{ticket_id}/check-verification", headers={"Authorization": token})
+    assert response.status_code == 200
+    assert response.json()["payment_state"] == PaymentState.AWAITING_VERIFICATION
+
+    response = await client.post(f"/tickets/{ticket_id}/verify-payment", headers={"Authorization": token}, json={})
+    assert response.status_code == 204
+    assert orders == [280]
+    response = await client.post(f"/tickets/{ticket_id}/check-payment", headers={"Authorization": token})
+    assert response.status_code == 204
+    await EventPlan.filter(id__in=[adult.id, child.id]).update(sold_count=0)
+    await Inventory.reconcile()
+    for plan in (adult, child):
+        await plan.refresh_from_db()
+        assert (plan.sold_count, plan.reserved_count) == (2, 0)
+
+    response = await client.get("/tickets", headers={"Authorization": token})
+    assert [ticket["payment"]["state"] for ticket in response.json()] == [PaymentState.DONE] * 2
+
+    for cart_ticket_id in cart["ticket_ids"]:
+        response = await client.get(f"/tickets/{cart_ticket_id}/validation-tokens", headers={"Authorization": token})
+        assert response.status_code == 200
+        assert len(response.json()) == 2
+
+    # Tickets bought together are cancelled together, only when client asks for it explicitly
+    for cart_ticket_id in cart["ticket_ids"]:
+        response = await client.delete(f"/tickets/{cart_ticket_id}", headers={"Authorization": token})
+        assert response.status_code == 400
+        assert "Cart" in response.json()["error_message"]
+    assert await Ticket.filter(id__in=cart["ticket_ids"]).count() == 2
+
+    response = await client.delete(f"/tickets/{cart['ticket_ids'][-1]}?cart=true", headers={"Authorization": token})
+    assert response.status_code == 204
+    assert not await Ticket.filter(id__in=cart["ticket_ids"]).exists()
+    for plan in (adult, child):
+        await plan.refresh_from_db()
+        assert (plan.sold_count, plan.reserved_count) == (0, 0)
@@ -164,10 +164,11 @@ async def test_enable_disable_mfa(client: AsyncClient):
     assert response.status_code == 400
     assert "authentication code" in response.json()["error_message"]
 
+    code = mfa.getCode()
     response = await client.patch("/users/me", headers={"Authorization": token}, json={
         "password": "123456789",
         "mfa_key": mfa_key,
-        "mfa_code": mfa.getCode(),
+        "mfa_code": code,
     })
     assert response.status_code == 200
     assert response.json()["mfa_enabled"]
@@ -198,9 +199,37 @@ async def test_enable_disable_mfa(client: AsyncClient):
     response = await client.patch("/users/me", headers={"Authorization": token}, json={
         "password": "123456789",
         "mfa_key": None,
-        "mfa_code": mfa.getCode(),
+        "mfa_code": code,
+    })
+    assert response.status_code == 400
+    assert "authentication code" in response.json()["error_message"]
+
+    response = await client.patch("/users/me", headers={"Authorization": token}, json={
+        "password": "123456789",
+        "mfa_key": None,
+        "mfa_code": mfa.getCode(time() + 30),
     })
     assert response.status_code == 200
     assert not response.json()["mfa_enabled"]
 
 
+@pytest.mark.asyncio
+async def test_get_user_info_conditional(client: AsyncClient):
+    user = await create_test_user()
+    token = await create_session_token(user)
+
+    response = await client.get("/users/me", headers={"Authorization": token})
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = await client.get("/users/me", headers={"Authorization": token, "If-None-Match": f"\"a\", {etag}"})
+    assert response.status_code == 304
+
+    response = await client.patch("/users/me", headers={"Authorization": token}, json={
+        "first_name": "Changed", "password": "123456789",
+    })
+    assert response.status_code == 200
+
+    response = await client.get("/users/me", headers={"Authorization": token, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["first_name"] == "Changed"
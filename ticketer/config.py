@@ -8,6 +8,14 @@ from s3lite import Client
 OAUTH_GOOGLE_CLIENT_ID = environ["OAUTH_GOOGLE_CLIENT_ID"]
 OAUTH_GOOGLE_CLIENT_SECRET = environ["OAUTH_GOOGLE_CLIENT_SECRET"]
 OAUTH_GOOGLE_REDIRECT = "http://127.0.0.1:8000/auth/google/callback"
+GOOGLE_REFRESH_INTERVAL = int(environ.get("GOOGLE_REFRESH_INTERVAL", 300))
+GOOGLE_REFRESH_AHEAD = int(environ.get("GOOGLE_REFRESH_AHEAD", 600))  # Refresh tokens expiring in that many seconds
+GOOGLE_REFRESH_BATCH_SIZE = int(environ.get("GOOGLE_REFRESH_BATCH_SIZE", 500))
+GOOGLE_REFRESH_CONCURRENCY = int(environ.get("GOOGLE_REFRESH_CONCURRENCY", 8))
+GOOGLE_REFRESH_BACKOFF = int(environ.get("GOOGLE_REFRESH_BACKOFF", 60))
+GOOGLE_REFRESH_MAX_BACKOFF = int(environ.get("GOOGLE_REFRESH_MAX_BACKOFF", 3600))
+GOOGLE_REFRESH_BREAKER_THRESHOLD = int(environ.get("GOOGLE_REFRESH_BREAKER_THRESHOLD", 10))
+GOOGLE_REFRESH_BREAKER_RESET_TIMEOUT = float(environ.get("GOOGLE_REFRESH_BREAKER_RESET_TIMEOUT", 300))
 
 FCM_CONFIG = environ.get("FCM_CONFIG", "fcm_config.json")
 
@@ -15,9 +23,91 @@ JWT_KEY = b64decode(environ["JWT_KEY"])
 
 RECAPTCHA_SITEKEY = environ.get("RECAPTCHA_SITEKEY", "6LeIxAcTAAAAAJcZVRqyHh71UMIEGNQ_MXjiZKhI")
 RECAPTCHA_SECRET = environ.get("RECAPTCHA_SECRET", "6LeIxAcTAAAAAGG-vFI1TnRWxMZNFuojJ4WifJWe")
+RECAPTCHA_TIMEOUT = float(environ.get("RECAPTCHA_TIMEOUT", 3))
+# What to do when google is unreachable or the circuit breaker is open: accept (fail-open) or reject (fail-closed)
+RECAPTCHA_FAIL_OPEN = environ.get("RECAPTCHA_FAIL_OPEN", "0").lower() in ("1", "true")
+RECAPTCHA_BREAKER_THRESHOLD = int(environ.get("RECAPTCHA_BREAKER_THRESHOLD", 5))
+RECAPTCHA_BREAKER_RESET_TIMEOUT = float(environ.get("RECAPTCHA_BREAKER_RESET_TIMEOUT", 30))
+RECAPTCHA_CACHE_TTL = int(environ.get("RECAPTCHA_CACHE_TTL", 120))
+MFA_WINDOW = int(environ.get("MFA_WINDOW", 1))
 
 DB_CONNECTION_STRING = environ.get("DB_CONNECTION_STRING", "sqlite://ticketer.db")
 REDIS_URL = environ.get("REDIS_URL", "redis://localhost")
+# Maximum number of full-text search matches considered by event search
+SEARCH_MAX_MATCHES = int(environ.get("SEARCH_MAX_MATCHES", 1000))
+# Cached search results are invalidated by event writes, ttl only bounds memory usage
+SEARCH_CACHE_TTL = int(environ.get("SEARCH_CACHE_TTL", 3600))
+# Cache-Control max-age of public event reads, clients revalidate them with If-None-Match afterwards
+EVENT_HTTP_MAX_AGE = int(environ.get("EVENT_HTTP_MAX_AGE", 30))
+# Geo search: locations are indexed by geohash, queries load events of at most GEO_MAX_CELLS cells
+# (of finest precision up to GEO_MAX_PRECISION) that cover searched area, events of every cell are cached separately.
+# At most GEO_CELL_MAX_EVENTS (earliest) events are loaded per cell, viewports spanning more than GEO_VIEWPORT_MAX_SPAN
+# degrees (of latitude or longitude) are rejected
+GEO_MAX_RADIUS = float(environ.get("GEO_MAX_RADIUS", 200))
+GEO_MAX_CELLS = int(environ.get("GEO_MAX_CELLS", 16))
+GEO_MAX_PRECISION = int(environ.get("GEO_MAX_PRECISION", 7))
+GEO_CELL_CACHE_TTL = int(environ.get("GEO_CELL_CACHE_TTL", 3600))
+GEO_VIEWPORT_LIMIT = int(environ.get("GEO_VIEWPORT_LIMIT", 500))
+GEO_VIEWPORT_MAX_SPAN = float(environ.get("GEO_VIEWPORT_MAX_SPAN", 10))
+GEO_CELL_MAX_EVENTS = int(environ.get("GEO_CELL_MAX_EVENTS", 2000))
+
+# Prefix of all RedisCache keys, bump it to drop previously cached data
+CACHE_VERSION = environ.get("CACHE_VERSION", "5")
+# In-process cache in front of redis, disabled if size is 0
+CACHE_LOCAL_SIZE = int(environ.get("CACHE_LOCAL_SIZE", 0))
+CACHE_LOCAL_TTL = float(environ.get("CACHE_LOCAL_TTL", 5))
+# Expired entries computed with RedisCache.get_or_compute are served for that long while being recomputed
+CACHE_STALE_TTL = int(environ.get("CACHE_STALE_TTL", 30))
+CACHE_LOCK_TIMEOUT = float(environ.get("CACHE_LOCK_TIMEOUT", 5))
+
+SESSION_CACHE_TTL = int(environ.get("SESSION_CACHE_TTL", 300))
+SESSION_CACHE_LOCAL_TTL = int(environ.get("SESSION_CACHE_LOCAL_TTL", 5))
+SESSION_CACHE_LOCAL_SIZE = int(environ.get("SESSION_CACHE_LOCAL_SIZE", 10000))
+
+PASSWORD_HASH_EXECUTOR = environ.get("PASSWORD_HASH_EXECUTOR", "thread")  # "thread" or "process"
+PASSWORD_HASH_WORKERS = int(environ.get("PASSWORD_HASH_WORKERS", 4))
+PASSWORD_HASH_MAX_PENDING = int(environ.get("PASSWORD_HASH_MAX_PENDING", 64))
+PASSWORD_HASH_ROUNDS = int(environ.get("PASSWORD_HASH_ROUNDS", 12))
+
+REVOCATION_FILTER_BITS = int(environ.get("REVOCATION_FILTER_BITS", 1 << 23))
+REVOCATION_FILTER_HASHES = int(environ.get("REVOCATION_FILTER_HASHES", 7))
+REVOCATION_RESYNC_INTERVAL = int(environ.get("REVOCATION_RESYNC_INTERVAL", 600))
+
+SESSION_GC_INTERVAL = int(environ.get("SESSION_GC_INTERVAL", 3600))
+SESSION_GC_BATCH_SIZE = int(environ.get("SESSION_GC_BATCH_SIZE", 1000))
+SESSION_GC_MAX_BATCHES = int(environ.get("SESSION_GC_MAX_BATCHES", 100))
+
+# "redis": remaining tickets of plans are counted in redis, "database": sold/reserved tickets are counted in plan rows.
+# Counters are reconciled with database on startup and periodically
+INVENTORY_BACKEND = environ.get("INVENTORY_BACKEND", "redis")
+INVENTORY_RECONCILE_INTERVAL = int(environ.get("INVENTORY_RECONCILE_INTERVAL", 300))
+# Reservation is forgotten if ticket was not created within that time
+INVENTORY_PENDING_TIMEOUT = int(environ.get("INVENTORY_PENDING_TIMEOUT", 60))
+INVENTORY_KEY_TTL = int(environ.get("INVENTORY_KEY_TTL", 86400))
+# Events with queue_rate set admit that many clients per minute from waiting room, admitted clients have
+# WAITING_ROOM_ADMISSION_TTL seconds to request tickets
+WAITING_ROOM_ADMISSION_TTL = int(environ.get("WAITING_ROOM_ADMISSION_TTL", 300))
+WAITING_ROOM_TOKEN_TTL = int(environ.get("WAITING_ROOM_TOKEN_TTL", 3600))
+# Tickets with unpaid expired payments are deleted (and returned to inventory) in background
+PAYMENT_REAPER_INTERVAL = int(environ.get("PAYMENT_REAPER_INTERVAL", 30))
+PAYMENT_REAPER_BATCH_SIZE = int(environ.get("PAYMENT_REAPER_BATCH_SIZE", 500))
+PAYMENT_REAPER_MAX_BATCHES = int(environ.get("PAYMENT_REAPER_MAX_BATCHES", 20))
+# Facet counters are maintained on event writes, periodic rebuild only fixes drift
+FACETS_REBUILD_INTERVAL = int(environ.get("FACETS_REBUILD_INTERVAL", 3600))
+
+HTTP2_ENABLED = environ.get("HTTP2_ENABLED", "0").lower() in ("1", "true")
+_HTTP_CLIENT_DEFAULTS = {
+    "timeout": 10.0, "connect_timeout": 5.0, "max_connections": 50, "max_keepalive_connections": 10,
+    "keepalive_expiry": 30.0,
+}
+HTTP_CLIENTS = {
+    "default": _HTTP_CLIENT_DEFAULTS,
+    "recaptcha": _HTTP_CLIENT_DEFAULTS | {
+        "timeout": RECAPTCHA_TIMEOUT, "connect_timeout": 2.0, "max_connections": 20,
+    },
+    "paypal": _HTTP_CLIENT_DEFAULTS | {"timeout": float(environ.get("PAYPAL_TIMEOUT", 15))},
+    "google": _HTTP_CLIENT_DEFAULTS | {"timeout": float(environ.get("GOOGLE_TIMEOUT", 10)), "max_connections": 20},
+}
 
 S3_ACCESS_KEY_ID = environ.get("S3_ACCESS_KEY_ID", None)
 S3_SECRET_ACCESS_KEY = environ.get("S3_SECRET_ACCESS_KEY", None)
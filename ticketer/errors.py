@@ -40,3 +40,13 @@ class Errors:
     INSUFFICIENT_PERMISSIONS = ErrorMessageException(403, 33, "Insufficient permissions.")
 
     INVALID_ROLE = ErrorMessageException(400, 34, "Invalid role.")
+
+    SERVICE_BUSY = ErrorMessageException(503, 35, "Service is busy, try again later.")
+    INVALID_CURSOR = ErrorMessageException(400, 36, "Invalid cursor.")
+    INVALID_COORDINATES = ErrorMessageException(400, 37, "Invalid coordinates.")
+    INVALID_RADIUS = ErrorMessageException(400, 38, "Invalid radius.")
+    NOT_ADMITTED = ErrorMessageException(403, 39, "You are not admitted from waiting room yet.")
+    NOT_IN_QUEUE = ErrorMessageException(404, 40, "You are not in waiting room.")
+    INVALID_QUEUE_RATE = ErrorMessageException(400, 41, "Invalid queue_rate.")
+    CART_TICKET_CANNOT_CANCEL = ErrorMessageException(400, 42, "Cart tickets can only be cancelled together.")
+    VIEWPORT_TOO_LARGE = ErrorMessageException(400, 43, "Viewport is too large.")
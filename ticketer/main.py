@@ -9,7 +9,19 @@ from tortoise.contrib.fastapi import register_tortoise
 
 from ticketer import config
 from ticketer.exceptions import CustomBodyException
+from ticketer.models import Location
 from ticketer.routers import admin, auth, users_me, events, tickets, admin_ui
+from ticketer.utils.background import BackgroundTasks
+from ticketer.utils.cache import RedisCache
+from ticketer.utils.facets import EventFacets
+from ticketer.utils.http import HttpClients
+from ticketer.utils.inventory import Inventory
+from ticketer.utils.oauth_refresh import refresh_expiring_google_tokens
+from ticketer.utils.password import PasswordHasher
+from ticketer.utils.payment_reaper import reap_expired_payments
+from ticketer.utils.revocation import SessionRevocation
+from ticketer.utils.search import EventSearch
+from ticketer.utils.session_gc import collect_expired_sessions
 
 app = FastAPI(openapi_url=None)
 
@@ -19,6 +31,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 app.include_router(admin.router)
 app.include_router(auth.router)
@@ -48,6 +61,11 @@ async def migrate_orm():  # pragma: no cover
     await Tortoise.close_connections()
 
 
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await BackgroundTasks.stop()
+
+
 register_tortoise(
     app,
     db_url=config.DB_CONNECTION_STRING,
@@ -56,6 +74,47 @@ register_tortoise(
 )
 
 
+@app.on_event("startup")
+async def setup_search():
+    await EventSearch.setup()
+    await Location.backfill_geohash()
+
+
+BackgroundTasks.add(SessionRevocation.listen)
+BackgroundTasks.add(RedisCache.listen)
+BackgroundTasks.add_periodic(SessionRevocation.resync, config.REVOCATION_RESYNC_INTERVAL)
+BackgroundTasks.add_periodic(collect_expired_sessions, config.SESSION_GC_INTERVAL, single_worker=True)
+BackgroundTasks.add_periodic(refresh_expiring_google_tokens, config.GOOGLE_REFRESH_INTERVAL, single_worker=True)
+BackgroundTasks.add_periodic(EventFacets.rebuild, config.FACETS_REBUILD_INTERVAL, single_worker=True)
+BackgroundTasks.add_periodic(Inventory.reconcile, config.INVENTORY_RECONCILE_INTERVAL, single_worker=True)
+BackgroundTasks.add_periodic(reap_expired_payments, config.PAYMENT_REAPER_INTERVAL, single_worker=True)
+
+
+@app.on_event("startup")
+async def reconcile_inventory():
+    await Inventory.reconcile()
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    await BackgroundTasks.start()
+
+
+@app.on_event("startup")
+async def open_http_clients():
+    await HttpClients.open()
+
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await HttpClients.close()
+
+
+@app.on_event("shutdown")
+async def shutdown_password_hasher():
+    PasswordHasher.shutdown()
+
+
 # noinspection PyUnusedLocal
 @app.exception_handler(CustomBodyException)
 async def custom_exception_handler(request: Request, exc: CustomBodyException):
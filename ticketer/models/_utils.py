@@ -1,7 +1,20 @@
+from typing import Self
+
 import tortoise
 
 
 class Model(tortoise.Model):
+    @classmethod
+    def from_saved(cls, **kwargs) -> Self:
+        """
+        Builds instance of already saved row from its fields (e.g. cached ones) without querying database,
+        so it can be updated and referenced like fetched one.
+        """
+
+        obj = cls(**kwargs)
+        obj._saved_in_db = True
+        return obj
+
     async def update(self, **kwargs) -> None:
         await self.update_from_dict(kwargs)
         await self.save()
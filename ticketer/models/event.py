@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from datetime import datetime
+from datetime import datetime, UTC
+from functools import partial
 
 from tortoise import fields
 
@@ -14,11 +15,13 @@ class Event(Model):
     description: str = fields.TextField()
     category: str = fields.CharField(max_length=64)
     city: str = fields.CharField(max_length=128)
-    start_time: datetime = fields.DatetimeField(default=datetime.now)
+    start_time: datetime = fields.DatetimeField(default=partial(datetime.now, UTC))
     end_time: datetime | None = fields.DatetimeField(null=True, default=None)
-    location: models.Location = fields.ForeignKeyField("models.Location")
+    location: models.Location = fields.ForeignKeyField("models.Location", index=True)
     image_id: str | None = fields.CharField(max_length=64, null=True, default=None)
     manager: models.User = fields.ForeignKeyField("models.User")
+    # Clients admitted per minute from waiting room, 0 if tickets are sold without waiting room
+    queue_rate: int = fields.IntField(default=0)
 
     plans: fields.ReverseRelation[models.EventPlan]
 
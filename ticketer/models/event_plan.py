@@ -11,8 +11,24 @@ class EventPlan(Model):
     name: str = fields.CharField(max_length=255)
     price: float = fields.FloatField()
     max_tickets: int = fields.SmallIntField()
+    # Maintained only with database inventory backend
+    sold_count: int = fields.IntField(default=0)
+    reserved_count: int = fields.IntField(default=0)
     event: models.Event = fields.ForeignKeyField("models.Event")
 
+    @classmethod
+    async def for_events(cls, event_ids: list[int]) -> dict[int, list[EventPlan]]:
+        """
+        Loads plans of all given events with one query, grouped by event id.
+        """
+
+        plans = {event_id: [] for event_id in event_ids}
+        if event_ids:
+            for plan in await cls.filter(event_id__in=event_ids).order_by("id"):
+                plans[plan.event_id].append(plan)
+
+        return plans
+
     def to_json(self) -> dict:
         return {
             "id": self.id,
@@ -13,7 +13,7 @@ class ExternalAuth(Model):
     user: models.User = fields.ForeignKeyField("models.User", unique=True)
     access_token: str = fields.TextField()
     refresh_token: str | None = fields.TextField(null=True)
-    expires_at: int | None = fields.BigIntField(null=True)
+    expires_at: int | None = fields.BigIntField(null=True, index=True)
 
     def expired(self) -> bool:
         return (time() > self.expires_at) if self.expires_at is not None else False
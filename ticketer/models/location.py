@@ -1,10 +1,27 @@
 from tortoise import fields
 
 from ticketer.models._utils import Model
+from ticketer.utils import geo
 
 
 class Location(Model):
+    GEOHASH_PRECISION = 9
+
     id: int = fields.BigIntField(pk=True)
     name: str = fields.CharField(max_length=255)
     longitude: float = fields.FloatField()
     latitude: float = fields.FloatField()
+    geohash: str = fields.CharField(max_length=12, default="", index=True)
+
+    async def save(self, *args, **kwargs) -> None:
+        self.geohash = geo.encode(self.latitude, self.longitude, self.GEOHASH_PRECISION)
+        await super().save(*args, **kwargs)
+
+    @classmethod
+    async def backfill_geohash(cls) -> None:
+        """
+        Fills geohash of locations created before it was added
+        """
+
+        for location in await cls.filter(geohash=""):
+            await location.save(update_fields=["geohash"])
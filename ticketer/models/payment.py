@@ -24,6 +24,10 @@ class Payment(Model):
     paypal_id: str | None = fields.CharField(max_length=255, null=True, default=None)
     expires_at: datetime = fields.DatetimeField(default=gen_expires_at)
 
+    class Meta:
+        # Used by payment reaper to find expired unpaid payments
+        indexes = (("state", "expires_at"),)
+
     def expired(self) -> bool:
         return self.expires_at.replace(tzinfo=UTC) < datetime.now(UTC)
 
@@ -22,7 +22,9 @@ class AuthSession(Model):
     id: int = fields.BigIntField(pk=True)
     user: models.User = fields.ForeignKeyField("models.User")
     token: str = fields.CharField(max_length=64, default=gen_token)
-    expires: datetime = fields.DatetimeField(default=gen_expires_at)
+    expires: datetime = fields.DatetimeField(default=gen_expires_at, index=True)
+    # Revoked sessions are kept until they expire, so revocations survive loss of redis
+    revoked: bool = fields.BooleanField(default=False)
 
     def to_jwt(self) -> str:
         return JWT.encode(
@@ -3,6 +3,7 @@ from __future__ import annotations
 from datetime import datetime, timedelta, UTC
 
 from tortoise import fields
+from tortoise.expressions import Q
 
 from ticketer import models
 from ticketer.models._utils import Model
@@ -13,11 +14,30 @@ class Ticket(Model):
     amount: int = fields.SmallIntField()
     event_plan: models.EventPlan = fields.ForeignKeyField("models.EventPlan")
     user: models.User = fields.ForeignKeyField("models.User")
+    # Tickets bought in one cart share payment of its first ticket, None for tickets with their own payment
+    cart_ticket: Ticket | None = fields.ForeignKeyField(
+        "models.Ticket", related_name="cart_tickets", null=True, default=None,
+    )
     _payment: models.Payment | None = None
 
+    @property
+    def payment_ticket_id(self) -> int:
+        return self.cart_ticket_id if self.cart_ticket_id is not None else self.id
+
+    @classmethod
+    async def paid_with(cls, payment_ticket_id: int) -> list[Ticket]:
+        """
+        Returns tickets (with their plans) paid with payment of given ticket, more than one if they were bought in one
+        cart. Ticket owning payment is the last one, so deleting tickets in that order doesn't delete payment early.
+        """
+
+        tickets = await cls.filter(Q(id=payment_ticket_id) | Q(cart_ticket_id=payment_ticket_id))\
+            .select_related("event_plan")
+        return sorted(tickets, key=lambda ticket: (ticket.cart_ticket_id is None, ticket.id))
+
     async def get_payment(self) -> models.Payment:
         if self._payment is None:
-            self._payment = await models.Payment.get(ticket=self)
+            self._payment = await models.Payment.get(ticket_id=self.payment_ticket_id)
 
         return self._payment
 
@@ -61,6 +61,16 @@ class EventWithPlansData(EventData):
     plans: list[EventPlanData]
 
 
+class EventWithDistanceData(EventData):
+    distance: float
+
+
+class EventFacetsData(BaseModel):
+    category: dict[str, int]
+    city: dict[str, int]
+    month: dict[str, int]
+
+
 class AdminTicketValidationUserData(BaseModel):
     first_name: str
     last_name: str
@@ -92,6 +102,16 @@ class BuyTicketRespData(BaseModel):
     expires_at: int
 
 
+class BuyCartRespData(BuyTicketRespData):
+    ticket_ids: list[int]
+
+
+class QueueData(BaseModel):
+    token: str
+    position: int
+    wait: int
+
+
 class BuyTicketVerifiedData(BaseModel):
     ticket_id: int
     payment_state: int
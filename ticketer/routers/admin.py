@@ -12,8 +12,14 @@ from ticketer.models import User, UserRole, Location, Event, EventPlan
 from ticketer.response_schemas import AdminUserData, EventData, AdminTicketValidationData
 from ticketer.schemas import AdminUserSearchData, AddEventData, EditEventData, TicketValidationData, AdminUserEditData
 from ticketer.utils import open_image_b64, upload_image_or_not
+from ticketer.utils.event_cache import invalidate_event
+from ticketer.utils.facets import EventFacets
 from ticketer.utils.jwt import JWT
 from ticketer.utils.jwt_auth import jwt_auth_role
+from ticketer.utils.metrics import Metrics
+from ticketer.utils.revocation import SessionRevocation
+from ticketer.utils.search import INDEXED_FIELDS
+from ticketer.utils.session_cache import SessionCache
 
 router = APIRouter(prefix="/admin")
 
@@ -44,6 +50,7 @@ async def edit_user(user_id: int, data: AdminUserEditData, admin: User = Depends
 
     await upload_image_or_not("avatar", args, "avatar", 640, 640)
     await user.update(**args)
+    await SessionCache.invalidate_user(user.id)
 
     return user.to_json(True)
 
@@ -56,6 +63,7 @@ async def ban_user(user_id: int, user: User = Depends(jwt_auth_role(UserRole.ADM
         raise Errors.CANNOT_BAN
 
     await user_to_ban.update(banned=True)
+    await SessionRevocation.revoke_user(user_to_ban.id)
 
 
 @router.post("/users/{user_id}/unban", status_code=204)
@@ -66,6 +74,12 @@ async def ban_user(user_id: int, user: User = Depends(jwt_auth_role(UserRole.ADM
         raise Errors.CANNOT_UNBAN
 
     await user_to_unban.update(banned=False)
+    await SessionCache.invalidate_user(user_to_unban.id)
+
+
+@router.get("/metrics", response_model=dict)
+async def get_metrics(user: User = Depends(jwt_auth_role(UserRole.ADMIN))):
+    return Metrics.snapshot()
 
 
 @router.get("/events", response_model=list[EventData])
@@ -94,6 +108,8 @@ async def add_event(data: AddEventData, user: User = Depends(jwt_auth_role(UserR
     event = await Event.create(manager=user, **create_args)
     for plan in data.plans:
         await EventPlan.create(**plan.model_dump(), event=event)
+    await invalidate_event(event)
+    await EventFacets.update(None, EventFacets.of(event))
 
     return event.to_json()
 
@@ -118,11 +134,16 @@ async def edit_event(event_id: int, data: EditEventData, user: User = Depends(jw
 
     await upload_image_or_not("event", args)
 
+    old_city, old_category, old_location_id = event.city, event.category, event.location_id
+    old_facets = EventFacets.of(event)
     await event.update(**args)
     if data.plans is not None:
         await EventPlan.filter(event=event).delete()
         for plan in data.plans:
             await EventPlan.create(**plan.model_dump(), event=event)
+    await invalidate_event(event, old_city, old_category, old_location_id,
+                           content_only=not args.keys() & {*INDEXED_FIELDS, "start_time", "location"})
+    await EventFacets.update(old_facets, EventFacets.of(event))
 
     return event.to_json()
 
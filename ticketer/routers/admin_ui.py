@@ -4,7 +4,6 @@ from time import time
 from typing import Annotated
 from uuid import uuid4
 
-from bcrypt import checkpw
 from fastapi import FastAPI, HTTPException, Form, Depends, Header, UploadFile
 from fastui import FastUI, AnyComponent, components as c, prebuilt_html
 from fastui.components.display import DisplayLookup
@@ -19,7 +18,13 @@ from ticketer.config import S3
 from ticketer.errors import Errors
 from ticketer.models import User, UserRole, AuthSession, Event, Location, EventPlan, UserPydantic, EventPydantic, \
     EventPlanPydantic
+from ticketer.utils.event_cache import invalidate_event
+from ticketer.utils.facets import EventFacets
 from ticketer.utils.jwt import JWT
+from ticketer.utils.jwt_auth import get_session_user
+from ticketer.utils.password import PasswordHasher
+from ticketer.utils.revocation import SessionRevocation
+from ticketer.utils.session_cache import SessionCache
 
 app = FastAPI()
 
@@ -31,18 +36,12 @@ class LoginForm(BaseModel):
 
 async def auth_admin(authorization: str = Header(default="")) -> User | None:
     authorization = authorization.split(" ")[-1]
-    if not authorization or (data := JWT.decode(authorization, config.JWT_KEY)) is None:
+    if not authorization or (data := JWT.decode(authorization, config.JWT_KEY, require_exp=True)) is None:
         return
-    if "user" not in data or "session" not in data or "token" not in data:
+    if (user := await get_session_user(data)) is None or user.role < UserRole.MANAGER:
         return
 
-    sess = await AuthSession.get_or_none(
-        id=data["session"], user__id=data["user"], token=data["token"], user__role__gte=UserRole.MANAGER,
-    ).select_related("user")
-    if sess is None:
-        return
-
-    return sess.user
+    return user
 
 
 def user_redirect_to(user: User) -> str:
@@ -80,7 +79,7 @@ async def admin_login_post(form: Annotated[LoginForm, fastui_form(LoginForm)]) -
     if (user := await User.get_or_none(email=form.email, role__gte=UserRole.MANAGER)) is None:
         raise Errors.WRONG_CREDENTIALS
 
-    if not checkpw(form.password.encode("utf8"), user.password.encode("utf8")):
+    if not await PasswordHasher.check(form.password, user.password):
         raise Errors.WRONG_CREDENTIALS
 
     session = await AuthSession.create(user=user)
@@ -129,6 +128,7 @@ async def edit_user(user_id: int, first_name: str = Form(), last_name: str = For
         last_name=last_name,
         role=role,
     )
+    await SessionCache.invalidate_user(user.id)
 
     return [c.FireEvent(event=GoToEvent(url=f"/admin-ui/users/{user_id}?{int(time())}"))]
 
@@ -143,6 +143,7 @@ async def ban_user(user_id: int, admin: User | None = Depends(auth_admin)):
         raise HTTPException(status_code=404, detail="User not found")
 
     await user.update(banned=True)
+    await SessionRevocation.revoke_user(user.id)
     return [c.FireEvent(event=GoToEvent(url=f"/admin-ui/users/{user_id}?{int(time())}"))]
 
 
@@ -156,6 +157,7 @@ async def unban_user(user_id: int, admin: User | None = Depends(auth_admin)):
         raise HTTPException(status_code=404, detail="User not found")
 
     await user.update(banned=False)
+    await SessionCache.invalidate_user(user.id)
     return [c.FireEvent(event=GoToEvent(url=f"/admin-ui/users/{user_id}?{int(time())}"))]
 
 
@@ -265,6 +267,8 @@ async def edit_event(event_id: int, name: str = Form(), description: str = Form(
     if (event := await Event.get_or_none(id=event_id, manager=admin)) is None:
         raise HTTPException(status_code=404, detail="Event not found")
 
+    old_city, old_category = event.city, event.category
+    old_facets = EventFacets.of(event)
     await event.update(
         name=name,
         description=description,
@@ -272,6 +276,8 @@ async def edit_event(event_id: int, name: str = Form(), description: str = Form(
         city=city,
         image_id=await event_upload_image(image),
     )
+    await invalidate_event(event, old_city, old_category)
+    await EventFacets.update(old_facets, EventFacets.of(event))
 
     return [c.FireEvent(event=GoToEvent(url=f"/admin-ui/events/{event_id}?{int(time())}"))]
 
@@ -309,6 +315,8 @@ async def add_event(name: str = Form(), description: str = Form(), category: str
         image_id=await event_upload_image(image),
     )
     await EventPlan.create(name="Basic", price=price, max_tickets=max_tickets, event=event)
+    await invalidate_event(event)
+    await EventFacets.update(None, EventFacets.of(event))
 
     return [c.FireEvent(event=GoToEvent(url=f"/admin-ui/events/{event.id}?{int(time())}"))]
 
@@ -324,6 +332,7 @@ async def add_event_plan(event_id: int, name: str = Form(), max_tickets: int = F
         raise HTTPException(status_code=404, detail="Event not found")
 
     await EventPlan.create(name=name, price=price, max_tickets=max_tickets, event=event)
+    await invalidate_event(event, content_only=True)
 
     return [c.FireEvent(event=GoToEvent(url=f"/admin-ui/events/{event.id}?{int(time())}"))]
 
@@ -432,7 +441,8 @@ async def event_info(event_id: int, admin: User | None = Depends(auth_admin)) ->
     if (event := await Event.get_or_none(id=event_id, manager=admin)) is None:
         raise HTTPException(status_code=404, detail="Event not found")
 
-    events = [await EventPlanPydantic.from_tortoise_orm(plan) for plan in await EventPlan.filter(event=event)]
+    plans = await EventPlan.for_events([event.id])
+    events = [await EventPlanPydantic.from_tortoise_orm(plan) for plan in plans[event.id]]
     event = await EventPydantic.from_tortoise_orm(event)
     return [
         c.Page(
@@ -1,7 +1,7 @@
+from datetime import datetime, UTC
 from time import time
 
-from bcrypt import hashpw, gensalt, checkpw
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 
 from ticketer import config
 from ticketer.errors import Errors
@@ -10,9 +10,11 @@ from ticketer.response_schemas import SuccessAuthData, GoogleAuthUrlData, Connec
 from ticketer.schemas import LoginData, RegisterData, GoogleOAuthData
 from ticketer.utils.google_oauth import authorize_google
 from ticketer.utils.jwt import JWT
-from ticketer.utils.jwt_auth import jwt_auth
+from ticketer.utils.jwt_auth import jwt_auth, jwt_auth_session
 from ticketer.utils.mfa import MFA
+from ticketer.utils.password import PasswordHasher
 from ticketer.utils.recaptcha import ReCaptcha
+from ticketer.utils.revocation import SessionRevocation
 
 router = APIRouter(prefix="/auth")
 
@@ -24,7 +26,7 @@ async def register(data: RegisterData):
     if await User.filter(email=data.email).exists():
         raise Errors.USER_EXISTS
 
-    password_hash = hashpw(data.password.encode("utf8"), gensalt()).decode()
+    password_hash = await PasswordHasher.hash(data.password)
     user = await User.create(
         email=data.email, password=password_hash, first_name=data.first_name, last_name=data.last_name
     )
@@ -43,18 +45,26 @@ async def login(data: LoginData):
     if user.banned:
         raise Errors.USER_BANNED
 
-    if not checkpw(data.password.encode("utf8"), user.password.encode("utf8")):
+    if not await PasswordHasher.check(data.password, user.password):
         raise Errors.WRONG_CREDENTIALS
 
     if user.mfa_key is not None:
         mfa = MFA(user.mfa_key)
-        if data.mfa_code not in mfa.getCodes():
+        if not await mfa.verify_once(data.mfa_code, user.id):
             raise Errors.WRONG_MFA_CODE
 
     session = await AuthSession.create(user=user)
     return {"token": session.to_jwt(), "expires_at": int(session.expires.timestamp())}
 
 
+# noinspection PyUnusedLocal
+@router.post("/logout", status_code=204)
+async def logout(request: Request, data: dict = Depends(jwt_auth_session), user: User = Depends(jwt_auth)):
+    # Token is revoked by its claims even if session row was already deleted, otherwise it would stay valid until exp
+    expires = datetime.fromtimestamp(JWT.expires_at(request.headers["authorization"]), UTC)
+    await SessionRevocation.revoke_session(data["session"], data["token"], expires)
+
+
 @router.get("/google", response_model=GoogleAuthUrlData)
 async def google_auth_link():
     return {
@@ -1,75 +1,236 @@
+import asyncio
 from datetime import datetime, UTC
 from typing import Literal
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from pydantic import TypeAdapter
+from tortoise.expressions import Q
 
+from ticketer import config
 from ticketer.errors import Errors
 from ticketer.models import Event, EventPlan
-from ticketer.response_schemas import EventWithPlansData, EventData
-from ticketer.schemas import EventSearchData
+from ticketer.response_schemas import EventWithPlansData, EventData, EventWithDistanceData, EventFacetsData
+from ticketer.schemas import EventSearchData, EventNearbyData, EventViewportData, EventGeoFilterData
+from ticketer.utils import geo
 from ticketer.utils.cache import RedisCache
+from ticketer.utils.event_cache import search_tags, event_tag, geo_tag
+from ticketer.utils.facets import EventFacets
+from ticketer.utils.pagination import encode_cursor, decode_cursor
+from ticketer.utils.responses import encode_response, cached_response
+from ticketer.utils.search import EventSearch
 
 router = APIRouter(prefix="/events")
 
+_search_adapter = TypeAdapter(list[EventWithPlansData] | list[EventData])
+_event_adapter = TypeAdapter(EventWithPlansData | EventData)
 
-@router.post("/search", response_model=list[EventWithPlansData] | list[EventData])
-async def search_events(data: EventSearchData, sort_by: Literal["name", "category", "start_time"] | None = None,
-                        sort_direction: Literal["asc", "desc"] = "asc", results_per_page: int = 10, page: int = 1,
-                        with_plans: bool = False):
-    page = max(page, 1)
-    results_per_page = min(results_per_page, 50)
-    results_per_page = max(results_per_page, 5)
 
-    cache_params = (page, results_per_page, data.name, data.category, data.city, data.time_min, data.time_max, sort_by,
-                    sort_direction, with_plans)
-    cached = await RedisCache.get("search", *cache_params)
-    if cached is not None:  # pragma: no cover
-        return cached
+def _plan_json(plan: EventPlan) -> dict:
+    return plan.to_json() | {"max_tickets": plan.max_tickets}
+
+
+def _cursor_value(event: Event, field: str) -> str | int:
+    value = getattr(event, field)
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _after_cursor(field: str, descending: bool, position: dict) -> Q:
+    op = "lt" if descending else "gt"
+    if not isinstance(last_id := position.get("id"), int):
+        raise Errors.INVALID_CURSOR
+    if field == "id":
+        return Q(**{f"id__{op}": last_id})
+
+    value = position.get("value")
+    if not isinstance(value, str):
+        raise Errors.INVALID_CURSOR
+    if field == "start_time":
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            raise Errors.INVALID_CURSOR
+
+    return Q(**{f"{field}__{op}": value}) | Q(**{field: value, f"id__{op}": last_id})
+
+
+async def _search(data: EventSearchData, sort_by: str | None, sort_direction: str, results_per_page: int, page: int,
+                  with_plans: bool, cursor: str | None) -> tuple[dict, dict[str, int]]:
+    # Generations of result set tags are taken before querying, so writes made meanwhile invalidate this entry
+    generations = await RedisCache.tag_generations(search_tags(data.city, data.category))
+
+    # Without sort_by, full-text search results are ordered by relevance and other results by id
+    relevance = sort_by is None and bool(data.name)
+    order_field = sort_by or "id"
+    cursor_sort = ["relevance" if relevance else order_field, sort_direction]
+    position = None
+    if cursor is not None:
+        position = decode_cursor(cursor)
+        if position is None or position.get("sort") != cursor_sort:
+            raise Errors.INVALID_CURSOR
 
     query_args = data.model_dump(exclude_defaults=True, exclude={"time_min", "time_max"})
     if data.time_max:
         query_args["start_time__lte"] = datetime.fromtimestamp(data.time_max, UTC)
     if data.time_min:
         query_args["start_time__gte"] = datetime.fromtimestamp(data.time_min, UTC)
+
+    matches = None
     if data.name:
         del query_args["name"]
-        query_args["name__contains"] = data.name
+        matches = await EventSearch.search(data.name, config.SEARCH_MAX_MATCHES)
+        query_args["id__in"] = matches
+
+    next_position = None
+    if relevance:
+        offset = (page - 1) * results_per_page
+        if position is not None:
+            if not isinstance(offset := position.get("offset"), int):
+                raise Errors.INVALID_CURSOR
 
-    events_query = Event.filter(**query_args).limit(results_per_page).offset((page - 1) * results_per_page)\
-        .select_related("location")
-    if sort_by is not None:
-        if sort_direction == "desc":
-            sort_by = f"-{sort_by}"
-        events_query = events_query.order_by(sort_by)
+        # Full-text search returns most relevant matches first
+        filtered = set(await Event.filter(**query_args).values_list("id", flat=True)) if matches else set()
+        ranked = [event_id for event_id in matches if event_id in filtered]
+        page_ids = ranked[offset:offset + results_per_page]
+        events = await Event.filter(id__in=page_ids).select_related("location")
+        events.sort(key=lambda event: page_ids.index(event.id))
+        if offset + results_per_page < len(ranked):
+            next_position = {"offset": offset + results_per_page}
+    else:
+        descending = sort_direction == "desc"
+        events_query = Event.filter(**query_args)
+        if position is not None:
+            events_query = events_query.filter(_after_cursor(order_field, descending, position))
+        else:
+            events_query = events_query.offset((page - 1) * results_per_page)
 
+        ordering = (f"-{order_field}", "-id") if descending else (order_field, "id")
+        events = await events_query.order_by(*ordering).limit(results_per_page).select_related("location")
+        if len(events) == results_per_page:
+            next_position = {"value": _cursor_value(events[-1], order_field), "id": events[-1].id}
+
+    next_cursor = encode_cursor({"sort": cursor_sort} | next_position) if next_position is not None else None
+
+    plans = await EventPlan.for_events([event.id for event in events]) if with_plans else {}
     result = []
-    for event in await events_query:
+    for event in events:
         result.append(event.to_json())
         if with_plans:
-            plans = await EventPlan.filter(event=event)
-            result[-1]["plans"] = [{
-                "id": plan.id,
-                "name": plan.name,
-                "price": plan.price,
-                "max_tickets": plan.max_tickets,
-            } for plan in plans]
+            result[-1]["plans"] = [_plan_json(plan) for plan in plans[event.id]]
 
-    await RedisCache.put("search", result, *cache_params, expires_in=60)
-    return result
+    generations |= await RedisCache.tag_generations(event_tag(event.id) for event in events)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor is not None else None
+    return encode_response(_search_adapter, result, headers), generations
 
 
-@router.get("/{event_id}", response_model=EventWithPlansData | EventData)
-async def get_events(event_id: int, with_plans: bool = False):
+@router.post("/search", response_model=list[EventWithPlansData] | list[EventData])
+async def search_events(data: EventSearchData, sort_by: Literal["name", "category", "start_time"] | None = None,
+                        sort_direction: Literal["asc", "desc"] = "asc", results_per_page: int = 10, page: int = 1,
+                        with_plans: bool = False, cursor: str | None = None):
+    page = max(page, 1)
+    results_per_page = min(results_per_page, 50)
+    results_per_page = max(results_per_page, 5)
+
+    cache_params = (page, results_per_page, data.name, data.category, data.city, data.time_min, data.time_max, sort_by,
+                    sort_direction, with_plans, cursor)
+    return cached_response(await RedisCache.get_or_compute(
+        "search", *cache_params, expires_in=config.SEARCH_CACHE_TTL,
+        compute=lambda: _search(data, sort_by, sort_direction, results_per_page, page, with_plans, cursor),
+    ))
+
+
+async def _cell_events(cell: str) -> tuple[list, dict[str, int]]:
+    generations = await RedisCache.tag_generations([geo_tag(cell)])
+    events = await Event.filter(
+        location__geohash__gte=cell, location__geohash__lt=cell + geo.CELL_END,
+    ).order_by("start_time", "id").limit(config.GEO_CELL_MAX_EVENTS).select_related("location")
+
+    generations |= await RedisCache.tag_generations(event_tag(event.id) for event in events)
+    return [event.to_json() for event in events], generations
+
+
+async def _geo_events(boxes: list[geo.BBox], filters: EventGeoFilterData) -> list[dict]:
+    """
+    Returns events located in given boxes and matching filters. Events are loaded by geohash cells covering boxes,
+    events of every cell are cached (and invalidated by tags) separately, so overlapping queries share them.
+    """
+
+    precision = next(
+        (precision for precision in range(config.GEO_MAX_PRECISION, 1, -1)
+         if geo.cells_count(boxes, precision) <= config.GEO_MAX_CELLS),
+        1,
+    )
+    cells = await asyncio.gather(*(
+        RedisCache.get_or_compute(
+            "geo_cell", cell, compute=lambda cell=cell: _cell_events(cell), expires_in=config.GEO_CELL_CACHE_TTL,
+        )
+        for cell in geo.covering_cells(boxes, precision)
+    ))
+
+    return [
+        event for events in cells for event in events
+        if geo.in_boxes(event["location"]["latitude"], event["location"]["longitude"], boxes)
+        and (filters.category is None or event["category"] == filters.category)
+        and (filters.time_min is None or event["start_time"] >= filters.time_min)
+        and (filters.time_max is None or event["start_time"] <= filters.time_max)
+    ]
+
+
+@router.post("/nearby", response_model=list[EventWithDistanceData])
+async def nearby_events(data: EventNearbyData, results_per_page: int = 10, page: int = 1):
+    page = max(page, 1)
+    results_per_page = min(results_per_page, 50)
+    results_per_page = max(results_per_page, 5)
+
+    result = []
+    for event in await _geo_events(geo.radius_bbox(data.latitude, data.longitude, data.radius), data):
+        location = event["location"]
+        distance = geo.distance(data.latitude, data.longitude, location["latitude"], location["longitude"])
+        if distance <= data.radius:
+            result.append(event | {"distance": round(distance, 3)})
+
+    result.sort(key=lambda event: (event["distance"], event["id"]))
+    return result[(page - 1) * results_per_page:page * results_per_page]
+
+
+@router.post("/viewport", response_model=list[EventData])
+async def viewport_events(data: EventViewportData):
+    if data.min_latitude > data.max_latitude:
+        raise Errors.INVALID_COORDINATES
+    # Larger viewports would be covered by cells too coarse to load their events
+    lon_span = data.max_longitude - data.min_longitude
+    if lon_span < 0:
+        lon_span += 360
+    if max(data.max_latitude - data.min_latitude, lon_span) > config.GEO_VIEWPORT_MAX_SPAN:
+        raise Errors.VIEWPORT_TOO_LARGE
+
+    boxes = geo.split_bbox(data.min_latitude, data.min_longitude, data.max_latitude, data.max_longitude)
+    result = await _geo_events(boxes, data)
+    result.sort(key=lambda event: (event["start_time"], event["id"]))
+    return result[:config.GEO_VIEWPORT_LIMIT]
+
+
+@router.get("/facets", response_model=EventFacetsData)
+async def event_facets(city: str | None = None):
+    return await EventFacets.get(city)
+
+
+async def _event(event_id: int, with_plans: bool) -> tuple[dict, dict[str, int]]:
+    generations = await RedisCache.tag_generations([event_tag(event_id)])
     if (event := await Event.get_or_none(id=event_id).select_related("location")) is None:
         raise Errors.UNKNOWN_EVENT
 
     result = event.to_json()
     if with_plans:
-        result["plans"] = [{
-            "id": plan.id,
-            "name": plan.name,
-            "price": plan.price,
-            "max_tickets": plan.max_tickets,
-        } for plan in await EventPlan.filter(event=event)]
-
-    return result
+        plans = await EventPlan.for_events([event.id])
+        result["plans"] = [_plan_json(plan) for plan in plans[event.id]]
+
+    return encode_response(_event_adapter, result), generations
+
+
+@router.get("/{event_id}", response_model=EventWithPlansData | EventData)
+async def get_events(event_id: int, request: Request, with_plans: bool = False):
+    # Cached entry (and its ETag) is invalidated by event tag, so If-None-Match is checked without loading event
+    cached = await RedisCache.get_or_compute(
+        "event", event_id, with_plans, compute=lambda: _event(event_id, with_plans), expires_in=config.SEARCH_CACHE_TTL,
+    )
+    return cached_response(cached, request, f"public, max-age={config.EVENT_HTTP_MAX_AGE}")
@@ -1,30 +1,41 @@
 from datetime import timedelta, datetime, UTC
+from math import ceil
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from fastapi import Depends
-from tortoise.expressions import Subquery
+from pydantic import TypeAdapter
+from tortoise.transactions import in_transaction
 
 from ticketer import config
 from ticketer.config import fcm
 from ticketer.errors import Errors
 from ticketer.models import User, Event, Ticket, Payment, PaymentState, EventPlan, UserDevice, UserRole
-from ticketer.response_schemas import TicketData, BuyTicketVerifiedData, BuyTicketRespData
-from ticketer.schemas import BuyTicketData, VerifyPaymentData
+from ticketer.response_schemas import TicketData, BuyTicketVerifiedData, BuyTicketRespData, QueueData, \
+    BuyCartRespData
+from ticketer.schemas import BuyTicketData, VerifyPaymentData, JoinQueueData, BuyCartData
 from ticketer.utils.cache import RedisCache
+from ticketer.utils.event_cache import event_tag, tickets_tag
+from ticketer.utils.inventory import Inventory
 from ticketer.utils.jwt import JWT
 from ticketer.utils.jwt_auth import jwt_auth, jwt_auth_role
+from ticketer.utils.metrics import Metrics
 from ticketer.utils.mfa import MFA
 from ticketer.utils.paypal import PayPal
+from ticketer.utils.responses import encode_response, cached_response
+from ticketer.utils.waiting_room import WaitingRoom
 
 router = APIRouter(prefix="/tickets")
 
+_tickets_adapter = TypeAdapter(list[TicketData])
+_ticket_adapter = TypeAdapter(TicketData)
+
+
+async def _invalidate_tickets(user_id: int) -> None:
+    await RedisCache.invalidate_tags(tickets_tag(user_id))
 
-@router.get("", response_model=list[TicketData])
-async def get_user_tickets(user: User = Depends(jwt_auth)):
-    cached = await RedisCache.get("tickets", user.id)
-    if cached is not None:  # pragma: no cover
-        return cached
 
+async def _user_tickets(user: User) -> tuple[dict, dict[str, int]]:
+    generations = await RedisCache.tag_generations([tickets_tag(user.id)])
     tickets = await Ticket.filter(user=user).select_related("event_plan", "event_plan__event")\
         .order_by("event_plan__event__start_time")
 
@@ -37,16 +48,19 @@ async def get_user_tickets(user: User = Depends(jwt_auth)):
         "payment": await (await ticket.get_payment()).to_json()
     } for ticket in tickets]
 
-    await RedisCache.put("tickets", result, user.id, expires_in=300)
-    return result
+    generations |= await RedisCache.tag_generations(event_tag(ticket.event_plan.event.id) for ticket in tickets)
+    return encode_response(_tickets_adapter, result), generations
 
 
-@router.get("/{ticket_id}", response_model=TicketData)
-async def get_ticket(ticket_id: int, user: User = Depends(jwt_auth)):
-    cached = await RedisCache.get("tickets_one", user.id, ticket_id)
-    if cached is not None:  # pragma: no cover
-        return cached
+@router.get("", response_model=list[TicketData])
+async def get_user_tickets(request: Request, user: User = Depends(jwt_auth)):
+    return cached_response(await RedisCache.get_or_compute(
+        "tickets", user.id, compute=lambda: _user_tickets(user), expires_in=300
+    ), request, "private, no-cache")
 
+
+async def _ticket(user: User, ticket_id: int) -> tuple[dict, dict[str, int]]:
+    generations = await RedisCache.tag_generations([tickets_tag(user.id)])
     ticket = await Ticket.get_or_none(id=ticket_id, user=user).select_related("event_plan", "event_plan__event")
     if ticket is None:
         raise Errors.UNKNOWN_TICKET
@@ -60,63 +74,162 @@ async def get_ticket(ticket_id: int, user: User = Depends(jwt_auth)):
         "payment": await (await ticket.get_payment()).to_json(),
     }
 
-    await RedisCache.put("tickets_one", result, user.id, ticket_id, expires_in=300)
-    return result
+    generations |= await RedisCache.tag_generations([event_tag(ticket.event_plan.event.id)])
+    return encode_response(_ticket_adapter, result), generations
 
 
-@router.post("/request-payment", response_model=BuyTicketRespData)
-async def request_ticket(data: BuyTicketData, user: User = Depends(jwt_auth_role(exact=UserRole.USER))):
-    if (event_plan := await EventPlan.get_or_none(id=data.plan_id, event__id=data.event_id)) is None:
+@router.get("/{ticket_id}", response_model=TicketData)
+async def get_ticket(ticket_id: int, request: Request, user: User = Depends(jwt_auth)):
+    return cached_response(await RedisCache.get_or_compute(
+        "tickets_one", user.id, ticket_id, compute=lambda: _ticket(user, ticket_id), expires_in=300
+    ), request, "private, no-cache")
+
+
+async def _create_tickets(user: User, items: list[tuple[EventPlan, int]]) -> tuple[list[Ticket], Payment]:
+    """
+    Reserves and creates tickets of all given plans with one payment in one transaction, either all of them or none.
+    """
+
+    reservations = []
+    try:
+        async with in_transaction():
+            # Plans are reserved in the same order by every purchase, so concurrent carts can't deadlock on plan rows
+            for event_plan, amount in sorted(items, key=lambda item: item[0].id):
+                if (reservation := await Inventory.reserve(event_plan, amount)) is None:
+                    raise Errors.TICKETS_NOT_AVAILABLE.format(amount)
+                reservations.append(reservation)
+
+            (event_plan, amount), *cart = items
+            ticket = await Ticket.create(user=user, event_plan=event_plan, amount=amount)
+            payment = await Payment.create(ticket=ticket)
+            tickets = [ticket]
+            if cart:
+                await Ticket.bulk_create([
+                    Ticket(user=user, event_plan=event_plan, amount=amount, cart_ticket=ticket)
+                    for event_plan, amount in cart
+                ])
+                tickets += await Ticket.filter(cart_ticket=ticket).order_by("id")
+    except BaseException:
+        for reservation in reservations:
+            await Inventory.cancel(reservation)
+        raise
+
+    for reservation in reservations:
+        await Inventory.commit(reservation)
+    return tickets, payment
+
+
+async def _delete_ticket(ticket: Ticket) -> None:
+    # Tickets bought in one cart share payment, so they are deleted together
+    releases = []
+    async with in_transaction():
+        for cart_ticket in await Ticket.paid_with(ticket.payment_ticket_id):
+            if (release := await Inventory.remove(cart_ticket)) is not None:
+                releases.append(release)
+
+    for release in releases:
+        await Inventory.release(release)
+    await _invalidate_tickets(ticket.user_id)
+
+
+async def _buy_tickets(user: User, event_id: int, amounts: dict[int, int], queue_token: str | None) -> dict:
+    plans = {
+        plan.id: plan
+        for plan in await EventPlan.filter(id__in=list(amounts), event__id=event_id).select_related("event")
+    }
+    if len(plans) != len(amounts):
         raise Errors.UNKNOWN_PLAN
+    event = next(iter(plans.values())).event
+    # Events in queue mode are only sold to clients admitted from waiting room
+    if event.queue_rate and not await WaitingRoom.admitted(event.id, user.id, queue_token):
+        Metrics.counter("waiting_room.rejected").inc()
+        raise Errors.NOT_ADMITTED
 
-    await Ticket.filter(id__in=Subquery(
-        Payment.filter(ticket__event_plan=event_plan, state__not=PaymentState.DONE, expires_at__lt=datetime.now(UTC))
-               .select_related("ticket")
-               .values_list("ticket__id", flat=True)
-    )).delete()
+    # Tickets with expired payments are returned to inventory by background payment reaper
+    tickets, payment = await _create_tickets(user, [(plans[plan_id], amount) for plan_id, amount in amounts.items()])
+    await _invalidate_tickets(user.id)
 
-    tickets_available = event_plan.max_tickets - await Ticket.filter(event_plan=event_plan).count()
-    if tickets_available < data.amount:
-        raise Errors.TICKETS_NOT_AVAILABLE.format(data.amount)
-
-    ticket = await Ticket.create(user=user, event_plan=event_plan, amount=data.amount)
-    payment = await Payment.create(ticket=ticket)
-    await RedisCache.delete("tickets", user.id)
-
-    total_price = event_plan.price * data.amount
+    total_price = sum(plans[plan_id].price * amount for plan_id, amount in amounts.items())
 
     async for device in UserDevice.filter(user=user):
-        if not isinstance(event_plan.event, Event):
-            await event_plan.fetch_related("event")
-
         await fcm.send_notification(
             "Payment Verification",
             f"Payment verification for ${total_price:.2f} is needed to buy a ticket",
             device_token=device.device_token,
         )
         #await fcm.send_data(
-        #    ticket_id=ticket.id,
+        #    ticket_id=tickets[0].id,
         #    payment_id=payment.id,
-        #    amount=data.amount,
-        #    event=event_plan.event.to_json(),
+        #    amount=sum(amounts.values()),
+        #    event=event.to_json(),
         #    expires_at=int(payment.expires_at.timestamp()),
         #    device_token=device.device_token,
         #)
 
     return {
-        "ticket_id": ticket.id,
+        "ticket_id": tickets[0].id,
+        "ticket_ids": [ticket.id for ticket in tickets],
         "total_price": total_price,
         "expires_at": int(payment.expires_at.timestamp())
     }
 
 
+def _queue_data(event: Event, user: User, position: int) -> dict:
+    return {
+        "token": WaitingRoom.token(event.id, user.id),
+        "position": position,
+        "wait": ceil(position * 60 / event.queue_rate) if position else 0,
+    }
+
+
+@router.post("/queue", response_model=QueueData)
+async def join_queue(data: JoinQueueData, user: User = Depends(jwt_auth_role(exact=UserRole.USER))):
+    if (event := await Event.get_or_none(id=data.event_id)) is None:
+        raise Errors.UNKNOWN_EVENT
+
+    position = await WaitingRoom.join(event.id, event.queue_rate, user.id) if event.queue_rate else 0
+    return _queue_data(event, user, position)
+
+
+@router.get("/queue/{event_id}", response_model=QueueData)
+async def get_queue_position(event_id: int, user: User = Depends(jwt_auth_role(exact=UserRole.USER))):
+    if (event := await Event.get_or_none(id=event_id)) is None:
+        raise Errors.UNKNOWN_EVENT
+
+    position = 0
+    if event.queue_rate and (position := await WaitingRoom.position(event.id, event.queue_rate, user.id)) is None:
+        raise Errors.NOT_IN_QUEUE
+    return _queue_data(event, user, position)
+
+
+@router.post("/request-payment", response_model=BuyTicketRespData)
+async def request_ticket(data: BuyTicketData, user: User = Depends(jwt_auth_role(exact=UserRole.USER))):
+    return await _buy_tickets(user, data.event_id, {data.plan_id: data.amount}, data.queue_token)
+
+
+@router.post("/request-cart-payment", response_model=BuyCartRespData)
+async def request_cart(data: BuyCartData, user: User = Depends(jwt_auth_role(exact=UserRole.USER))):
+    amounts = {}
+    for item in data.items:
+        amounts[item.plan_id] = amounts.get(item.plan_id, 0) + item.amount
+
+    return await _buy_tickets(user, data.event_id, amounts, data.queue_token)
+
+
+async def _ticket_payment(user: User, ticket_id: int) -> Payment:
+    # Tickets bought in a cart are paid with payment of cart's first ticket
+    if (ticket := await Ticket.get_or_none(id=ticket_id, user=user)) is None:
+        raise Errors.UNKNOWN_TICKET
+    if (payment := await Payment.get_or_none(ticket_id=ticket.payment_ticket_id)) is None:
+        raise Errors.UNKNOWN_TICKET
+
+    return payment
+
+
 @router.get("/{ticket_id}/check-verification", response_model=BuyTicketVerifiedData)
 async def check_ticket_verification(ticket_id: int, user: User = Depends(jwt_auth)):
-    if (payment := await Payment.get_or_none(ticket__id=ticket_id, ticket__user=user)) is None:
-        raise Errors.UNKNOWN_TICKET
+    payment = await _ticket_payment(user, ticket_id)
     if payment.expired():
-        await payment.delete()
-        await Ticket.filter(id=ticket_id).delete()
         raise Errors.UNKNOWN_TICKET
 
     return {
@@ -129,46 +242,42 @@ async def check_ticket_verification(ticket_id: int, user: User = Depends(jwt_aut
 
 @router.post("/{ticket_id}/verify-payment", status_code=204)
 async def verify_ticket_payment(ticket_id: int, data: VerifyPaymentData, user: User = Depends(jwt_auth)):
-    if (payment := await Payment.get_or_none(ticket__id=ticket_id, ticket__user=user)) is None:
-        raise Errors.UNKNOWN_TICKET
+    payment = await _ticket_payment(user, ticket_id)
     if payment.state != PaymentState.AWAITING_VERIFICATION:
         raise Errors.TICKET_ALREADY_VERIFIED
     if payment.expired():
-        await payment.delete()
-        await Ticket.filter(id=ticket_id).delete()
         raise Errors.UNKNOWN_TICKET
 
     if user.mfa_key is not None:
         mfa = MFA(user.mfa_key)
-        if data.mfa_code not in mfa.getCodes():
+        if not await mfa.verify_once(data.mfa_code, user.id):
             raise Errors.WRONG_MFA_CODE
 
-    await payment.fetch_related("ticket", "ticket__event_plan")
-    ticket = payment.ticket
-    event_plan = ticket.event_plan
-
+    # One paypal order is created for all tickets bought in one cart
+    tickets = await Ticket.paid_with(payment.ticket_id)
     await payment.update(
         state=PaymentState.AWAITING_PAYMENT,
-        paypal_id=await PayPal.create(event_plan.price * ticket.amount),
+        paypal_id=await PayPal.create(sum(ticket.event_plan.price * ticket.amount for ticket in tickets)),
         expires_at=datetime.now(UTC) + timedelta(minutes=30)
     )
-    await RedisCache.delete("tickets", user.id)
-    await RedisCache.delete("tickets_one", user.id, ticket_id)
+    await _invalidate_tickets(user.id)
 
 
 @router.post("/{ticket_id}/check-payment", status_code=204)
 async def ticket_payment_callback(ticket_id: int, user: User = Depends(jwt_auth)):
-    if (payment := await Payment.get_or_none(ticket__id=ticket_id, ticket__user=user)) is None:
-        raise Errors.UNKNOWN_TICKET
+    payment = await _ticket_payment(user, ticket_id)
 
     if payment.state == PaymentState.DONE:
         return
     if payment.paypal_id is None or not await PayPal.check(payment.paypal_id):
         raise Errors.PAYMENT_NOT_RECEIVED
 
-    await payment.update(state=PaymentState.DONE)
-    await RedisCache.delete("tickets", user.id)
-    await RedisCache.delete("tickets_one", user.id, ticket_id)
+    async with in_transaction():
+        # Concurrent callbacks must not mark tickets as sold twice
+        if await Payment.filter(id=payment.id, state__not=PaymentState.DONE).update(state=PaymentState.DONE):
+            for ticket in await Ticket.paid_with(payment.ticket_id):
+                await Inventory.paid(ticket)
+    await _invalidate_tickets(user.id)
 
 
 @router.get("/{ticket_id}/validation-tokens", response_model=list[str])
@@ -176,7 +285,8 @@ async def create_ticket_token(ticket_id: int, user: User = Depends(jwt_auth)):
     ticket = await Ticket.get_or_none(id=ticket_id, user=user).select_related("event_plan", "event_plan__event")
     if ticket is None:
         raise Errors.UNKNOWN_TICKET
-    if (payment := await Payment.get_or_none(ticket=ticket)) is None or payment.state != PaymentState.DONE:
+    payment = await Payment.get_or_none(ticket_id=ticket.payment_ticket_id)
+    if payment is None or payment.state != PaymentState.DONE:
         raise Errors.PAYMENT_NOT_RECEIVED_TOKEN
 
     plan = ticket.event_plan
@@ -196,14 +306,21 @@ async def create_ticket_token(ticket_id: int, user: User = Depends(jwt_auth)):
 
 
 @router.delete("/{ticket_id}", status_code=204)
-async def cancel_user_ticket(ticket_id: int, user: User = Depends(jwt_auth)):
+async def cancel_user_ticket(ticket_id: int, cart: bool = False, user: User = Depends(jwt_auth)):
+    """
+    Cancels ticket. Tickets bought in one cart share payment, so they can only be cancelled all at once by
+    cancelling any of them with cart=true.
+    """
+
     ticket = await Ticket.get_or_none(id=ticket_id, user=user).select_related("event_plan__event")
     if ticket is None:
         raise Errors.UNKNOWN_TICKET
+    if not cart and (
+            ticket.cart_ticket_id is not None or await Ticket.filter(cart_ticket_id=ticket.id).exists()
+    ):
+        raise Errors.CART_TICKET_CANNOT_CANCEL
 
     if not await ticket.can_be_cancelled():
         raise Errors.TICKET_CANNOT_CANCEL
 
-    await ticket.delete()
-    await RedisCache.delete("tickets", user.id)
-    await RedisCache.delete("tickets_one", user.id, ticket_id)
+    await _delete_ticket(ticket)
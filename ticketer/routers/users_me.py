@@ -1,6 +1,6 @@
-from bcrypt import gensalt, hashpw, checkpw
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from fastapi import Depends
+from pydantic import TypeAdapter
 
 from ticketer.errors import Errors
 from ticketer.models import User, PaymentMethod, UserDevice
@@ -10,13 +10,19 @@ from ticketer.utils import is_valid_card, upload_image_or_not
 from ticketer.utils.cache import RedisCache
 from ticketer.utils.jwt_auth import jwt_auth
 from ticketer.utils.mfa import MFA
+from ticketer.utils.password import PasswordHasher
+from ticketer.utils.responses import encode_response, cached_response
+from ticketer.utils.session_cache import SessionCache
 
 router = APIRouter(prefix="/users/me")
 
+_user_adapter = TypeAdapter(UserData)
+
 
 @router.get("", response_model=UserData)
-async def get_user_info(user: User = Depends(jwt_auth)):
-    return user.to_json()
+async def get_user_info(request: Request, user: User = Depends(jwt_auth)):
+    # User is taken from session cache, so ETag is computed without loading it from database
+    return cached_response(encode_response(_user_adapter, user.to_json()), request, "private, no-cache")
 
 
 @router.patch("", response_model=UserData)
@@ -31,18 +37,18 @@ async def edit_user_info(data: EditProfileData, user: User = Depends(jwt_auth)):
     if require_password and not data.password:
         raise Errors.NEED_PASSWORD
     elif require_password and data.password:
-        if not checkpw(data.password.encode("utf8"), user.password.encode("utf8")):
+        if not await PasswordHasher.check(data.password, user.password):
             raise Errors.WRONG_PASSWORD
 
     if data.mfa_key:
         mfa = MFA(data.mfa_key)
         if not mfa.valid:
             raise Errors.WRONG_MFA_KEY
-        if data.mfa_code not in mfa.getCodes():
+        if not await mfa.verify_once(data.mfa_code, user.id):
             raise Errors.WRONG_MFA_CODE
     elif data.mfa_key is None and user.mfa_key is not None:
         mfa = MFA(user.mfa_key)
-        if data.mfa_code not in mfa.getCodes():
+        if not await mfa.verify_once(data.mfa_code, user.id):
             raise Errors.WRONG_MFA_CODE
 
     if data.phone_number is not None and await User.filter(phone_number=data.phone_number).exists():
@@ -50,22 +56,18 @@ async def edit_user_info(data: EditProfileData, user: User = Depends(jwt_auth)):
 
     j_data = data.model_dump(exclude_defaults=True, exclude={"password", "new_password"})
     if data.new_password is not None:
-        j_data["password"] = hashpw(data.new_password.encode("utf8"), gensalt()).decode()
+        j_data["password"] = await PasswordHasher.hash(data.new_password)
 
     await upload_image_or_not("avatar", j_data, "avatar", 640, 640)
 
     if j_data:
         await user.update(**j_data)
+        await SessionCache.invalidate_user(user.id)
 
-    return await get_user_info(user)
-
+    return user.to_json()
 
-@router.get("/payment", response_model=list[PaymentMethodData])
-async def get_payment_methods(user: User = Depends(jwt_auth)):
-    cached = await RedisCache.get("payment_methods", user.id)
-    if cached is not None:  # pragma: no cover
-        return cached
 
+async def _payment_methods(user: User) -> tuple[list, None]:
     payment_methods = await PaymentMethod.filter(user=user)
 
     result = [{
@@ -75,8 +77,14 @@ async def get_payment_methods(user: User = Depends(jwt_auth)):
         "expired": method.expired(),
     } for method in payment_methods]
 
-    await RedisCache.put("payment_methods", result, user.id, expires_in=600)
-    return result
+    return result, None
+
+
+@router.get("/payment", response_model=list[PaymentMethodData])
+async def get_payment_methods(user: User = Depends(jwt_auth)):
+    return await RedisCache.get_or_compute(
+        "payment_methods", user.id, compute=lambda: _payment_methods(user), expires_in=600
+    )
 
 
 @router.post("/payment", response_model=PaymentMethodData)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field, field_validator
 
+from ticketer import config
 from ticketer.errors import Errors
 from ticketer.utils import open_image_b64
 
@@ -52,16 +53,36 @@ class AddPaymentMethodData(BaseModel):
     expiration_date: str
 
 
+def validate_amount(value: int) -> int:
+    if value <= 0:
+        raise Errors.INVALID_AMOUNT
+    return value
+
+
 class BuyTicketData(BaseModel):
     event_id: int
     plan_id: int
     amount: int = 1
+    queue_token: str | None = None
 
-    @field_validator("amount")
-    def validate_amount(cls, value: int) -> int:
-        if value <= 0:
-            raise Errors.INVALID_AMOUNT
-        return value
+    _validate_amount = field_validator("amount")(validate_amount)
+
+
+class CartItemData(BaseModel):
+    plan_id: int
+    amount: int = 1
+
+    _validate_amount = field_validator("amount")(validate_amount)
+
+
+class BuyCartData(BaseModel):
+    event_id: int
+    items: list[CartItemData] = Field(min_length=1, max_length=16)
+    queue_token: str | None = None
+
+
+class JoinQueueData(BaseModel):
+    event_id: int
 
 
 class EventSearchData(BaseModel):
@@ -72,6 +93,49 @@ class EventSearchData(BaseModel):
     city: str | None = None
 
 
+def validate_latitude(value: float) -> float:
+    if not -90 <= value <= 90:
+        raise Errors.INVALID_COORDINATES
+    return value
+
+
+def validate_longitude(value: float) -> float:
+    if not -180 <= value <= 180:
+        raise Errors.INVALID_COORDINATES
+    return value
+
+
+class EventGeoFilterData(BaseModel):
+    category: str | None = None
+    time_min: int | None = None
+    time_max: int | None = None
+
+
+class EventNearbyData(EventGeoFilterData):
+    latitude: float
+    longitude: float
+    radius: float  # In kilometers
+
+    _validate_latitude = field_validator("latitude")(validate_latitude)
+    _validate_longitude = field_validator("longitude")(validate_longitude)
+
+    @field_validator("radius")
+    def validate_radius(cls, value: float) -> float:
+        if not 0 < value <= config.GEO_MAX_RADIUS:
+            raise Errors.INVALID_RADIUS
+        return value
+
+
+class EventViewportData(EventGeoFilterData):
+    min_latitude: float
+    min_longitude: float
+    max_latitude: float
+    max_longitude: float  # Less than min_longitude if viewport crosses antimeridian
+
+    _validate_latitude = field_validator("min_latitude", "max_latitude")(validate_latitude)
+    _validate_longitude = field_validator("min_longitude", "max_longitude")(validate_longitude)
+
+
 class AdminUserSearchData(BaseModel):
     email: str | None = None
     phone_number: int | None = None
@@ -89,6 +153,12 @@ class EventPlanData(BaseModel):
         return value
 
 
+def validate_queue_rate(value: int | None) -> int | None:
+    if value is not None and value < 0:
+        raise Errors.INVALID_QUEUE_RATE
+    return value
+
+
 class AddEventData(BaseModel):
     name: str
     description: str
@@ -99,6 +169,9 @@ class AddEventData(BaseModel):
     city: str
     image: str | None = None
     plans: list[EventPlanData] = Field(min_length=1)
+    queue_rate: int = 0
+
+    _validate_queue_rate = field_validator("queue_rate")(validate_queue_rate)
 
     @field_validator("image")
     def validate_image(cls, value: str | None) -> str | None:
@@ -116,6 +189,9 @@ class EditEventData(BaseModel):
     location_id: int | None = None
     image: str | None = ""
     plans: list[EventPlanData] | None = Field(min_length=1, default=None)
+    queue_rate: int | None = None
+
+    _validate_queue_rate = field_validator("queue_rate")(validate_queue_rate)
 
     @field_validator("image")
     def validate_image(cls, value: str | None) -> str | None:
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+from typing import Callable, Awaitable
+
+from ticketer.utils.cache import RedisCache
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundTasks:
+    """
+    Long-running and periodic coroutines started with the application and cancelled on shutdown
+    """
+
+    _funcs: list[Callable[[], Awaitable[None]]] = []
+    _tasks: list[asyncio.Task] = []
+
+    @classmethod
+    def add(cls, func: Callable[[], Awaitable[None]]) -> None:
+        cls._funcs.append(func)
+
+    @staticmethod
+    async def _acquire_lock(name: str, interval: float) -> bool:
+        client = await RedisCache._get_client()
+        return bool(await client.set(f"background-lock:{name}", 1, nx=True, px=int(interval * 900)))
+
+    @classmethod
+    def add_periodic(cls, func: Callable[[], Awaitable[None]], interval: float, single_worker: bool = False) -> None:
+        """
+        Runs func every interval seconds. With single_worker=True it is run by at most one worker per interval
+        across all processes sharing redis.
+        """
+
+        async def _run_periodic() -> None:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    if single_worker and not await cls._acquire_lock(func.__qualname__, interval):
+                        continue
+                    await func()
+                except Exception:
+                    logger.exception(f"Periodic task {func.__qualname__} failed")
+
+        cls.add(_run_periodic)
+
+    @classmethod
+    async def start(cls) -> None:
+        cls._tasks = [asyncio.create_task(func()) for func in cls._funcs]
+
+    @classmethod
+    async def stop(cls) -> None:
+        for task in cls._tasks:
+            task.cancel()
+        await asyncio.gather(*cls._tasks, return_exceptions=True)
+        cls._tasks = []
@@ -1,12 +1,88 @@
+import asyncio
 import json
+import logging
+from collections import OrderedDict
+from hashlib import blake2b
+from time import time
+from typing import Iterable, Callable, Awaitable
 
 from redis.asyncio import Redis
 
 from ticketer import config
+from ticketer.utils.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+Compute = Callable[[], Awaitable[tuple[dict | list, dict[str, int] | None]]]
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU of decoded values with per-entry ttl.
+    Returned values are shared between callers and must not be modified.
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._entries: OrderedDict[str, tuple[float, dict[str, int], dict | list]] = OrderedDict()
+        # Latest tag generations seen in invalidations, so entries computed before them are not accepted later
+        self._generations: OrderedDict[str, int] = OrderedDict()
+
+    def _fresh(self, tags: dict[str, int]) -> bool:
+        return all(generation >= self._generations.get(name, 0) for name, generation in tags.items())
+
+    def get(self, key: str) -> dict | list | None:
+        if (entry := self._entries.get(key)) is None:
+            return
+
+        expires_at, tags, value = entry
+        if expires_at < time() or not self._fresh(tags):
+            del self._entries[key]
+            return
+
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: dict | list, tags: dict[str, int], ttl: float) -> None:
+        if ttl <= 0 or not self._fresh(tags):
+            return
+
+        self._entries[key] = (time() + ttl, tags, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def invalidate_tags(self, generations: dict[str, int]) -> None:
+        for name, generation in generations.items():
+            self._generations[name] = max(generation, self._generations.get(name, 0))
+            self._generations.move_to_end(name)
+        while len(self._generations) > self._size * 16:
+            self._generations.popitem(last=False)
+
+        stale = [key for key, (_, tags, _) in self._entries.items() if not self._fresh(tags)]
+        self.delete(*stale)
+
+    def clear(self) -> None:
+        self._entries.clear()
 
 
 class RedisCache:
+    """
+    Json cache in redis with optional in-process L1 layer (CACHE_LOCAL_SIZE > 0).
+    L1 is used only while the worker is subscribed to invalidations channel: deleted keys and invalidated tags are
+    broadcast to all workers, other changes are picked up after at most CACHE_LOCAL_TTL seconds.
+    """
+
+    CHANNEL = "cache-invalidations"
+
     _connection: Redis | None = None
+    _local: LocalCache | None = LocalCache(config.CACHE_LOCAL_SIZE) if config.CACHE_LOCAL_SIZE > 0 else None
+    _listening = False
+    _inflight: dict[str, asyncio.Task] = {}
 
     @classmethod
     async def _get_client(cls) -> Redis:
@@ -16,35 +92,214 @@ class RedisCache:
 
         return cls._connection
 
+    @staticmethod
+    def _canonical(arg):
+        if isinstance(arg, (bool, int, float, str)) or arg is None:
+            return arg
+        if isinstance(arg, (list, tuple)):
+            return [RedisCache._canonical(item) for item in arg]
+        if isinstance(arg, dict):
+            return {str(key): RedisCache._canonical(value) for key, value in arg.items()}
+
+        return str(arg)
+
     @staticmethod
     def _hash(tag: str, *args) -> str:
-        key = tag
+        """
+        Deterministic key: blake2b over canonical json encoding of args, same in every process.
+        CACHE_VERSION prefix allows to invalidate all cached data on deploy.
+        """
 
-        for arg in args:
-            if isinstance(arg, bool):
-                arg = int(arg)
-            elif not isinstance(arg, str):
-                arg = str(arg)
+        encoded = json.dumps(RedisCache._canonical(args), sort_keys=True, separators=(",", ":"))
+        digest = blake2b(encoded.encode("utf8"), digest_size=16).hexdigest()
+        return f"v{config.CACHE_VERSION}:{tag}:{digest}"
 
-            arg = hash(arg)
-            key = f"{key}:{hex(arg)[2:]}"
+    @staticmethod
+    def _tag_key(name: str) -> str:
+        return f"v{config.CACHE_VERSION}:tag:{name}"
+
+    @classmethod
+    async def tag_generations(cls, tags: Iterable[str]) -> dict[str, int]:
+        """
+        Returns current generation of every invalidation tag (0 for tags that were never invalidated)
+        """
 
-        return key
+        tags = list(dict.fromkeys(tags))
+        if not tags:
+            return {}
+
+        client = await cls._get_client()
+        values = await client.mget([cls._tag_key(name) for name in tags])
+        return {name: int(value or 0) for name, value in zip(tags, values)}
 
     @classmethod
-    async def get(cls, tag: str, *args) -> dict | list | None:
+    async def invalidate_tags(cls, *tags: str) -> None:
+        """
+        Bumps generation of given tags, so every entry stored with any of them becomes stale
+        """
+
+        tags = list(set(tags))
         client = await cls._get_client()
+        async with client.pipeline(transaction=False) as pipe:
+            for name in tags:
+                pipe.incr(cls._tag_key(name))
+            generations = dict(zip(tags, await pipe.execute()))
+
+        if cls._local is not None:
+            cls._local.invalidate_tags(generations)
+            await client.publish(cls.CHANNEL, json.dumps({"tags": generations}))
+
+    @staticmethod
+    def _record(tag: str, result: str) -> None:
+        Metrics.counter(f"cache.{tag}.{result}").inc()
+        local_hits = Metrics.counter(f"cache.{tag}.local_hits").value
+        hits = local_hits + Metrics.counter(f"cache.{tag}.redis_hits").value \
+            + Metrics.counter(f"cache.{tag}.stale_hits").value
+        total = hits + Metrics.counter(f"cache.{tag}.misses").value
+        Metrics.gauge(f"cache.{tag}.hit_ratio").set(hits / total)
+        Metrics.gauge(f"cache.{tag}.local_hit_ratio").set(local_hits / total)
+
+    @classmethod
+    def _get_local(cls, key: str) -> dict | list | None:
+        if cls._local is not None and cls._listening:
+            return cls._local.get(key)
+
+    @classmethod
+    async def _load(cls, key: str) -> tuple[dict | list | None, bool]:
+        """
+        Returns value of redis entry (None if it is missing or invalidated by tags) and whether it is still fresh
+        """
+
+        client = await cls._get_client()
+        if (entry := await client.get(key)) is None:
+            return None, False
+
+        entry = json.loads(entry)
+        if entry["tags"] and await cls.tag_generations(entry["tags"]) != entry["tags"]:
+            return None, False
+
+        fresh_for = entry["fresh_until"] - time() if entry.get("fresh_until") is not None else config.CACHE_LOCAL_TTL
+        if fresh_for > 0 and cls._local is not None and cls._listening:
+            cls._local.put(key, entry["value"], entry["tags"], min(config.CACHE_LOCAL_TTL, fresh_for))
+
+        return entry["value"], fresh_for > 0
+
+    @classmethod
+    async def get(cls, tag: str, *args) -> dict | list | None:
         key = cls._hash(tag, *args)
-        value = await client.get(key)
+        if (value := cls._get_local(key)) is not None:
+            cls._record(tag, "local_hits")
+            return value
 
-        return json.loads(value) if value is not None else None
+        value, fresh = await cls._load(key)
+        if value is None or not fresh:
+            cls._record(tag, "misses")
+            return
+
+        cls._record(tag, "redis_hits")
+        return value
 
     @classmethod
-    async def put(cls, tag: str, obj: dict | list, *args, expires_in: int | None = None) -> None:
+    async def _put(cls, key: str, obj: dict | list, expires_in: int | None, tags: dict[str, int] | None,
+                   stale_for: int = 0) -> None:
+        entry = {"value": obj, "tags": tags or {}}
+        ex = expires_in
+        if expires_in is not None and stale_for > 0:
+            entry["fresh_until"] = time() + expires_in
+            ex = expires_in + stale_for
+
         client = await cls._get_client()
+        await client.set(key, json.dumps(entry), ex=ex)
+        if cls._local is not None and cls._listening:
+            cls._local.put(key, obj, tags or {}, min(config.CACHE_LOCAL_TTL, expires_in or config.CACHE_LOCAL_TTL))
+
+    @classmethod
+    async def put(cls, tag: str, obj: dict | list, *args, expires_in: int | None = None,
+                  tags: dict[str, int] | None = None) -> None:
+        """
+        Tags map invalidation tags to their generations taken (with tag_generations) before obj was computed.
+        Entry is treated as missing once any of its tags is invalidated.
+        """
+
+        await cls._put(cls._hash(tag, *args), obj, expires_in, tags)
+
+    @classmethod
+    async def _lock(cls, key: str) -> bool:
+        client = await cls._get_client()
+        return bool(await client.set(f"{key}:lock", 1, nx=True, px=int(config.CACHE_LOCK_TIMEOUT * 1000)))
+
+    @classmethod
+    async def _wait_for(cls, key: str) -> dict | list | None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + config.CACHE_LOCK_TIMEOUT
+        while loop.time() < deadline:
+            await asyncio.sleep(0.05)
+            value, _ = await cls._load(key)
+            if value is not None:
+                return value
+
+    @classmethod
+    async def _get_or_compute(cls, tag: str, key: str, compute: Compute, expires_in: int, stale_for: int):
+        if (value := cls._get_local(key)) is not None:
+            cls._record(tag, "local_hits")
+            return value
+
+        value, fresh = await cls._load(key)
+        if value is not None and fresh:
+            cls._record(tag, "redis_hits")
+            return value
+
+        if not (locked := await cls._lock(key)):
+            if value is not None:
+                # Stale value is served while other worker recomputes it
+                cls._record(tag, "stale_hits")
+                return value
+            if (value := await cls._wait_for(key)) is not None:
+                cls._record(tag, "redis_hits")
+                return value
+
+        cls._record(tag, "misses")
+        try:
+            value, tags = await compute()
+            await cls._put(key, value, expires_in, tags, stale_for)
+        finally:
+            if locked:
+                client = await cls._get_client()
+                await client.delete(f"{key}:lock")
+
+        return value
+
+    @classmethod
+    async def get_or_compute(cls, tag: str, *args, compute: Compute, expires_in: int,
+                             stale_for: int | None = None) -> dict | list:
+        """
+        Returns cached value or computes (and caches) it with compute(), which returns value and its invalidation
+        tags generations (or None). Concurrent misses of the same key are coalesced: within a process they await
+        one computation, across processes one worker computes the value (holding short redis lock) while others
+        wait for it or get stale value (entries are kept for stale_for seconds after expiration).
+        """
+
         key = cls._hash(tag, *args)
+        if (task := cls._inflight.get(key)) is not None:
+            Metrics.counter(f"cache.{tag}.coalesced").inc()
+        else:
+            if stale_for is None:
+                stale_for = config.CACHE_STALE_TTL
+            # Value is computed in a task detached from callers, so caller that is cancelled (e.g. client
+            # disconnected) doesn't cancel computation other callers are waiting for
+            task = cls._inflight[key] = asyncio.create_task(
+                cls._get_or_compute(tag, key, compute, expires_in, stale_for)
+            )
+            task.add_done_callback(lambda done: cls._computed(key, done))
 
-        await client.set(key, json.dumps(obj), ex=expires_in)
+        return await asyncio.shield(task)
+
+    @classmethod
+    def _computed(cls, key: str, task: asyncio.Task) -> None:
+        if cls._inflight.get(key) is task:
+            del cls._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Callers (if any are left) get the exception, don't warn if there are none
 
     @classmethod
     async def delete(cls, tag: str, *args) -> None:
@@ -52,3 +307,36 @@ class RedisCache:
         key = cls._hash(tag, *args)
 
         await client.delete(key)
+        if cls._local is not None:
+            cls._local.delete(key)
+            await client.publish(cls.CHANNEL, json.dumps({"keys": [key]}))
+
+    @classmethod
+    def _apply_invalidation(cls, message: dict) -> None:
+        cls._local.delete(*message.get("keys", []))
+        cls._local.invalidate_tags(message.get("tags", {}))
+
+    @classmethod
+    async def listen(cls) -> None:
+        if cls._local is None:
+            return
+
+        while True:
+            try:
+                client = await cls._get_client()
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(cls.CHANNEL)
+                    # Invalidations could be missed while not subscribed
+                    cls._local.clear()
+                    cls._listening = True
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            cls._apply_invalidation(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Cache invalidation listener failed, reconnecting")
+            finally:
+                cls._listening = False
+
+            await asyncio.sleep(1)
@@ -0,0 +1,50 @@
+from time import monotonic
+
+from ticketer.utils.metrics import Metrics
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures, rejecting calls for reset_timeout seconds.
+    After that one trial call is let through (half-open): success closes the circuit, failure opens it again.
+    If trial call records neither (e.g. it was cancelled), another one is let through after reset_timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.reset()
+
+    def reset(self) -> None:
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        Metrics.gauge(f"{self.name}.breaker_open").set(0)
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._opened_at = monotonic()
+            return True
+
+        return False
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            self.reset()
+        self._failures = 0
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = monotonic()
+            Metrics.counter(f"{self.name}.breaker_trips").inc()
+            Metrics.gauge(f"{self.name}.breaker_open").set(1)
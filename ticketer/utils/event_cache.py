@@ -0,0 +1,55 @@
+from ticketer.models import Event, Location
+from ticketer.utils.cache import RedisCache
+
+ALL_EVENTS_TAG = "events"
+# Cached geo cells are tagged with their prefix of this length, finer cells share tag of their parent cell
+GEO_TAG_PRECISION = 3
+
+
+def event_tag(event_id: int) -> str:
+    return f"event:{event_id}"
+
+
+def tickets_tag(user_id: int) -> str:
+    return f"tickets:{user_id}"
+
+
+def search_tags(city: str | None, category: str | None) -> list[str]:
+    """
+    Tags of search results set: any event added to (or removed from) results has to invalidate one of them.
+    """
+
+    tags = []
+    if city is not None:
+        tags.append(f"city:{city}")
+    if category is not None:
+        tags.append(f"category:{category}")
+
+    return tags or [ALL_EVENTS_TAG]
+
+
+def geo_tag(cell: str) -> str:
+    return f"geo:{cell[:GEO_TAG_PRECISION]}"
+
+
+async def invalidate_event(event: Event, old_city: str | None = None, old_category: str | None = None,
+                           old_location_id: int | None = None, content_only: bool = False) -> None:
+    """
+    Invalidates cached search results containing event. Unless only event content (description, image, plans, ...)
+    changed, results that event may have entered or left (same city/category/geo cell or unfiltered) are invalidated
+    too.
+    """
+
+    tags = [event_tag(event.id)]
+    if not content_only:
+        tags.extend((ALL_EVENTS_TAG, f"city:{event.city}", f"category:{event.category}"))
+        if old_city is not None:
+            tags.append(f"city:{old_city}")
+        if old_category is not None:
+            tags.append(f"category:{old_category}")
+
+        location_ids = [event.location_id] if old_location_id is None else [event.location_id, old_location_id]
+        for geohash in await Location.filter(id__in=location_ids).values_list("geohash", flat=True):
+            tags.extend(geo_tag(geohash[:precision]) for precision in range(1, GEO_TAG_PRECISION + 1))
+
+    await RedisCache.invalidate_tags(*tags)
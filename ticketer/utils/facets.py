@@ -0,0 +1,115 @@
+from datetime import datetime, UTC
+
+from tortoise import Tortoise
+
+from ticketer.models import Event
+from ticketer.utils.cache import RedisCache
+from ticketer.utils.metrics import Metrics
+
+
+class EventFacets:
+    """
+    Event counts per category, city and start month kept in redis hashes, globally and within every city.
+    Counters are updated incrementally on event writes and periodically rebuilt from the database with GROUP BY,
+    which also fixes drift caused by writes bypassing the api.
+    """
+
+    NAMES = ("category", "city", "month")
+    BUILT_KEY = "facets:built"
+    SCOPES_KEY = "facets:scopes"
+
+    _MONTH_SQL = {
+        "sqlite": "substr(start_time, 1, 7)",
+        "mysql": "CONCAT(YEAR(start_time), '-', LPAD(MONTH(start_time), 2, '0'))",
+        "postgres": "to_char(start_time, 'YYYY-MM')",
+    }
+
+    @staticmethod
+    def _key(scope: str, name: str) -> str:
+        return f"facets:{scope}:{name}"
+
+    @staticmethod
+    def _scopes(city: str) -> tuple[str, str]:
+        return "all", f"city:{city}"
+
+    @staticmethod
+    def month(start_time: datetime) -> str:
+        if start_time.tzinfo is None:
+            start_time = start_time.replace(tzinfo=UTC)
+        return start_time.astimezone(UTC).strftime("%Y-%m")
+
+    @classmethod
+    def of(cls, event: Event) -> dict[str, str]:
+        return {"category": event.category, "city": event.city, "month": cls.month(event.start_time)}
+
+    @classmethod
+    async def update(cls, old: dict[str, str] | None, new: dict[str, str] | None) -> None:
+        """
+        Moves event between counters: old and new are facet values (from EventFacets.of) of event before and after
+        write, None for created (or deleted) event.
+        """
+
+        if old == new:
+            return
+
+        client = await RedisCache._get_client()
+        async with client.pipeline(transaction=True) as pipe:
+            for values, delta in ((old, -1), (new, 1)):
+                if values is None:
+                    continue
+                for scope in cls._scopes(values["city"]):
+                    for name in cls.NAMES:
+                        pipe.hincrby(cls._key(scope, name), values[name], delta)
+                pipe.sadd(cls.SCOPES_KEY, *cls._scopes(values["city"]))
+            await pipe.execute()
+
+    @classmethod
+    async def rebuild(cls) -> None:
+        connection = Tortoise.get_connection("default")
+        month = cls._MONTH_SQL.get(connection.capabilities.dialect, "substr(start_time, 1, 7)")
+        counts: dict[str, dict[str, dict[str, int]]] = {}
+        for name, expression in (("category", "category"), ("month", month)):
+            _, rows = await connection.execute_query(
+                f"SELECT city, {expression} AS value, COUNT(*) AS count FROM event GROUP BY city, {expression}"
+            )
+            for row in rows:
+                for scope in cls._scopes(row["city"]):
+                    scope_counts = counts.setdefault(scope, {})
+                    facet = scope_counts.setdefault(name, {})
+                    facet[row["value"]] = facet.get(row["value"], 0) + row["count"]
+                    if name == "category":
+                        city = scope_counts.setdefault("city", {})
+                        city[row["city"]] = city.get(row["city"], 0) + row["count"]
+
+        client = await RedisCache._get_client()
+        old_scopes = [scope.decode("utf8") for scope in await client.smembers(cls.SCOPES_KEY)]
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.delete(cls.SCOPES_KEY, *(cls._key(scope, name) for scope in old_scopes for name in cls.NAMES))
+            for scope, facets in counts.items():
+                for name, values in facets.items():
+                    pipe.hset(cls._key(scope, name), mapping=values)
+            if counts:
+                pipe.sadd(cls.SCOPES_KEY, *counts)
+            pipe.set(cls.BUILT_KEY, 1)
+            await pipe.execute()
+
+        Metrics.counter("facets.rebuilds").inc()
+
+    @classmethod
+    async def get(cls, city: str | None = None) -> dict[str, dict[str, int]]:
+        scope = f"city:{city}" if city is not None else "all"
+        client = await RedisCache._get_client()
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.exists(cls.BUILT_KEY)
+            for name in cls.NAMES:
+                pipe.hgetall(cls._key(scope, name))
+            built, *facets = await pipe.execute()
+
+        if not built:
+            await cls.rebuild()
+            return await cls.get(city)
+
+        return {
+            name: {value.decode("utf8"): int(count) for value, count in facet.items() if int(count) > 0}
+            for name, facet in zip(cls.NAMES, facets)
+        }
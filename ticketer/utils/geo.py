@@ -0,0 +1,125 @@
+from math import radians, sin, cos, asin, sqrt, floor, ceil, degrees
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Character following the last base32 digit, geohash__lt=cell+CELL_END selects every hash inside the cell
+CELL_END = "{"
+EARTH_RADIUS = 6371.0  # km
+
+BBox = tuple[float, float, float, float]  # min_latitude, min_longitude, max_latitude, max_longitude
+
+
+def encode(latitude: float, longitude: float, precision: int) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    result = []
+    bits = 0
+    value = 0
+    even = True
+    while len(result) < precision:
+        value_range, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (value_range[0] + value_range[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+
+        even = not even
+        bits += 1
+        if bits == 5:
+            result.append(BASE32[value])
+            bits = value = 0
+
+    return "".join(result)
+
+
+def cell_size(precision: int) -> tuple[float, float]:
+    """
+    Returns height and width (in degrees) of geohash cells of given precision
+    """
+
+    return 180 / 2 ** floor(precision * 5 / 2), 360 / 2 ** ceil(precision * 5 / 2)
+
+
+def _cell_range(low: float, high: float, size: float, origin: float, limit: float) -> list[float]:
+    start = origin + floor((low - origin) / size) * size
+    end = min(high, limit - size / 2)
+    result = []
+    while start <= end:
+        result.append(start + size / 2)
+        start += size
+
+    return result
+
+
+def cells_count(boxes: list[BBox], precision: int) -> int:
+    height, width = cell_size(precision)
+    return sum(
+        (floor((min(max_lat, 90 - height / 2) + 90) / height) - floor((min_lat + 90) / height) + 1) *
+        (floor((min(max_lon, 180 - width / 2) + 180) / width) - floor((min_lon + 180) / width) + 1)
+        for min_lat, min_lon, max_lat, max_lon in boxes
+    )
+
+
+def covering_cells(boxes: list[BBox], precision: int) -> list[str]:
+    """
+    Returns geohash cells of given precision that cover all boxes
+    """
+
+    height, width = cell_size(precision)
+    cells = {}
+    for min_lat, min_lon, max_lat, max_lon in boxes:
+        for lat in _cell_range(min_lat, max_lat, height, -90, 90):
+            for lon in _cell_range(min_lon, max_lon, width, -180, 180):
+                cells[encode(lat, lon, precision)] = None
+
+    return list(cells)
+
+
+def split_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> list[BBox]:
+    """
+    Normalizes box to boxes within [-180, 180] longitudes: box with min_lon > max_lon crosses antimeridian.
+    """
+
+    if min_lon <= max_lon:
+        return [(min_lat, min_lon, max_lat, max_lon)]
+    return [(min_lat, min_lon, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon)]
+
+
+def radius_bbox(latitude: float, longitude: float, radius: float) -> list[BBox]:
+    """
+    Returns boxes covering circle with given radius (in km) around point
+    """
+
+    delta_lat = degrees(radius / EARTH_RADIUS)
+    min_lat, max_lat = latitude - delta_lat, latitude + delta_lat
+    if min_lat <= -90 or max_lat >= 90:
+        return [(max(min_lat, -90.0), -180.0, min(max_lat, 90.0), 180.0)]
+
+    delta_lon = degrees(asin(min(sin(radius / EARTH_RADIUS) / cos(radians(latitude)), 1)))
+    if delta_lon >= 180:  # pragma: no cover
+        return [(min_lat, -180.0, max_lat, 180.0)]
+
+    min_lon, max_lon = longitude - delta_lon, longitude + delta_lon
+    if min_lon < -180:
+        min_lon += 360
+    if max_lon > 180:
+        max_lon -= 360
+    return split_bbox(min_lat, min_lon, max_lat, max_lon)
+
+
+def in_boxes(latitude: float, longitude: float, boxes: list[BBox]) -> bool:
+    return any(
+        min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon
+        for min_lat, min_lon, max_lat, max_lon in boxes
+    )
+
+
+def distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Great-circle (haversine) distance between two points in km
+    """
+
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * asin(min(sqrt(a), 1))
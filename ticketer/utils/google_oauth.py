@@ -1,9 +1,8 @@
 from typing import TypedDict
 
-from httpx import AsyncClient
-
 from ticketer import config
 from ticketer.exceptions import CustomBodyException
+from ticketer.utils.http import HttpClients
 
 
 class GoogleOAuthResponse(TypedDict):
@@ -19,6 +18,9 @@ class GoogleOAuthToken(TypedDict):
     expires_in: int
 
 
+TOKEN_URL = "https://accounts.google.com/o/oauth2/token"
+
+
 async def authorize_google(code: str) -> tuple[GoogleOAuthResponse, GoogleOAuthToken]:
     data = {
         "code": code,
@@ -28,12 +30,32 @@ async def authorize_google(code: str) -> tuple[GoogleOAuthResponse, GoogleOAuthT
         "grant_type": "authorization_code",
     }
 
-    async with AsyncClient() as client:
-        resp = await client.post("https://accounts.google.com/o/oauth2/token", json=data)
-        if "error" in resp.json():
-            raise CustomBodyException(code=400, body={"error_message": f"Error: {resp.json()['error']}"})
-        token_data = resp.json()
+    client = HttpClients.get("google")
+    resp = await client.post(TOKEN_URL, json=data)
+    if "error" in resp.json():
+        raise CustomBodyException(code=400, body={"error_message": f"Error: {resp.json()['error']}"})
+    token_data = resp.json()
+
+    info_resp = await client.get("https://www.googleapis.com/oauth2/v1/userinfo",
+                                 headers={"Authorization": f"Bearer {token_data['access_token']}"})
+    return info_resp.json(), token_data
+
+
+async def refresh_google_token(refresh_token: str) -> GoogleOAuthToken | None:
+    """
+    Returns new token data (refresh_token may be missing) or None if refresh token was revoked or expired.
+    Raises httpx.HTTPError on other failures.
+    """
+
+    data = {
+        "refresh_token": refresh_token,
+        "client_id": config.OAUTH_GOOGLE_CLIENT_ID,
+        "client_secret": config.OAUTH_GOOGLE_CLIENT_SECRET,
+        "grant_type": "refresh_token",
+    }
 
-        info_resp = await client.get("https://www.googleapis.com/oauth2/v1/userinfo",
-                                     headers={"Authorization": f"Bearer {token_data['access_token']}"})
-        return info_resp.json(), token_data
+    resp = await HttpClients.get("google").post(TOKEN_URL, json=data)
+    if resp.status_code in (400, 401) and resp.json().get("error") in ("invalid_grant", "unauthorized_client"):
+        return
+    resp.raise_for_status()
+    return resp.json()
@@ -0,0 +1,93 @@
+import warnings
+from importlib.util import find_spec
+from ssl import SSLContext
+from time import perf_counter
+
+from httpx import AsyncClient, AsyncBaseTransport, Limits, Timeout, Request, Response, create_ssl_context
+
+from ticketer import config
+from ticketer.utils.metrics import Metrics
+
+if config.HTTP2_ENABLED and find_spec("h2") is None:  # pragma: no cover
+    warnings.warn("HTTP2_ENABLED is set but \"h2\" package is not installed. Falling back to HTTP/1.1!")
+    config.HTTP2_ENABLED = False
+
+
+class HttpClients:
+    """
+    Shared keep-alive http clients, one connection pool per outbound integration (recaptcha, paypal, google).
+    Opened on application startup and closed on shutdown.
+    """
+
+    _clients: dict[str, AsyncClient] = {}
+    _transport: AsyncBaseTransport | None = None
+    _ssl_context: SSLContext | None = None
+
+    @staticmethod
+    def _hooks(name: str) -> dict:
+        async def on_request(request: Request) -> None:
+            request.extensions["ticketer_start"] = perf_counter()
+            Metrics.counter(f"http.{name}.requests").inc()
+
+        async def on_response(response: Response) -> None:
+            start = response.request.extensions.get("ticketer_start")
+            if start is not None:
+                Metrics.histogram(f"http.{name}.latency_ms").observe((perf_counter() - start) * 1000)
+            if response.status_code >= 500:
+                Metrics.counter(f"http.{name}.server_errors").inc()
+
+            client = HttpClients._clients.get(name)
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            if pool is not None:
+                connections = pool.connections
+                Metrics.gauge(f"http.{name}.pool_connections").set(len(connections))
+                Metrics.gauge(f"http.{name}.pool_idle").set(sum(1 for conn in connections if conn.is_idle()))
+
+        return {"request": [on_request], "response": [on_response]}
+
+    @classmethod
+    def _create(cls, name: str) -> AsyncClient:
+        settings = config.HTTP_CLIENTS.get(name, config.HTTP_CLIENTS["default"])
+        if cls._ssl_context is None:
+            cls._ssl_context = create_ssl_context(http2=config.HTTP2_ENABLED)
+
+        return AsyncClient(
+            timeout=Timeout(settings["timeout"], connect=settings["connect_timeout"]),
+            limits=Limits(
+                max_connections=settings["max_connections"],
+                max_keepalive_connections=settings["max_keepalive_connections"],
+                keepalive_expiry=settings["keepalive_expiry"],
+            ),
+            verify=cls._ssl_context,
+            http2=config.HTTP2_ENABLED,
+            transport=cls._transport,
+            event_hooks=cls._hooks(name),
+        )
+
+    @classmethod
+    def get(cls, name: str) -> AsyncClient:
+        if (client := cls._clients.get(name)) is None or client.is_closed:
+            client = cls._clients[name] = cls._create(name)
+
+        return client
+
+    @classmethod
+    async def open(cls) -> None:
+        for name in config.HTTP_CLIENTS:
+            cls.get(name)
+
+    @classmethod
+    async def close(cls) -> None:
+        clients = list(cls._clients.values())
+        cls._clients = {}
+        for client in clients:
+            await client.aclose()
+
+    @classmethod
+    async def use_transport(cls, transport: AsyncBaseTransport | None) -> None:
+        """
+        Replaces transport of all clients (e.g. with httpx.MockTransport in tests), None restores the default one.
+        """
+
+        await cls.close()
+        cls._transport = transport
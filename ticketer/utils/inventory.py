@@ -0,0 +1,340 @@
+from datetime import datetime, UTC
+from time import time
+from uuid import uuid4
+
+from redis.commands.core import AsyncScript
+from tortoise.expressions import F
+from tortoise.functions import Sum
+from tortoise.transactions import in_transaction
+
+from ticketer import config
+from ticketer.models import EventPlan, Ticket, Payment, PaymentState
+from ticketer.utils.cache import RedisCache
+from ticketer.utils.metrics import Metrics
+
+# KEYS: remaining, pending. ARGV: amount, pending member, pending expiration time.
+# Returns remaining tickets after reservation, -1 if there are not enough tickets, -2 if counter is not loaded.
+RESERVE_LUA = """
+local remaining = redis.call('GET', KEYS[1])
+if not remaining then return -2 end
+local amount = tonumber(ARGV[1])
+if tonumber(remaining) < amount then return -1 end
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[2])
+return redis.call('DECRBY', KEYS[1], amount)
+"""
+
+# KEYS: remaining, pending. ARGV: pending member, amount.
+CANCEL_LUA = """
+if redis.call('ZREM', KEYS[2], ARGV[1]) == 1 and redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('INCRBY', KEYS[1], ARGV[2])
+end
+"""
+
+# KEYS: remaining, released, synced. ARGV: amount, synced counter read before ticket was deleted.
+# Counter is not raised if it was reconciled since ticket was deleted: reconciliation may already include the ticket.
+# Returns 1 if tickets were released, 0 if counter is not loaded, -1 if release was skipped.
+RELEASE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+if (redis.call('GET', KEYS[3]) or '0') ~= ARGV[2] then return -1 end
+redis.call('INCRBY', KEYS[1], ARGV[1])
+redis.call('INCR', KEYS[2])
+return 1
+"""
+
+# KEYS: remaining, pending, committed, released, synced.
+# ARGV: tickets available according to database, now, committed and released counters read before database was
+#  queried, keys ttl, "init" to only load missing counter.
+# Returns 1 if counter was set, 0 if it already exists (init), -1 if tickets were committed or released meanwhile.
+RECONCILE_LUA = """
+if ARGV[6] == 'init' and redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+if (redis.call('GET', KEYS[3]) or '0') ~= ARGV[3] or (redis.call('GET', KEYS[4]) or '0') ~= ARGV[4] then
+    return -1
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+local remaining = tonumber(ARGV[1])
+for _, member in ipairs(redis.call('ZRANGE', KEYS[2], 0, -1)) do
+    remaining = remaining - tonumber(string.match(member, ':(%d+)$'))
+end
+redis.call('SET', KEYS[1], remaining, 'EX', ARGV[5])
+redis.call('INCR', KEYS[5])
+for i = 2, 5 do redis.call('EXPIRE', KEYS[i], ARGV[5]) end
+return 1
+"""
+
+
+class Reservation:
+    __slots__ = ("plan_id", "amount", "member")
+
+    def __init__(self, plan_id: int, amount: int):
+        self.plan_id = plan_id
+        self.amount = amount
+        self.member = f"{uuid4().hex}:{amount}"
+
+
+class Release:
+    __slots__ = ("plan_id", "amount", "synced")
+
+    def __init__(self, plan_id: int, amount: int, synced: int = 0):
+        self.plan_id = plan_id
+        self.amount = amount
+        self.synced = synced
+
+
+class InventoryBackend:
+    async def reserve(self, plan: EventPlan, amount: int) -> Reservation | None:
+        raise NotImplementedError
+
+    async def commit(self, reservation: Reservation) -> None:
+        ...
+
+    async def cancel(self, reservation: Reservation) -> None:
+        ...
+
+    async def paid(self, ticket: Ticket) -> None:
+        ...
+
+    async def remove(self, ticket: Ticket) -> Release | None:
+        raise NotImplementedError
+
+    async def release(self, release: Release) -> None:
+        ...
+
+    async def reconcile(self) -> None:
+        ...
+
+
+class RedisInventoryBackend(InventoryBackend):
+    """
+    Remaining tickets of event plans kept in redis and reserved/released atomically with lua scripts.
+    Reservations are pending until ticket is created in database, reconciliation with database accounts for them
+    and skips plans whose tickets were committed or released while it ran, so counters are never raised above the
+    number of tickets really available.
+    """
+
+    def __init__(self):
+        self._scripts: dict[str, AsyncScript] = {}
+
+    @staticmethod
+    def keys(plan_id: int, *names: str) -> list[str]:
+        return [f"inventory:{plan_id}:{name}" for name in names]
+
+    async def _script(self, name: str, lua: str) -> AsyncScript:
+        if name not in self._scripts:
+            self._scripts[name] = (await RedisCache._get_client()).register_script(lua)
+        return self._scripts[name]
+
+    async def _sync(self, plans: dict[int, int], init: bool = False) -> dict[int, int]:
+        """
+        Sets remaining counters of given plans (plan id to max_tickets) from database
+        """
+
+        client = await RedisCache._get_client()
+        async with client.pipeline(transaction=False) as pipe:
+            for plan_id in plans:
+                pipe.mget(self.keys(plan_id, "committed", "released"))
+            counters = dict(zip(plans, await pipe.execute()))
+
+        sold = dict(
+            await Ticket.filter(event_plan_id__in=list(plans)).group_by("event_plan_id")
+            .annotate(sold=Sum("amount")).values_list("event_plan_id", "sold")
+        )
+
+        script = await self._script("reconcile", RECONCILE_LUA)
+        results = {}
+        for plan_id, max_tickets in plans.items():
+            committed, released = (int(value or 0) for value in counters[plan_id])
+            results[plan_id] = await script(
+                keys=self.keys(plan_id, "remaining", "pending", "committed", "released", "synced"),
+                args=[max_tickets - (sold.get(plan_id) or 0), time(), committed, released, config.INVENTORY_KEY_TTL,
+                      "init" if init else "sync"],
+            )
+
+        return results
+
+    async def reserve(self, plan: EventPlan, amount: int) -> Reservation | None:
+        reservation = Reservation(plan.id, amount)
+        script = await self._script("reserve", RESERVE_LUA)
+        for _ in range(3):
+            result = await script(
+                keys=self.keys(plan.id, "remaining", "pending"),
+                args=[amount, reservation.member, time() + config.INVENTORY_PENDING_TIMEOUT],
+            )
+            if result >= 0:
+                return reservation
+            if result == -1:
+                return
+
+            await self._sync({plan.id: plan.max_tickets}, init=True)
+
+        raise RuntimeError(f"Inventory of plan {plan.id} could not be loaded")
+
+    async def commit(self, reservation: Reservation) -> None:
+        client = await RedisCache._get_client()
+        pending, committed = self.keys(reservation.plan_id, "pending", "committed")
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.zrem(pending, reservation.member)
+            pipe.incr(committed)
+            await pipe.execute()
+
+    async def cancel(self, reservation: Reservation) -> None:
+        script = await self._script("cancel", CANCEL_LUA)
+        await script(
+            keys=self.keys(reservation.plan_id, "remaining", "pending"), args=[reservation.member, reservation.amount]
+        )
+
+    async def remove(self, ticket: Ticket) -> Release | None:
+        # Reconciliation counter is read before deletion, so release is skipped if counter was reconciled meanwhile
+        # and may already count deleted ticket as available
+        client = await RedisCache._get_client()
+        synced = int(await client.get(self.keys(ticket.event_plan_id, "synced")[0]) or 0)
+        if await Ticket.filter(id=ticket.id).delete():
+            return Release(ticket.event_plan_id, ticket.amount, synced)
+
+    async def release(self, release: Release) -> None:
+        script = await self._script("release", RELEASE_LUA)
+        result = await script(
+            keys=self.keys(release.plan_id, "remaining", "released", "synced"), args=[release.amount, release.synced],
+        )
+        if result > 0:
+            Metrics.counter("inventory.released").inc(release.amount)
+        elif result < 0:
+            Metrics.counter("inventory.release_skipped").inc(release.amount)
+
+    async def reconcile(self) -> None:
+        """
+        Recomputes all loaded counters from database, counters of other plans are loaded when first reserved from.
+        """
+
+        client = await RedisCache._get_client()
+        plan_ids = [int(key.split(b":")[1]) async for key in client.scan_iter("inventory:*:remaining", count=1000)]
+        for offset in range(0, len(plan_ids), 1000):
+            batch = plan_ids[offset:offset + 1000]
+            plans = dict(await EventPlan.filter(id__in=batch).values_list("id", "max_tickets"))
+            if deleted := [plan_id for plan_id in batch if plan_id not in plans]:
+                await client.delete(*(key for plan_id in deleted for key in self.keys(
+                    plan_id, "remaining", "pending", "committed", "released", "synced"
+                )))
+            if not plans:
+                continue
+
+            results = await self._sync(plans)
+            if skipped := sum(result < 0 for result in results.values()):
+                Metrics.counter("inventory.reconcile_skipped").inc(skipped)
+            Metrics.counter("inventory.reconciled").inc(len(results) - skipped)
+
+
+class DatabaseInventoryBackend(InventoryBackend):
+    """
+    Sold (paid) and reserved (awaiting payment) tickets counted in EventPlan row. Reservation is a conditional
+    single-row UPDATE, so it has to be made in the transaction that creates the ticket: rollback undoes it.
+    """
+
+    async def reserve(self, plan: EventPlan, amount: int) -> Reservation | None:
+        reserved = await EventPlan.filter(
+            id=plan.id, max_tickets__gte=F("sold_count") + F("reserved_count") + amount,
+        ).update(reserved_count=F("reserved_count") + amount)
+        return Reservation(plan.id, amount) if reserved else None
+
+    async def paid(self, ticket: Ticket) -> None:
+        await EventPlan.filter(id=ticket.event_plan_id).update(
+            reserved_count=F("reserved_count") - ticket.amount, sold_count=F("sold_count") + ticket.amount,
+        )
+
+    async def remove(self, ticket: Ticket) -> Release | None:
+        async with in_transaction():
+            states = await Payment.filter(ticket_id=ticket.payment_ticket_id).values_list("state", flat=True)
+            if not await Ticket.filter(id=ticket.id).delete():
+                return
+
+            field = "sold_count" if PaymentState.DONE in states else "reserved_count"
+            await EventPlan.filter(id=ticket.event_plan_id).update(**{field: F(field) - ticket.amount})
+            Metrics.counter("inventory.released").inc(ticket.amount)
+            return Release(ticket.event_plan_id, ticket.amount)
+
+    async def reconcile(self) -> None:
+        """
+        Recounts plans of upcoming events from their tickets, every plan is recounted with its row locked.
+        """
+
+        plan_ids = await EventPlan.filter(event__start_time__gte=datetime.now(UTC)).values_list("id", flat=True)
+        for plan_id in plan_ids:
+            async with in_transaction():
+                if (plan := await EventPlan.filter(id=plan_id).select_for_update().first()) is None:
+                    continue
+
+                # Tickets bought in a cart are paid with payment of cart's first ticket
+                total, sold, sold_in_cart = [
+                    await Ticket.filter(event_plan_id=plan_id, **filters).annotate(count=Sum("amount")).first()
+                    .values_list("count", flat=True) or 0
+                    for filters in ({}, {"payments__state": PaymentState.DONE},
+                                    {"cart_ticket__payments__state": PaymentState.DONE})
+                ]
+                sold += sold_in_cart
+                reserved = total - sold
+                if (plan.sold_count, plan.reserved_count) != (sold, reserved):
+                    await EventPlan.filter(id=plan_id).update(sold_count=sold, reserved_count=reserved)
+                    Metrics.counter("inventory.reconcile_fixed").inc()
+
+
+class Inventory:
+    """
+    Tickets availability of event plans, kept by INVENTORY_BACKEND: "redis" (counters in redis, for on-sale bursts)
+    or "database" (counters in EventPlan rows, for deployments that don't want inventory in redis).
+    reserve has to be called in the transaction that creates ticket, reservation then has to be committed (or
+    cancelled if transaction failed). Same for remove and release of deleted tickets.
+    """
+
+    _backends: dict[str, type[InventoryBackend]] = {
+        "redis": RedisInventoryBackend,
+        "database": DatabaseInventoryBackend,
+    }
+    _backend: InventoryBackend = _backends[config.INVENTORY_BACKEND]()
+
+    @classmethod
+    async def reserve(cls, plan: EventPlan, amount: int) -> Reservation | None:
+        """
+        Reserves amount tickets of plan, returns None if there are not enough tickets available.
+        """
+
+        if (reservation := await cls._backend.reserve(plan, amount)) is None:
+            Metrics.counter("inventory.sold_out").inc()
+        else:
+            Metrics.counter("inventory.reserved").inc(amount)
+        return reservation
+
+    @classmethod
+    async def commit(cls, reservation: Reservation) -> None:
+        await cls._backend.commit(reservation)
+
+    @classmethod
+    async def cancel(cls, reservation: Reservation) -> None:
+        await cls._backend.cancel(reservation)
+
+    @classmethod
+    async def paid(cls, ticket: Ticket) -> None:
+        """
+        Marks tickets as sold, must be called once after ticket payment state is changed to done
+        """
+
+        await cls._backend.paid(ticket)
+
+    @classmethod
+    async def remove(cls, ticket: Ticket) -> Release | None:
+        """
+        Deletes ticket, returns None if it was already deleted. Returned release has to be passed to release after
+        transaction that deleted ticket is committed.
+        """
+
+        return await cls._backend.remove(ticket)
+
+    @classmethod
+    async def release(cls, release: Release) -> None:
+        """
+        Returns tickets of deleted ticket back to inventory
+        """
+
+        await cls._backend.release(release)
+
+    @classmethod
+    async def reconcile(cls) -> None:
+        await cls._backend.reconcile()
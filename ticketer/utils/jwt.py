@@ -1,5 +1,6 @@
 import hmac
 from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
 from hashlib import sha512
 from json import loads, dumps
 from time import time
@@ -24,13 +25,38 @@ def _b64decode(data: str | bytes) -> bytes:
     return urlsafe_b64decode(data)
 
 
-class JWT:
+class JWTVerifier:
     """
-    Json Web Token Hmac-sha512 implementation
+    Hmac-sha512 signer/verifier bound to one key.
+    Keyed hmac state is computed once and copied for every token, already verified tokens are kept in a small LRU
+    until their "exp".
     """
 
-    @staticmethod
-    def decode(token: str, secret: str | bytes) -> dict | None:
+    def __init__(self, secret: str | bytes, cache_size: int = 4096):
+        if isinstance(secret, str):
+            secret = secret.encode("utf8")
+
+        self._hmac = hmac.new(secret, digestmod=sha512)
+        self._cache: OrderedDict[str, tuple[int, dict]] = OrderedDict()
+        self._cache_size = cache_size
+
+    def sign(self, data: bytes) -> bytes:
+        mac = self._hmac.copy()
+        mac.update(data)
+        return mac.digest()
+
+    def decode(self, token: str, require_exp: bool = False) -> dict | None:
+        if (cached := self._cache.get(token)) is not None:
+            exp, payload = cached
+            if require_exp and exp == 0:
+                return
+            if exp == 0 or exp > time():
+                self._cache.move_to_end(token)
+                return dict(payload)
+
+            del self._cache[token]
+            return
+
         try:
             header, payload, signature = token.split(".")
             header_dict = loads(_b64decode(header).decode("utf8"))
@@ -38,17 +64,58 @@ class JWT:
             assert header_dict.get("typ") == "JWT"
             assert (exp := header_dict.get("exp", 0)) > time() or exp == 0
             signature = _b64decode(signature)
-        except (IndexError, AssertionError, ValueError):
+        except (IndexError, AssertionError, ValueError, TypeError, AttributeError):
+            return
+        if require_exp and exp == 0:
+            return
+
+        if not hmac.compare_digest(self.sign(f"{header}.{payload}".encode("utf8")), signature):
+            return
+
+        try:
+            payload = loads(_b64decode(payload).decode("utf8"))
+        except ValueError:
             return
 
-        sig = f"{header}.{payload}".encode("utf8")
-        sig = hmac.new(secret, sig, sha512).digest()
-        if sig == signature:
-            payload = _b64decode(payload).decode("utf8")
-            return loads(payload)
+        if self._cache_size > 0:
+            self._cache[token] = (exp, payload)
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+        return dict(payload)
+
+
+class JWT:
+    """
+    Json Web Token Hmac-sha512 implementation
+    """
+
+    _verifiers: dict[bytes, JWTVerifier] = {}
+
+    @classmethod
+    def verifier(cls, secret: str | bytes) -> JWTVerifier:
+        if isinstance(secret, str):
+            secret = secret.encode("utf8")
+        if (verifier := cls._verifiers.get(secret)) is None:
+            verifier = cls._verifiers[secret] = JWTVerifier(secret)
+
+        return verifier
+
+    @classmethod
+    def decode(cls, token: str, secret: str | bytes, require_exp: bool = False) -> dict | None:
+        return cls.verifier(secret).decode(token, require_exp)
 
     @staticmethod
-    def encode(payload: dict, secret: str | bytes, expire_timestamp: int | float = 0, expires_in: int = None) -> str:
+    def expires_at(token: str) -> int:
+        """
+        Returns expiration timestamp of already verified token (0 if it never expires).
+        """
+
+        return loads(_b64decode(token.split(".")[0]).decode("utf8")).get("exp", 0)
+
+    @classmethod
+    def encode(cls, payload: dict, secret: str | bytes, expire_timestamp: int | float = 0,
+               expires_in: int = None) -> str:
         if expire_timestamp == 0 and expires_in is not None:
             expire_timestamp = int(time() + expires_in)
         header = {
@@ -59,8 +126,7 @@ class JWT:
         header = _b64encode(header)
         payload = _b64encode(payload)
 
-        signature = f"{header}.{payload}".encode("utf8")
-        signature = hmac.new(secret, signature, sha512).digest()
+        signature = cls.verifier(secret).sign(f"{header}.{payload}".encode("utf8"))
         signature = _b64encode(signature)
 
         return f"{header}.{payload}.{signature}"
@@ -5,23 +5,46 @@ from fastapi import Request, Depends
 from ticketer.config import JWT_KEY
 from ticketer.errors import Errors
 from ticketer.models import User, UserRole
-from ticketer.models.session import AuthSession
 from ticketer.utils.jwt import JWT
+from ticketer.utils.revocation import SessionRevocation
+from ticketer.utils.session_cache import SessionCache
 
 
-async def jwt_auth(request: Request) -> User:
-    token = request.headers.get("authorization")
-    if not token or (data := JWT.decode(token, JWT_KEY)) is None:
-        raise Errors.INVALID_TOKEN
+async def get_session_user(data: dict) -> User | None:
     if "user" not in data or "session" not in data or "token" not in data:
+        return
+
+    # Session claims are signed by us, so the only thing left to check is whether the session was revoked
+    if await SessionRevocation.is_revoked(data["session"], data["token"]):
+        return
+
+    user = await SessionCache.get(data["session"], data["token"])
+    if user is not None:
+        return user if user.id == data["user"] and not user.banned else None
+
+    # Generation is taken before loading user, so user invalidated while it is being loaded is not cached
+    generation = await SessionCache.generation(data["user"])
+    if (user := await User.get_or_none(id=data["user"])) is None or user.banned:
+        return
+
+    await SessionCache.put(data["session"], data["token"], user, generation)
+    return user
+
+
+async def jwt_auth_session(request: Request) -> dict:
+    token = request.headers.get("authorization")
+    # Session tokens always expire together with their session
+    if not token or (data := JWT.decode(token, JWT_KEY, require_exp=True)) is None:
         raise Errors.INVALID_TOKEN
 
-    sess = await AuthSession.get_or_none(id=data["session"], user__id=data["user"], token=data["token"]) \
-        .select_related("user")
-    if sess is None:
+    return data
+
+
+async def jwt_auth(data: dict = Depends(jwt_auth_session)) -> User:
+    if (user := await get_session_user(data)) is None:
         raise Errors.INVALID_TOKEN
 
-    return sess.user
+    return user
 
 
 def jwt_auth_role(higher_than: UserRole | None = None,
@@ -0,0 +1,85 @@
+from bisect import bisect_left
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value: int | float) -> None:
+        self.value = value
+
+
+class Histogram:
+    BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_json(self) -> dict:
+        buckets = {}
+        total = 0
+        for bound, count in zip((*self.BUCKETS, "+Inf"), self.counts):
+            total += count
+            buckets[str(bound)] = total
+
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+class Metrics:
+    """
+    Per-process in-memory metrics registry
+    """
+
+    _counters: dict[str, Counter] = {}
+    _gauges: dict[str, Gauge] = {}
+    _histograms: dict[str, Histogram] = {}
+
+    @classmethod
+    def counter(cls, name: str) -> Counter:
+        if (counter := cls._counters.get(name)) is None:
+            counter = cls._counters[name] = Counter()
+
+        return counter
+
+    @classmethod
+    def gauge(cls, name: str) -> Gauge:
+        if (gauge := cls._gauges.get(name)) is None:
+            gauge = cls._gauges[name] = Gauge()
+
+        return gauge
+
+    @classmethod
+    def histogram(cls, name: str) -> Histogram:
+        if (histogram := cls._histograms.get(name)) is None:
+            histogram = cls._histograms[name] = Histogram()
+
+        return histogram
+
+    @classmethod
+    def snapshot(cls) -> dict:
+        return {
+            "counters": {name: counter.value for name, counter in sorted(cls._counters.items())},
+            "gauges": {name: gauge.value for name, gauge in sorted(cls._gauges.items())},
+            "histograms": {name: histogram.to_json() for name, histogram in sorted(cls._histograms.items())},
+        }
@@ -1,28 +1,69 @@
 import re
 from base64 import b32decode
-from hmac import new
+from hmac import HMAC, new, compare_digest
 from struct import pack, unpack
 from time import time
 
+from ticketer import config
+from ticketer.utils.cache import RedisCache
+
 
 class MFA:
     _re = re.compile(r'^[A-Z0-9]{16}$')
 
+    STEP = 30
+
     def __init__(self, key: str):
         self.key = str(key).upper()
+        self._hmac: HMAC | None = None
+
+    def _hotp(self, counter: int) -> bytes:
+        if self._hmac is None:
+            self._hmac = new(b32decode(self.key + '=' * ((8 - len(self.key)) % 8)), digestmod="sha1")
+
+        mac = self._hmac.copy()
+        mac.update(pack('>Q', counter))
+        mac = mac.digest()
+        offset = mac[-1] & 0x0f
+        binary = unpack('>L', mac[offset:offset + 4])[0] & 0x7fffffff
+        return b"%06d" % (binary % 1000000)
 
     def getCode(self, timestamp: int | float | None = None) -> str:
         if timestamp is None:
             timestamp = time()
-        key = b32decode(self.key.upper() + '=' * ((8 - len(self.key)) % 8))
-        counter = pack('>Q', int(timestamp / 30))
-        mac = new(key, counter, "sha1").digest()
-        offset = mac[-1] & 0x0f
-        binary = unpack('>L', mac[offset:offset + 4])[0] & 0x7fffffff
-        return str(binary)[-6:].zfill(6)
+        return self._hotp(int(timestamp / self.STEP)).decode("utf8")
+
+    def verify(self, code: str | None, timestamp: int | float | None = None) -> int | None:
+        """
+        Checks code against all time steps within +-MFA_WINDOW in one pass without short-circuiting.
+        Returns matched time step or None.
+        """
+
+        if not code:
+            return
+        if timestamp is None:
+            timestamp = time()
+
+        code = code.encode("utf8")
+        step = int(timestamp / self.STEP)
+        matched = None
+        for counter in range(step - config.MFA_WINDOW, step + config.MFA_WINDOW + 1):
+            if compare_digest(self._hotp(counter), code) and matched is None:
+                matched = counter
+
+        return matched
+
+    async def verify_once(self, code: str | None, user_id: int) -> bool:
+        """
+        Same as verify, but every (user, time step) pair can be used only once
+        """
+
+        if (step := self.verify(code)) is None:
+            return False
 
-    def getCodes(self) -> set[str]:
-        return {self.getCode(time() - 5), self.getCode(time() + 1)}
+        client = await RedisCache._get_client()
+        ttl = self.STEP * (2 * config.MFA_WINDOW + 2)
+        return bool(await client.set(f"mfa-used:{user_id}:{step}", 1, nx=True, ex=ttl))
 
     @property
     def valid(self) -> bool:
@@ -0,0 +1,82 @@
+import asyncio
+from time import time, perf_counter
+
+from httpx import HTTPError
+
+from ticketer import config
+from ticketer.models import ExternalAuth
+from ticketer.utils.cache import RedisCache
+from ticketer.utils.circuit_breaker import CircuitBreaker
+from ticketer.utils.google_oauth import refresh_google_token
+from ticketer.utils.metrics import Metrics
+
+_breaker = CircuitBreaker(
+    "google_refresh", config.GOOGLE_REFRESH_BREAKER_THRESHOLD, config.GOOGLE_REFRESH_BREAKER_RESET_TIMEOUT
+)
+
+
+async def _backoff(eauth_id: int) -> None:
+    key = f"google-refresh-failures:{eauth_id}"
+    client = await RedisCache._get_client()
+    failures = await client.incr(key)
+    delay = min(config.GOOGLE_REFRESH_BACKOFF * 2 ** (failures - 1), config.GOOGLE_REFRESH_MAX_BACKOFF)
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.expire(key, config.GOOGLE_REFRESH_MAX_BACKOFF * 2)
+        pipe.set(f"google-refresh-backoff:{eauth_id}", 1, ex=delay)
+        await pipe.execute()
+
+
+async def _refresh(eauth: ExternalAuth, semaphore: asyncio.Semaphore) -> None:
+    async with semaphore:
+        if not _breaker.allow():
+            Metrics.counter("google_refresh.short_circuited").inc()
+            return
+
+        try:
+            token_data = await refresh_google_token(eauth.refresh_token)
+        except (HTTPError, ValueError):
+            _breaker.record_failure()
+            Metrics.counter("google_refresh.failed").inc()
+            await _backoff(eauth.id)
+            return
+
+    _breaker.record_success()
+    if token_data is None:
+        # Refresh token is revoked, user needs to authorize with google again
+        await ExternalAuth.filter(id=eauth.id).update(refresh_token=None)
+        Metrics.counter("google_refresh.revoked").inc()
+        return
+
+    await ExternalAuth.filter(id=eauth.id).update(
+        access_token=token_data["access_token"],
+        refresh_token=token_data.get("refresh_token") or eauth.refresh_token,
+        expires_at=int(time() + token_data["expires_in"]),
+    )
+    client = await RedisCache._get_client()
+    await client.delete(f"google-refresh-failures:{eauth.id}")
+    Metrics.counter("google_refresh.refreshed").inc()
+
+
+async def refresh_expiring_google_tokens() -> int:
+    """
+    Refreshes google tokens expiring in less than GOOGLE_REFRESH_AHEAD seconds (at most GOOGLE_REFRESH_BATCH_SIZE
+    per run, GOOGLE_REFRESH_CONCURRENCY requests at a time). Tokens that failed to refresh are retried with
+    exponential backoff. Returns number of tokens that were tried.
+    """
+
+    start = perf_counter()
+    eauths = await ExternalAuth.filter(
+        service="google", refresh_token__not_isnull=True, expires_at__lt=int(time()) + config.GOOGLE_REFRESH_AHEAD,
+    ).order_by("expires_at").limit(config.GOOGLE_REFRESH_BATCH_SIZE)
+    if not eauths:
+        return 0
+
+    client = await RedisCache._get_client()
+    backoff = await client.mget([f"google-refresh-backoff:{eauth.id}" for eauth in eauths])
+    eauths = [eauth for eauth, skip in zip(eauths, backoff) if skip is None]
+
+    semaphore = asyncio.Semaphore(config.GOOGLE_REFRESH_CONCURRENCY)
+    await asyncio.gather(*[_refresh(eauth, semaphore) for eauth in eauths])
+
+    Metrics.histogram("google_refresh.duration_ms").observe((perf_counter() - start) * 1000)
+    return len(eauths)
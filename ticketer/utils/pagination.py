@@ -0,0 +1,17 @@
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from binascii import Error as BinasciiError
+
+
+def encode_cursor(data: dict) -> str:
+    encoded = json.dumps(data, separators=(",", ":")).encode("utf8")
+    return urlsafe_b64encode(encoded).decode("utf8").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict | None:
+    try:
+        data = json.loads(urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (BinasciiError, ValueError):
+        return
+
+    return data if isinstance(data, dict) else None
@@ -0,0 +1,63 @@
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from time import perf_counter
+from typing import Callable, TypeVar
+
+from bcrypt import hashpw, gensalt, checkpw
+
+from ticketer import config
+from ticketer.errors import Errors
+from ticketer.utils.metrics import Metrics
+
+T = TypeVar("T")
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt off the event loop in a bounded thread or process pool.
+    Requests above PASSWORD_HASH_MAX_PENDING are rejected right away instead of being queued.
+    """
+
+    _executor: Executor | None = None
+    _pending: int = 0
+
+    @classmethod
+    def _get_executor(cls) -> Executor:
+        if cls._executor is None:
+            if config.PASSWORD_HASH_EXECUTOR == "process":
+                cls._executor = ProcessPoolExecutor(config.PASSWORD_HASH_WORKERS)
+            else:
+                cls._executor = ThreadPoolExecutor(config.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+
+        return cls._executor
+
+    @classmethod
+    async def _run(cls, func: Callable[..., T], *args) -> T:
+        if cls._pending >= config.PASSWORD_HASH_MAX_PENDING:
+            Metrics.counter("password_hasher.rejected").inc()
+            raise Errors.SERVICE_BUSY
+
+        cls._pending += 1
+        Metrics.gauge("password_hasher.queue_depth").set(cls._pending)
+        start = perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(cls._get_executor(), func, *args)
+        finally:
+            cls._pending -= 1
+            Metrics.gauge("password_hasher.queue_depth").set(cls._pending)
+            Metrics.histogram("password_hasher.latency_ms").observe((perf_counter() - start) * 1000)
+
+    @classmethod
+    async def hash(cls, password: str) -> str:
+        salt = gensalt(config.PASSWORD_HASH_ROUNDS)
+        return (await cls._run(hashpw, password.encode("utf8"), salt)).decode()
+
+    @classmethod
+    async def check(cls, password: str, password_hash: str) -> bool:
+        return await cls._run(checkpw, password.encode("utf8"), password_hash.encode("utf8"))
+
+    @classmethod
+    def shutdown(cls) -> None:
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
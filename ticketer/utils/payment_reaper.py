@@ -0,0 +1,62 @@
+from datetime import datetime, UTC
+from time import perf_counter
+
+from tortoise.transactions import in_transaction
+
+from ticketer import config
+from ticketer.models import Payment, PaymentState, Ticket
+from ticketer.utils.cache import RedisCache
+from ticketer.utils.event_cache import tickets_tag
+from ticketer.utils.inventory import Inventory
+from ticketer.utils.metrics import Metrics
+
+UNPAID_STATES = [PaymentState.AWAITING_VERIFICATION, PaymentState.AWAITING_PAYMENT]
+
+
+async def reap_expired_payments() -> int:
+    """
+    Deletes tickets whose payments expired unpaid and returns them to inventory, in batches of
+    PAYMENT_REAPER_BATCH_SIZE (at most PAYMENT_REAPER_MAX_BATCHES batches per run).
+    Returns number of deleted tickets.
+    """
+
+    start = perf_counter()
+    now = datetime.now(UTC)
+    removed = 0
+    user_ids = set()
+    for _ in range(config.PAYMENT_REAPER_MAX_BATCHES):
+        payments = await Payment.filter(state__in=UNPAID_STATES, expires_at__lt=now)\
+            .limit(config.PAYMENT_REAPER_BATCH_SIZE).values_list("id", "ticket_id")
+        if not payments:
+            break
+
+        for payment_id, ticket_id in payments:
+            releases = []
+            async with in_transaction():
+                tickets = await Ticket.paid_with(ticket_id)
+                # Payment is deleted only if it is still unpaid and expired, so ticket paid (or payment extended)
+                # after it was selected is kept
+                if not await Payment.filter(id=payment_id, state__in=UNPAID_STATES, expires_at__lt=now).delete():
+                    continue
+
+                for ticket in tickets:
+                    if (release := await Inventory.remove(ticket)) is not None:
+                        releases.append(release)
+
+            # Redis counters can't be rolled back, so tickets are returned to inventory only after deletion is committed
+            for release in releases:
+                await Inventory.release(release)
+
+            user_ids.update(ticket.user_id for ticket in tickets)
+            removed += len(tickets)
+
+        if len(payments) < config.PAYMENT_REAPER_BATCH_SIZE:
+            break
+
+    if user_ids:
+        await RedisCache.invalidate_tags(*(tickets_tag(user_id) for user_id in user_ids))
+
+    Metrics.counter("payment_reaper.removed").inc(removed)
+    Metrics.gauge("payment_reaper.last_run_removed").set(removed)
+    Metrics.histogram("payment_reaper.duration_ms").observe((perf_counter() - start) * 1000)
+    return removed
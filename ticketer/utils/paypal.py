@@ -1,8 +1,7 @@
 from time import time
 
-from httpx import AsyncClient
-
 from ticketer import config
+from ticketer.utils.http import HttpClients
 
 
 class PayPal:
@@ -16,43 +15,40 @@ class PayPal:
     @classmethod
     async def _get_access_token(cls) -> str:
         if cls._access_token is None or cls._access_token_expires_at < time():
-            async with AsyncClient() as client:
-                resp = await client.post(
-                    cls.AUTHORIZE,
-                    content="grant_type=client_credentials",
-                    auth=(config.PAYPAL_ID, config.PAYPAL_SECRET),
-                )
-                j = resp.json()
+            resp = await HttpClients.get("paypal").post(
+                cls.AUTHORIZE,
+                content="grant_type=client_credentials",
+                auth=(config.PAYPAL_ID, config.PAYPAL_SECRET),
+            )
+            j = resp.json()
 
-                cls._access_token = j["access_token"]
-                cls._access_token_expires_at = time() + j["expires_in"]
+            cls._access_token = j["access_token"]
+            cls._access_token_expires_at = time() + j["expires_in"]
 
         return cls._access_token
 
     @classmethod
     async def create(cls, price: float, currency: str = "USD") -> str:
-        async with AsyncClient() as client:
-            resp = await client.post(
-                cls.CHECKOUT, headers={"Authorization": f"Bearer {await cls._get_access_token()}"},
-                json={
-                    "intent": "CAPTURE",
-                    "purchase_units": [{
-                        "amount": {
-                            "currency_code": currency,
-                            "value": f"{price:.2f}",
-                        },
-                    }],
-                },
-            )
-            return resp.json()["id"]
+        resp = await HttpClients.get("paypal").post(
+            cls.CHECKOUT, headers={"Authorization": f"Bearer {await cls._get_access_token()}"},
+            json={
+                "intent": "CAPTURE",
+                "purchase_units": [{
+                    "amount": {
+                        "currency_code": currency,
+                        "value": f"{price:.2f}",
+                    },
+                }],
+            },
+        )
+        return resp.json()["id"]
 
     @classmethod
     async def check(cls, order_id: str) -> bool:
-        async with AsyncClient() as client:
-            resp = await client.post(
-                f"{cls.CHECKOUT}/{order_id}/capture",
-                headers={"Authorization": f"Bearer {await cls._get_access_token()}"},
-                json={},
-            )
+        resp = await HttpClients.get("paypal").post(
+            f"{cls.CHECKOUT}/{order_id}/capture",
+            headers={"Authorization": f"Bearer {await cls._get_access_token()}"},
+            json={},
+        )
 
-            return resp.status_code == 200 and resp.json()["status"] == "COMPLETED"
+        return resp.status_code == 200 and resp.json()["status"] == "COMPLETED"
@@ -1,13 +1,58 @@
-from httpx import AsyncClient
+import asyncio
+from time import perf_counter
 
 from ticketer import config
+from ticketer.utils.cache import RedisCache
+from ticketer.utils.circuit_breaker import CircuitBreaker
+from ticketer.utils.http import HttpClients
+from ticketer.utils.metrics import Metrics
 
 
 class ReCaptcha:
     URL = "https://www.google.com/recaptcha/api/siteverify"
 
+    _breaker = CircuitBreaker("recaptcha", config.RECAPTCHA_BREAKER_THRESHOLD, config.RECAPTCHA_BREAKER_RESET_TIMEOUT)
+
+    @classmethod
+    async def _verify_remote(cls, key: str) -> bool:
+        start = perf_counter()
+        try:
+            async with asyncio.timeout(config.RECAPTCHA_TIMEOUT):
+                resp = await HttpClients.get("recaptcha").post(
+                    cls.URL, data={"secret": config.RECAPTCHA_SECRET, "response": key}
+                )
+            resp.raise_for_status()
+            return bool(resp.json()["success"])
+        finally:
+            Metrics.histogram("recaptcha.latency_ms").observe((perf_counter() - start) * 1000)
+
     @classmethod
     async def verify(cls, key: str) -> bool:
-        async with AsyncClient() as client:
-            resp = await client.post(cls.URL, data={"secret": config.RECAPTCHA_SECRET, "response": key})
-            return resp.json()["success"]
+        """
+        Verifies captcha key with google. Only failed keys are cached: keys can be used only once, so every
+        successful verification has to be made by google, which rejects reused keys.
+        """
+
+        # Secret is a part of the key since result for the same captcha key depends on it
+        cached = await RedisCache.get("recaptcha", config.RECAPTCHA_SECRET, key)
+        if cached is not None:
+            Metrics.counter("recaptcha.cache_hits").inc()
+            return cached["success"]
+
+        if not cls._breaker.allow():
+            Metrics.counter("recaptcha.short_circuited").inc()
+            return config.RECAPTCHA_FAIL_OPEN
+
+        try:
+            success = await cls._verify_remote(key)
+        except Exception:
+            cls._breaker.record_failure()
+            Metrics.counter("recaptcha.failures").inc()
+            return config.RECAPTCHA_FAIL_OPEN
+
+        cls._breaker.record_success()
+        if not success:
+            await RedisCache.put(
+                "recaptcha", {"success": False}, config.RECAPTCHA_SECRET, key, expires_in=config.RECAPTCHA_CACHE_TTL
+            )
+        return success
@@ -0,0 +1,37 @@
+from hashlib import blake2b
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+
+def encode_response(adapter: TypeAdapter, obj: dict | list, headers: dict[str, str] | None = None) -> dict:
+    """
+    Validates obj against response model and encodes it once, so cached responses can be sent as is.
+    Strong ETag is the digest of encoded body.
+    """
+
+    body = adapter.dump_json(adapter.validate_python(obj))
+    etag = f"\"{blake2b(body, digest_size=16).hexdigest()}\""
+    return {"body": body.decode("utf8"), "headers": (headers or {}) | {"ETag": etag}}
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def cached_response(cached: dict, request: Request | None = None, cache_control: str | None = None) -> Response:
+    """
+    Returns encoded response, or empty 304 response if request has If-None-Match header matching its ETag
+    """
+
+    headers = cached["headers"]
+    if cache_control is not None:
+        headers = headers | {"Cache-Control": cache_control}
+    if request is not None and etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=cached["body"], media_type="application/json", headers=headers)
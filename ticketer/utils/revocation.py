@@ -0,0 +1,179 @@
+import asyncio
+import logging
+from datetime import datetime, UTC
+from hashlib import blake2b
+from time import time
+
+from ticketer import config
+from ticketer.models import AuthSession
+from ticketer.utils.cache import RedisCache
+from ticketer.utils.metrics import Metrics
+from ticketer.utils.session_cache import SessionCache
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, size_bits: int, hashes: int):
+        self._size = size_bits
+        self._hashes = hashes
+        self._bits = bytearray((size_bits + 7) // 8)
+
+    def _positions(self, item: str) -> list[int]:
+        digest = blake2b(item.encode("utf8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self._size for i in range(self._hashes)]
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class SessionRevocation:
+    """
+    Set of revoked sessions stored in redis (sorted set scored by session expiration time), seeded from revoked
+    AuthSession rows whenever it is missing (e.g. redis was flushed or the key was evicted).
+    Every worker mirrors it into an in-process bloom filter kept up to date over redis pub/sub, so checking a session
+    that was never revoked doesn't need any network round trip. Until the mirror is synced, and for sessions the
+    filter matches but redis set doesn't contain, the database is queried.
+    """
+
+    KEY = "revoked-sessions"
+    CHANNEL = "revoked-sessions"
+    # Member with infinite score marking set as seeded from database, evicted or flushed together with the set
+    SEEDED = "seeded"
+
+    _filter = BloomFilter(config.REVOCATION_FILTER_BITS, config.REVOCATION_FILTER_HASHES)
+    _rebuilding: BloomFilter | None = None
+    _synced = False
+
+    @staticmethod
+    def _member(session_id: int, token: str) -> str:
+        return f"{session_id}:{token}"
+
+    @classmethod
+    def _add_local(cls, member: str) -> None:
+        cls._filter.add(member)
+        if cls._rebuilding is not None:
+            cls._rebuilding.add(member)
+
+    @classmethod
+    async def _is_revoked_remote(cls, member: str) -> bool:
+        client = await RedisCache._get_client()
+        score = await client.zscore(cls.KEY, member)
+        return score is not None and score > time()
+
+    @staticmethod
+    async def _is_revoked_db(session_id: int, token: str) -> bool:
+        # Session without row was revoked (or expired) after its row was deleted
+        return not await AuthSession.filter(id=session_id, token=token, revoked=False).exists()
+
+    @classmethod
+    async def is_revoked(cls, session_id: int, token: str) -> bool:
+        member = cls._member(session_id, token)
+        if not cls._synced:
+            return await cls._is_revoked_db(session_id, token)
+
+        if member not in cls._filter:
+            Metrics.counter("revocation.filter_negatives").inc()
+            return False
+
+        if await cls._is_revoked_remote(member):
+            return True
+
+        Metrics.counter("revocation.filter_false_positives").inc()
+        # Filter may still contain sessions of redis set that was lost since last sync
+        return await cls._is_revoked_db(session_id, token)
+
+    @classmethod
+    async def _revoke(cls, sessions: list[tuple[int, str, datetime]]) -> None:
+        if not sessions:
+            return
+
+        members = {cls._member(session_id, token): expires.timestamp() for session_id, token, expires in sessions}
+        client = await RedisCache._get_client()
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.zadd(cls.KEY, members)
+            for member in members:
+                pipe.publish(cls.CHANNEL, member)
+            await pipe.execute()
+
+        for member in members:
+            cls._add_local(member)
+        Metrics.counter("revocation.revoked").inc(len(members))
+
+    @classmethod
+    async def revoke_session(cls, session_id: int, token: str, expires: datetime) -> None:
+        # Database is updated first, so set seeded concurrently either contains session or it is added afterwards
+        await AuthSession.filter(id=session_id, token=token).update(revoked=True)
+        await cls._revoke([(session_id, token, expires)])
+        await SessionCache.invalidate_session(session_id, token)
+
+    @classmethod
+    async def revoke_user(cls, user_id: int) -> None:
+        sessions = await AuthSession.filter(user_id=user_id, revoked=False).values_list("id", "token", "expires")
+        # Sessions created meanwhile were not revoked, so they are not marked either
+        await AuthSession.filter(id__in=[session_id for session_id, _, _ in sessions]).update(revoked=True)
+        await cls._revoke(sessions)
+        await SessionCache.invalidate_user(user_id)
+
+    @classmethod
+    async def _seed(cls) -> None:
+        sessions = await AuthSession.filter(revoked=True, expires__gt=datetime.now(UTC))\
+            .values_list("id", "token", "expires")
+        members = {cls._member(session_id, token): expires.timestamp() for session_id, token, expires in sessions}
+        client = await RedisCache._get_client()
+        async with client.pipeline(transaction=True) as pipe:
+            if members:
+                pipe.zadd(cls.KEY, members)
+            pipe.zadd(cls.KEY, {cls.SEEDED: float("inf")})
+            await pipe.execute()
+
+        Metrics.counter("revocation.seeded").inc()
+
+    @classmethod
+    async def _sync(cls) -> None:
+        cls._rebuilding = BloomFilter(config.REVOCATION_FILTER_BITS, config.REVOCATION_FILTER_HASHES)
+        try:
+            client = await RedisCache._get_client()
+            if await client.zscore(cls.KEY, cls.SEEDED) is None:
+                await cls._seed()
+
+            now = time()
+            await client.zremrangebyscore(cls.KEY, "-inf", now)
+            for member in await client.zrangebyscore(cls.KEY, now, "+inf"):
+                cls._rebuilding.add(member.decode("utf8"))
+
+            cls._filter = cls._rebuilding
+        finally:
+            cls._rebuilding = None
+
+    @classmethod
+    async def resync(cls) -> None:
+        if cls._synced:
+            await cls._sync()
+
+    @classmethod
+    async def listen(cls) -> None:
+        while True:
+            try:
+                client = await RedisCache._get_client()
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(cls.CHANNEL)
+                    await cls._sync()
+                    cls._synced = True
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            cls._add_local(message["data"].decode("utf8"))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Session revocation listener failed, reconnecting")
+            finally:
+                cls._synced = False
+
+            await asyncio.sleep(1)
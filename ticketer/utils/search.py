@@ -0,0 +1,135 @@
+import re
+
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from ticketer.models import Event
+
+_TOKEN_RE = re.compile(r"\w+")
+# Event fields indexed by every full-text backend
+INDEXED_FIELDS = ("name", "description", "category", "city")
+
+
+class SearchBackend:
+    """
+    Full-text index over event name, description, category and city. Index is maintained by the database itself
+    (triggers or FULLTEXT index), so every insert/update/delete of an event is reflected immediately.
+    """
+
+    async def setup(self, connection: BaseDBAsyncClient) -> None:
+        ...
+
+    async def search(self, connection: BaseDBAsyncClient, tokens: list[str], limit: int) -> list[int]:
+        """
+        Returns ids of events matching all tokens (as prefixes), most relevant first.
+        """
+
+        raise NotImplementedError
+
+
+class SqliteSearchBackend(SearchBackend):
+    TABLE = "event_fts"
+    SETUP_SQL = f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(
+            name, description, category, city, content='event', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        );
+        CREATE TRIGGER IF NOT EXISTS {TABLE}_ai AFTER INSERT ON event BEGIN
+            INSERT INTO {TABLE}(rowid, name, description, category, city)
+            VALUES (new.id, new.name, new.description, new.category, new.city);
+        END;
+        CREATE TRIGGER IF NOT EXISTS {TABLE}_ad AFTER DELETE ON event BEGIN
+            INSERT INTO {TABLE}({TABLE}, rowid, name, description, category, city)
+            VALUES ('delete', old.id, old.name, old.description, old.category, old.city);
+        END;
+        CREATE TRIGGER IF NOT EXISTS {TABLE}_au AFTER UPDATE OF name, description, category, city ON event BEGIN
+            INSERT INTO {TABLE}({TABLE}, rowid, name, description, category, city)
+            VALUES ('delete', old.id, old.name, old.description, old.category, old.city);
+            INSERT INTO {TABLE}(rowid, name, description, category, city)
+            VALUES (new.id, new.name, new.description, new.category, new.city);
+        END;
+    """
+    REBUILD_SQL = f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')"
+    SEARCH_SQL = f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH ? ORDER BY rank LIMIT ?"
+
+    @staticmethod
+    def match_expression(tokens: list[str]) -> str:
+        return " ".join(f"\"{token}\"*" for token in tokens)
+
+    async def setup(self, connection: BaseDBAsyncClient) -> None:
+        _, rows = await connection.execute_query(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name=?", [self.TABLE]
+        )
+        created = rows[0][0] == 0
+        await connection.execute_script(self.SETUP_SQL)
+        if created:
+            # Index events that existed before the index was created
+            await connection.execute_query(self.REBUILD_SQL)
+
+    async def search(self, connection: BaseDBAsyncClient, tokens: list[str], limit: int) -> list[int]:
+        _, rows = await connection.execute_query(self.SEARCH_SQL, [self.match_expression(tokens), limit])
+        return [row[0] for row in rows]
+
+
+class MysqlSearchBackend(SearchBackend):
+    INDEX = "event_fts"
+    MATCH = "MATCH(name, description, category, city) AGAINST (%s IN BOOLEAN MODE)"
+    SEARCH_SQL = f"SELECT id FROM event WHERE {MATCH} ORDER BY {MATCH} DESC LIMIT %s"
+
+    @staticmethod
+    def match_expression(tokens: list[str]) -> str:
+        return " ".join(f"+{token}*" for token in tokens)
+
+    async def setup(self, connection: BaseDBAsyncClient) -> None:
+        _, rows = await connection.execute_query(
+            "SELECT COUNT(*) AS count FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = 'event' AND index_name = %s", [self.INDEX]
+        )
+        if rows[0]["count"] == 0:
+            await connection.execute_script(
+                f"ALTER TABLE event ADD FULLTEXT INDEX {self.INDEX} (name, description, category, city)"
+            )
+
+    async def search(self, connection: BaseDBAsyncClient, tokens: list[str], limit: int) -> list[int]:
+        expression = self.match_expression(tokens)
+        _, rows = await connection.execute_query(self.SEARCH_SQL, [expression, expression, limit])
+        return [row["id"] for row in rows]
+
+
+class FallbackSearchBackend(SearchBackend):
+    async def search(self, connection: BaseDBAsyncClient, tokens: list[str], limit: int) -> list[int]:
+        query = Event.all()
+        for token in tokens:
+            query = query.filter(name__icontains=token)
+        return await query.limit(limit).values_list("id", flat=True)
+
+
+class EventSearch:
+    _backends: dict[str, type[SearchBackend]] = {
+        "sqlite": SqliteSearchBackend,
+        "mysql": MysqlSearchBackend,
+    }
+    _backend: SearchBackend | None = None
+
+    @staticmethod
+    def _connection() -> BaseDBAsyncClient:
+        return Tortoise.get_connection("default")
+
+    @classmethod
+    async def setup(cls) -> None:
+        connection = cls._connection()
+        cls._backend = cls._backends.get(connection.capabilities.dialect, FallbackSearchBackend)()
+        await cls._backend.setup(connection)
+
+    @staticmethod
+    def tokenize(text: str | None) -> list[str]:
+        return _TOKEN_RE.findall(text.lower()) if text else []
+
+    @classmethod
+    async def search(cls, text: str, limit: int) -> list[int]:
+        if cls._backend is None:
+            await cls.setup()
+        if not (tokens := cls.tokenize(text)):
+            return []
+
+        return await cls._backend.search(cls._connection(), tokens, limit)
@@ -0,0 +1,133 @@
+import json
+from collections import OrderedDict
+from datetime import datetime
+from time import time
+
+from redis.commands.core import AsyncScript
+
+from ticketer import config
+from ticketer.models import User
+from ticketer.utils.cache import RedisCache
+from ticketer.utils.metrics import Metrics
+
+# KEYS: session key, user sessions key, user generation key. ARGV: user data, ttl, generation, user sessions ttl.
+# Entry is written only if user was not invalidated since generation was read (before user was loaded from database).
+PUT_LUA = """
+if (redis.call('GET', KEYS[3]) or '0') ~= ARGV[3] then return 0 end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('SADD', KEYS[2], KEYS[1])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return 1
+"""
+
+
+class SessionCache:
+    """
+    Two-tier (in-process LRU + redis) cache of session -> user lookups used by jwt_auth.
+    In-process entries live only for SESSION_CACHE_LOCAL_TTL seconds since other workers can't invalidate them.
+    """
+
+    _local: OrderedDict[str, tuple[float, int, dict]] = OrderedDict()
+    _local_invalidations = 0
+    _put_script: AsyncScript | None = None
+
+    @staticmethod
+    def _key(session_id: int, token: str) -> str:
+        return f"auth-session:{session_id}:{token}"
+
+    @staticmethod
+    def _user_key(user_id: int) -> str:
+        return f"auth-sessions:user:{user_id}"
+
+    @staticmethod
+    def _generation_tag(user_id: int) -> str:
+        return f"auth-sessions:{user_id}"
+
+    @staticmethod
+    def _load_user(user_data: dict) -> User:
+        return User.from_saved(**user_data)
+
+    @classmethod
+    def _put_local(cls, key: str, user_id: int, user_data: dict) -> None:
+        cls._local[key] = (time() + config.SESSION_CACHE_LOCAL_TTL, user_id, user_data)
+        cls._local.move_to_end(key)
+        while len(cls._local) > config.SESSION_CACHE_LOCAL_SIZE:
+            cls._local.popitem(last=False)
+
+    @classmethod
+    async def get(cls, session_id: int, token: str) -> User | None:
+        key = cls._key(session_id, token)
+
+        if (entry := cls._local.get(key)) is not None:
+            expires_at, _, user_data = entry
+            if expires_at > time():
+                cls._local.move_to_end(key)
+                Metrics.counter("session_cache.local_hits").inc()
+                return cls._load_user(user_data)
+            cls._local.pop(key, None)
+
+        client = await RedisCache._get_client()
+        if (value := await client.get(key)) is not None:
+            user_data = json.loads(value)
+            cls._put_local(key, user_data["id"], user_data)
+            Metrics.counter("session_cache.redis_hits").inc()
+            return cls._load_user(user_data)
+
+        Metrics.counter("session_cache.misses").inc()
+
+    @classmethod
+    async def generation(cls, user_id: int) -> int:
+        """
+        Returns current generation of user sessions, must be taken before user is loaded and passed to put.
+        """
+
+        return (await RedisCache.tag_generations([cls._generation_tag(user_id)]))[cls._generation_tag(user_id)]
+
+    @classmethod
+    async def put(cls, session_id: int, token: str, user: User, generation: int,
+                  expires_at: datetime | None = None) -> None:
+        ttl = config.SESSION_CACHE_TTL
+        if expires_at is not None:
+            ttl = min(ttl, int(expires_at.timestamp() - time()))
+        if ttl <= 0:
+            return
+
+        key = cls._key(session_id, token)
+        user_data = {field: getattr(user, field) for field in User._meta.db_fields}
+        local_invalidations = cls._local_invalidations
+
+        client = await RedisCache._get_client()
+        if cls._put_script is None:
+            cls._put_script = client.register_script(PUT_LUA)
+
+        keys = [key, cls._user_key(user.id), RedisCache._tag_key(cls._generation_tag(user.id))]
+        args = [json.dumps(user_data), ttl, generation, config.SESSION_CACHE_TTL]
+        if not await cls._put_script(keys=keys, args=args):
+            Metrics.counter("session_cache.stale_puts").inc()
+            return
+
+        # invalidate_user may have run in this process while entry was written to redis
+        if local_invalidations == cls._local_invalidations:
+            cls._put_local(key, user.id, user_data)
+
+    @classmethod
+    async def invalidate_session(cls, session_id: int, token: str) -> None:
+        key = cls._key(session_id, token)
+        cls._local.pop(key, None)
+
+        client = await RedisCache._get_client()
+        await client.delete(key)
+
+    @classmethod
+    async def invalidate_user(cls, user_id: int) -> None:
+        await RedisCache.invalidate_tags(cls._generation_tag(user_id))
+
+        cls._local_invalidations += 1
+        for key in [key for key, (_, entry_user_id, _) in cls._local.items() if entry_user_id == user_id]:
+            del cls._local[key]
+
+        client = await RedisCache._get_client()
+        user_key = cls._user_key(user_id)
+        keys = await client.smembers(user_key)
+        await client.delete(user_key, *keys)
+        Metrics.counter("session_cache.invalidations").inc()
@@ -0,0 +1,31 @@
+from datetime import datetime, UTC
+from time import perf_counter
+
+from ticketer import config
+from ticketer.models import AuthSession
+from ticketer.utils.metrics import Metrics
+
+
+async def collect_expired_sessions() -> int:
+    """
+    Deletes expired sessions in batches of SESSION_GC_BATCH_SIZE (at most SESSION_GC_MAX_BATCHES batches per run).
+    Returns number of deleted sessions.
+    """
+
+    start = perf_counter()
+    now = datetime.now(UTC)
+    removed = 0
+    for _ in range(config.SESSION_GC_MAX_BATCHES):
+        session_ids = await AuthSession.filter(expires__lt=now).limit(config.SESSION_GC_BATCH_SIZE)\
+            .values_list("id", flat=True)
+        if not session_ids:
+            break
+
+        removed += await AuthSession.filter(id__in=session_ids).delete()
+        if len(session_ids) < config.SESSION_GC_BATCH_SIZE:
+            break
+
+    Metrics.counter("session_gc.removed").inc(removed)
+    Metrics.gauge("session_gc.last_run_removed").set(removed)
+    Metrics.histogram("session_gc.duration_ms").observe((perf_counter() - start) * 1000)
+    return removed
@@ -0,0 +1,104 @@
+from time import time
+
+from redis.commands.core import AsyncScript
+
+from ticketer import config
+from ticketer.utils.cache import RedisCache
+from ticketer.utils.jwt import JWT
+from ticketer.utils.metrics import Metrics
+
+# KEYS: queue, admitted, last admission time. ARGV: now, rate (per minute), admission ttl, member, "join", keys ttl.
+# Admits clients from the head of the queue at given rate. While queue is empty at most one admission is accumulated,
+# so next client joining is admitted immediately. Returns number of clients admitted by this call and position of
+# member: 1-based position in queue, 0 if member is admitted, -1 if member is neither waiting nor admitted.
+ADVANCE_LUA = """
+local now = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+if ARGV[5] == 'join' and not redis.call('ZSCORE', KEYS[2], ARGV[4]) then
+    redis.call('ZADD', KEYS[1], 'NX', now, ARGV[4])
+end
+
+local rate = tonumber(ARGV[2]) / 60
+local last = tonumber(redis.call('GET', KEYS[3]) or '0')
+local count = math.floor((now - last) * rate + 1e-9)
+local admitted = 0
+if count > 0 then
+    local popped = redis.call('ZPOPMIN', KEYS[1], count)
+    admitted = #popped / 2
+    for i = 1, #popped, 2 do
+        redis.call('ZADD', KEYS[2], now + tonumber(ARGV[3]), popped[i])
+    end
+    if admitted < count then last = now - 1 / rate else last = last + count / rate end
+    redis.call('SET', KEYS[3], tostring(last))
+end
+for i = 1, 3 do redis.call('EXPIRE', KEYS[i], ARGV[6]) end
+
+local position = redis.call('ZRANK', KEYS[1], ARGV[4])
+if position then return {admitted, position + 1} end
+if redis.call('ZSCORE', KEYS[2], ARGV[4]) then return {admitted, 0} end
+return {admitted, -1}
+"""
+
+
+class WaitingRoom:
+    """
+    Per-event queue of clients admitted to buying tickets at event's queue_rate (clients per minute).
+    Queue and admitted clients are kept in redis sorted sets, admission is advanced atomically by whichever client
+    checks its position, so no background task is needed.
+    """
+
+    _script: AsyncScript | None = None
+
+    @staticmethod
+    def _keys(event_id: int) -> list[str]:
+        return [f"waiting-room:{event_id}:{name}" for name in ("queue", "admitted", "last")]
+
+    @classmethod
+    async def _advance(cls, event_id: int, queue_rate: int, user_id: int, join: bool) -> int:
+        if cls._script is None:
+            cls._script = (await RedisCache._get_client()).register_script(ADVANCE_LUA)
+
+        admitted, position = await cls._script(keys=cls._keys(event_id), args=[
+            time(), queue_rate, config.WAITING_ROOM_ADMISSION_TTL, user_id, "join" if join else "status",
+            config.WAITING_ROOM_TOKEN_TTL,
+        ])
+        if admitted:
+            Metrics.counter("waiting_room.admitted").inc(admitted)
+        return position
+
+    @classmethod
+    def token(cls, event_id: int, user_id: int) -> str:
+        return JWT.encode(
+            {"type": "queue", "event_id": event_id, "user_id": user_id}, config.JWT_KEY,
+            expires_in=config.WAITING_ROOM_TOKEN_TTL,
+        )
+
+    @classmethod
+    async def join(cls, event_id: int, queue_rate: int, user_id: int) -> int:
+        """
+        Puts user to the end of event queue (unless user is already waiting or admitted), returns position in queue
+        or 0 if user is admitted.
+        """
+
+        Metrics.counter("waiting_room.joined").inc()
+        return await cls._advance(event_id, queue_rate, user_id, True)
+
+    @classmethod
+    async def position(cls, event_id: int, queue_rate: int, user_id: int) -> int | None:
+        """
+        Returns position of user in event queue, 0 if user is admitted or None if user has to join queue again.
+        """
+
+        position = await cls._advance(event_id, queue_rate, user_id, False)
+        return position if position >= 0 else None
+
+    @classmethod
+    async def admitted(cls, event_id: int, user_id: int, token: str | None) -> bool:
+        if token is None or (payload := JWT.decode(token, config.JWT_KEY, require_exp=True)) is None:
+            return False
+        if payload.get("type") != "queue" or payload.get("event_id") != event_id or payload.get("user_id") != user_id:
+            return False
+
+        client = await RedisCache._get_client()
+        expires_at = await client.zscore(cls._keys(event_id)[1], user_id)
+        return expires_at is not None and expires_at > time()